@@ -0,0 +1,268 @@
+"""
+Benchmark of the vector compression profiles of `utils.weaviate.create_collection`.
+
+For each profile ("none", "pq" and "bq", see `utils.weaviate.new_quantizer`), creates a
+scratch collection, ingests the same sample of pooled object vectors, waits for the index to
+finish indexing (and compressing) them, and reports:
+
+- the memory per object: the Weaviate heap growth per object ingested when
+  `--weaviate-metrics-url` points at its Prometheus endpoint (started with
+  `PROMETHEUS_MONITORING_ENABLED=true`), and always the in-memory size of each compressed
+  vector,
+- the recall@k of each profile against uncompressed ("none") HNSW search, and against exact
+  search,
+- the query throughput and latency.
+
+PQ is trained on at most the whole sample, so that the sample is compressed. Vectors are
+synthetic by default, or real view embeddings with `--vectors` (see `benchmark_distance.py`).
+The benchmark needs a Weaviate server, configured in `configs/data_loading.yml`.
+
+Usage:
+    ```bash
+    python benchmark_compression.py --num-objects 100000 \\
+        --weaviate-metrics-url http://localhost:2112/metrics
+    ```
+"""
+
+import argparse
+import json
+import time
+import urllib.request
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from weaviate.collections import Collection
+
+from benchmark_distance import (
+    NUM_OBJECTS,
+    NUM_QUERIES,
+    QUERY_LIMIT,
+    VIEWS_PER_OBJECT,
+    build_index,
+    exact_neighbours,
+    load_object_vectors,
+    recall,
+    run_queries,
+    synthetic_queries,
+)
+from benchmark_ingest import RESULTS_DIR, git_revision
+from data_loading import CONFIG_PATH, connect_to_weaviate
+from utils.config import load_config
+from utils.weaviate import (
+    BQ_RESCORE_LIMIT,
+    COMPRESSION_PROFILES,
+    DISTANCE_METRIC,
+    DISTANCE_METRICS,
+    PQ_CENTROIDS,
+    PQ_SEGMENTS,
+    PQ_TRAINING_LIMIT,
+    create_collection,
+    new_quantizer,
+    wait_for_indexing,
+)
+
+BENCHMARK_COLLECTION_NAME = "Cap3DCompressionBenchmark"
+
+HEAP_METRIC = "go_memstats_heap_inuse_bytes"
+
+
+def vector_bytes(
+    compression: str,
+    dimension: int,
+    pq_segments: int = PQ_SEGMENTS,
+    pq_centroids: int = PQ_CENTROIDS,
+) -> float:
+    """The in-memory size of one vector compressed with a profile, in bytes."""
+    if compression == "pq":
+        return pq_segments * np.ceil(np.log2(pq_centroids) / 8)
+    if compression == "bq":
+        return dimension / 8
+
+    return dimension * np.dtype(np.float32).itemsize
+
+
+def heap_bytes(metrics_url: str) -> float:
+    """The Go heap in use by Weaviate, read from its Prometheus endpoint."""
+    with urllib.request.urlopen(metrics_url, timeout=10) as response:
+        for line in response.read().decode().splitlines():
+            if line.startswith(HEAP_METRIC + " "):
+                return float(line.split()[1])
+
+    raise ValueError(f"No {HEAP_METRIC} metric at {metrics_url}")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Compare memory, recall and latency of vector compression profiles."
+    )
+    parser.add_argument(
+        "--profiles",
+        nargs="+",
+        choices=COMPRESSION_PROFILES,
+        default=COMPRESSION_PROFILES,
+        help="Profiles to compare; the uncompressed profile is always included",
+    )
+    parser.add_argument("--num-objects", type=int, default=NUM_OBJECTS)
+    parser.add_argument("--views-per-object", type=int, default=VIEWS_PER_OBJECT)
+    parser.add_argument(
+        "--vectors",
+        type=Path,
+        default=None,
+        help="A .npy array of real view embeddings, (objects, views, dimension)",
+    )
+    parser.add_argument("--num-queries", type=int, default=NUM_QUERIES)
+    parser.add_argument("--limit", type=int, default=QUERY_LIMIT)
+    parser.add_argument(
+        "--distance-metric",
+        choices=sorted(DISTANCE_METRICS),
+        default=DISTANCE_METRIC,
+    )
+    parser.add_argument(
+        "--index-profile",
+        type=str,
+        default=None,
+        help="Named vector index profile of every collection (see configs/index_profiles.yml)",
+    )
+    parser.add_argument("--pq-segments", type=int, default=PQ_SEGMENTS)
+    parser.add_argument("--pq-centroids", type=int, default=PQ_CENTROIDS)
+    parser.add_argument("--pq-training-limit", type=int, default=PQ_TRAINING_LIMIT)
+    parser.add_argument("--bq-rescore-limit", type=int, default=BQ_RESCORE_LIMIT)
+    parser.add_argument(
+        "--weaviate-metrics-url",
+        type=str,
+        default=None,
+        help="Weaviate's Prometheus endpoint, to measure its heap growth per object",
+    )
+    parser.add_argument("--config", type=Path, default=CONFIG_PATH)
+
+    return parser.parse_args()
+
+
+def main():
+    args: argparse.Namespace = parse_args()
+    profiles: List[str] = ["none"] + [
+        profile for profile in args.profiles if profile != "none"
+    ]
+
+    object_vectors: np.ndarray = load_object_vectors(
+        args.vectors, args.num_objects, args.views_per_object
+    )
+    query_vectors: np.ndarray = synthetic_queries(object_vectors, args.num_queries)
+    exact: np.ndarray = exact_neighbours(query_vectors, object_vectors, args.limit)
+    dimension: int = object_vectors.shape[1]
+
+    # Train PQ within the sample, so that it is compressed
+    pq_training_limit: int = min(args.pq_training_limit, len(object_vectors))
+
+    print(
+        f"Benchmarking {', '.join(profiles)} on {len(object_vectors)} objects and "
+        f"{len(query_vectors)} queries"
+    )
+
+    results: Dict[str, Dict[str, Any]] = {}
+    with connect_to_weaviate(
+        **(load_config(args.config).get("weaviate") or {})
+    ) as client:
+        for profile in profiles:
+            client.collections.delete(BENCHMARK_COLLECTION_NAME)
+            heap_before: Optional[float] = (
+                heap_bytes(args.weaviate_metrics_url)
+                if args.weaviate_metrics_url
+                else None
+            )
+
+            try:
+                collection: Collection = create_collection(
+                    client=client,
+                    collection_name=BENCHMARK_COLLECTION_NAME,
+                    distance_metric=args.distance_metric,
+                    index_profile=args.index_profile,
+                    quantizer=new_quantizer(
+                        profile,
+                        pq_segments=args.pq_segments,
+                        pq_centroids=args.pq_centroids,
+                        pq_training_limit=pq_training_limit,
+                        bq_rescore_limit=args.bq_rescore_limit,
+                    ),
+                )
+                build_s: float = build_index(collection, object_vectors)
+                build_s += wait_for_indexing(
+                    client, BENCHMARK_COLLECTION_NAME, compressed=profile != "none"
+                )
+
+                heap_per_object: Optional[float] = (
+                    (heap_bytes(args.weaviate_metrics_url) - heap_before)
+                    / len(object_vectors)
+                    if heap_before is not None
+                    else None
+                )
+                results[profile] = {
+                    "build_s": build_s,
+                    "vector_bytes": vector_bytes(
+                        profile,
+                        dimension,
+                        pq_segments=args.pq_segments,
+                        pq_centroids=args.pq_centroids,
+                    ),
+                    "heap_bytes_per_object": heap_per_object,
+                    **run_queries(collection, query_vectors, limit=args.limit),
+                }
+            finally:
+                client.collections.delete(BENCHMARK_COLLECTION_NAME)
+
+            results[profile]["recall_exact"] = recall(
+                results[profile]["neighbours"], exact
+            )
+
+    reference: List[List[int]] = results["none"]["neighbours"]
+    for profile, profile_results in results.items():
+        profile_results["recall_uncompressed"] = recall(
+            profile_results["neighbours"], reference
+        )
+
+    for profile, profile_results in results.items():
+        del profile_results["neighbours"]
+        heap: str = (
+            f"{profile_results['heap_bytes_per_object']:.0f} B heap/object, "
+            if profile_results["heap_bytes_per_object"] is not None
+            else ""
+        )
+        print(
+            f"{profile:>4}: {profile_results['vector_bytes']:.0f} B/vector, {heap}"
+            f"recall@{args.limit} {profile_results['recall_uncompressed']:.4f} vs "
+            f"uncompressed ({profile_results['recall_exact']:.4f} vs exact), "
+            f"{profile_results['queries_per_second']:.1f} queries/s, "
+            f"p50 {profile_results['p50_query_latency_s'] * 1000:.2f}ms, "
+            f"p99 {profile_results['p99_query_latency_s'] * 1000:.2f}ms, "
+            f"built in {profile_results['build_s']:.1f}s"
+        )
+
+    report: Dict[str, Any] = {
+        "git": git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {
+            "num_objects": len(object_vectors),
+            "num_queries": len(query_vectors),
+            "limit": args.limit,
+            "vectors": str(args.vectors) if args.vectors is not None else "synthetic",
+            "distance_metric": args.distance_metric,
+            "index_profile": args.index_profile,
+            "pq_segments": args.pq_segments,
+            "pq_centroids": args.pq_centroids,
+            "pq_training_limit": pq_training_limit,
+            "bq_rescore_limit": args.bq_rescore_limit,
+        },
+        "results": results,
+    }
+
+    RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+    results_path: Path = (
+        RESULTS_DIR / f"compression-{time.strftime('%Y%m%dT%H%M%S')}.json"
+    )
+    results_path.write_text(json.dumps(report, indent=2))
+    print(f"Saved results to {results_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,316 @@
+"""
+Benchmark of the "dot" distance profile for normalised object vectors against "cosine".
+
+Creates one scratch collection per distance metric, inserts the same L2-normalised object
+vectors (pooled with `utils.ingest.pool_embeddings`) into each while timing the index build,
+then times the same `near_vector` queries against each, and compares their rankings:
+
+- the fraction of queries whose top-k results are identical (same objects, same order),
+- the recall@k of each against exact (brute-force) cosine results.
+
+Object vectors are synthetic by default: each object is the pooled mean of noisy views around
+a random direction, with uneven norms like raw CLIP embeddings. `--vectors` benchmarks real
+view embeddings instead (a `.npy` array of shape `(num_objects, views_per_object, dimension)`).
+Queries are unnormalised, like text-tower embeddings; their norm does not change rankings.
+
+The benchmark runs against the Weaviate server configured in `configs/data_loading.yml`, or
+with `--fake-weaviate` against the in-process `FakeWeaviateClient` (exhaustive search, so only
+the cost of the distance computation itself is measured).
+
+Usage:
+    ```bash
+    python benchmark_distance.py --num-objects 100000
+    ```
+"""
+
+import argparse
+import json
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+from weaviate.classes.data import DataObject
+from weaviate.collections import Collection
+from weaviate.util import generate_uuid5
+
+from benchmark_ingest import RESULTS_DIR, git_revision
+from data_loading import CONFIG_PATH, EMBEDDING_DIMENSION, connect_to_weaviate
+from utils.config import load_config
+from utils.fake_weaviate import FakeWeaviateClient
+from utils.ingest import pool_embeddings
+from utils.weaviate import DISTANCE_METRICS, create_collection
+
+BENCHMARK_COLLECTION_NAME = "Cap3DDistanceBenchmark"
+
+NUM_OBJECTS = 20000
+VIEWS_PER_OBJECT = 8
+NUM_QUERIES = 500
+QUERY_LIMIT = 10
+INSERT_BATCH_SIZE = 500
+SEED = 0
+
+
+def synthetic_view_embeddings(
+    num_objects: int = NUM_OBJECTS,
+    views_per_object: int = VIEWS_PER_OBJECT,
+    dimension: int = EMBEDDING_DIMENSION,
+    seed: int = SEED,
+) -> np.ndarray:
+    """
+    Random view embeddings of shape `(num_objects, views_per_object, dimension)`: noisy views
+    around one random direction per object, scaled by a random per-object norm.
+    """
+    rng = np.random.default_rng(seed)
+
+    directions: np.ndarray = rng.standard_normal((num_objects, 1, dimension))
+    views: np.ndarray = directions + 0.5 * rng.standard_normal(
+        (num_objects, views_per_object, dimension)
+    )
+    norms: np.ndarray = rng.uniform(5, 15, size=(num_objects, 1, 1))
+
+    return (norms * views / np.linalg.norm(views, axis=2, keepdims=True)).astype(
+        np.float32
+    )
+
+
+def load_object_vectors(
+    vectors_path: Optional[Path] = None,
+    num_objects: int = NUM_OBJECTS,
+    views_per_object: int = VIEWS_PER_OBJECT,
+) -> np.ndarray:
+    """
+    Pooled object vectors, of real view embeddings saved at `vectors_path` if given, or of
+    synthetic ones otherwise.
+    """
+    view_embeddings: np.ndarray = (
+        np.load(vectors_path)
+        if vectors_path is not None
+        else synthetic_view_embeddings(num_objects, views_per_object)
+    )
+
+    return np.asarray(
+        [pool_embeddings(object_embeddings) for object_embeddings in view_embeddings],
+        dtype=np.float32,
+    )
+
+
+def synthetic_queries(
+    object_vectors: np.ndarray, num_queries: int = NUM_QUERIES, seed: int = SEED + 1
+) -> np.ndarray:
+    """Queries near random objects, with the uneven norms of unnormalised text embeddings."""
+    rng = np.random.default_rng(seed)
+
+    return (
+        object_vectors[rng.integers(0, len(object_vectors), size=num_queries)]
+        + 0.05 * rng.standard_normal((num_queries, object_vectors.shape[1]))
+    ) * rng.uniform(5, 15, size=(num_queries, 1))
+
+
+def exact_neighbours(
+    query_vectors: np.ndarray, object_vectors: np.ndarray, limit: int
+) -> np.ndarray:
+    """The indices of each query's `limit` nearest objects by cosine distance, nearest first."""
+    similarities: np.ndarray = (
+        query_vectors / np.linalg.norm(query_vectors, axis=1, keepdims=True)
+    ) @ (object_vectors / np.linalg.norm(object_vectors, axis=1, keepdims=True)).T
+
+    return np.argsort(-similarities, axis=1, kind="stable")[:, :limit]
+
+
+def build_index(
+    collection: Collection,
+    object_vectors: np.ndarray,
+    batch_size: int = INSERT_BATCH_SIZE,
+) -> float:
+    """Insert every object vector, returning the seconds taken to insert and index them."""
+    start_time_s: float = time.perf_counter()
+
+    for batch_start in range(0, len(object_vectors), batch_size):
+        result = collection.data.insert_many(
+            [
+                DataObject(
+                    properties={"datasetUID": str(object_idx)},
+                    vector=object_vectors[object_idx].tolist(),
+                    uuid=generate_uuid5(str(object_idx)),
+                )
+                for object_idx in range(
+                    batch_start, min(batch_start + batch_size, len(object_vectors))
+                )
+            ]
+        )
+        if result.has_errors:
+            raise RuntimeError(
+                f"Failed to insert {len(result.errors)} objects: "
+                f"{next(iter(result.errors.values())).message}"
+            )
+
+    return time.perf_counter() - start_time_s
+
+
+def run_queries(
+    collection: Collection, query_vectors: np.ndarray, limit: int = QUERY_LIMIT
+) -> Dict[str, Any]:
+    """
+    Query the collection with every query vector.
+
+    Returns
+    -------
+    Dict[str, Any]
+        The `neighbours` (object indices, nearest first) of each query, and the query
+        throughput and latency.
+    """
+    neighbours: List[List[int]] = []
+    query_latencies_s: List[float] = []
+
+    start_time_s: float = time.perf_counter()
+    for query_vector in query_vectors:
+        query_start_time_s: float = time.perf_counter()
+        response = collection.query.near_vector(query_vector.tolist(), limit=limit)
+        query_latencies_s.append(time.perf_counter() - query_start_time_s)
+
+        neighbours.append(
+            [int(result.properties["datasetUID"]) for result in response.objects]
+        )
+    elapsed_s: float = time.perf_counter() - start_time_s
+
+    p50_latency_s, p99_latency_s = np.percentile(query_latencies_s, [50, 99])
+
+    return {
+        "neighbours": neighbours,
+        "queries_per_second": len(query_vectors) / elapsed_s,
+        "p50_query_latency_s": float(p50_latency_s),
+        "p99_query_latency_s": float(p99_latency_s),
+    }
+
+
+def recall(neighbours: List[List[int]], exact: Sequence[Sequence[int]]) -> float:
+    """The mean fraction of each query's exact nearest neighbours that were returned."""
+    return float(
+        np.mean(
+            [
+                len(set(query_neighbours) & set(exact_neighbours_))
+                / len(exact_neighbours_)
+                for query_neighbours, exact_neighbours_ in zip(neighbours, exact)
+            ]
+        )
+    )
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Compare the dot and cosine distance profiles on normalised vectors."
+    )
+    parser.add_argument("--num-objects", type=int, default=NUM_OBJECTS)
+    parser.add_argument("--views-per-object", type=int, default=VIEWS_PER_OBJECT)
+    parser.add_argument(
+        "--vectors",
+        type=Path,
+        default=None,
+        help="A .npy array of real view embeddings, (objects, views, dimension)",
+    )
+    parser.add_argument("--num-queries", type=int, default=NUM_QUERIES)
+    parser.add_argument("--limit", type=int, default=QUERY_LIMIT)
+    parser.add_argument(
+        "--fake-weaviate",
+        action="store_true",
+        help="Benchmark the in-process Weaviate stand-in instead of a server",
+    )
+    parser.add_argument("--config", type=Path, default=CONFIG_PATH)
+
+    return parser.parse_args()
+
+
+def main():
+    args: argparse.Namespace = parse_args()
+
+    object_vectors: np.ndarray = load_object_vectors(
+        args.vectors, args.num_objects, args.views_per_object
+    )
+    query_vectors: np.ndarray = synthetic_queries(object_vectors, args.num_queries)
+    exact: np.ndarray = exact_neighbours(query_vectors, object_vectors, args.limit)
+
+    print(
+        f"Benchmarking {len(object_vectors)} objects and {len(query_vectors)} queries "
+        f"on {'the fake Weaviate' if args.fake_weaviate else 'Weaviate'}"
+    )
+
+    results: Dict[str, Dict[str, Any]] = {}
+    with (
+        FakeWeaviateClient()
+        if args.fake_weaviate
+        else connect_to_weaviate(**(load_config(args.config).get("weaviate") or {}))
+    ) as client:
+        for distance_metric in DISTANCE_METRICS:
+            client.collections.delete(BENCHMARK_COLLECTION_NAME)
+            try:
+                collection: Collection = create_collection(
+                    client=client,
+                    collection_name=BENCHMARK_COLLECTION_NAME,
+                    distance_metric=distance_metric,
+                )
+                build_s: float = build_index(collection, object_vectors)
+                results[distance_metric] = {
+                    "build_s": build_s,
+                    **run_queries(collection, query_vectors, limit=args.limit),
+                }
+            finally:
+                client.collections.delete(BENCHMARK_COLLECTION_NAME)
+
+            results[distance_metric]["recall"] = recall(
+                results[distance_metric]["neighbours"], exact
+            )
+            print(
+                f"{distance_metric:>6}: index built in {build_s:.2f}s, "
+                f"{results[distance_metric]['queries_per_second']:.1f} queries/s, "
+                f"p50 {results[distance_metric]['p50_query_latency_s'] * 1000:.2f}ms, "
+                f"p99 {results[distance_metric]['p99_query_latency_s'] * 1000:.2f}ms, "
+                f"recall@{args.limit} {results[distance_metric]['recall']:.4f}"
+            )
+
+    identical_rankings: float = float(
+        np.mean(
+            [
+                cosine_neighbours == dot_neighbours
+                for cosine_neighbours, dot_neighbours in zip(
+                    results["cosine"].pop("neighbours"),
+                    results["dot"].pop("neighbours"),
+                )
+            ]
+        )
+    )
+    build_speedup: float = results["cosine"]["build_s"] / results["dot"]["build_s"]
+    query_speedup: float = (
+        results["dot"]["queries_per_second"] / results["cosine"]["queries_per_second"]
+    )
+    print(
+        f"Identical top-{args.limit} rankings for {identical_rankings:.1%} of queries; "
+        f"dot builds {build_speedup:.2f}x and queries {query_speedup:.2f}x as fast as cosine"
+    )
+
+    report: Dict[str, Any] = {
+        "git": git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {
+            "num_objects": len(object_vectors),
+            "num_queries": len(query_vectors),
+            "limit": args.limit,
+            "vectors": str(args.vectors) if args.vectors is not None else "synthetic",
+            "fake_weaviate": args.fake_weaviate,
+        },
+        "results": {
+            **results,
+            "identical_rankings": identical_rankings,
+            "build_speedup": build_speedup,
+            "query_speedup": query_speedup,
+        },
+    }
+
+    RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+    results_path: Path = RESULTS_DIR / f"distance-{time.strftime('%Y%m%dT%H%M%S')}.json"
+    results_path.write_text(json.dumps(report, indent=2))
+    print(f"Saved results to {results_path}")
+
+
+if __name__ == "__main__":
+    main()
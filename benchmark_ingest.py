@@ -0,0 +1,530 @@
+"""
+End-to-end throughput benchmark of the ingest pipeline.
+
+Runs the full scan -> decode -> encode -> upload pipeline from `data_loading.py` on a fixed
+synthetic dataset, uploading into an in-process `FakeCollection` instead of a Weaviate server,
+and reports objects/sec, p50/p99 per-object latency and peak RSS, followed by the throughput
+of `near_vector` queries against the uploaded objects. Results are saved as JSON
+together with the git revision, and compared against a stored baseline: the benchmark exits
+with a non-zero status if throughput regresses by more than `--max-regression`.
+
+Usage:
+    ```bash
+    python benchmark_ingest.py --update-baseline  # Record a baseline
+    python benchmark_ingest.py                    # Compare against it
+    ```
+"""
+
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from data_loading import (
+    BATCH_SIZE,
+    BUFFER_SIZE,
+    MODEL_NAME,
+    build_pipeline,
+    iter_objects,
+    new_metrics_registry,
+)
+from utils.encoder_pool import THREADS_PER_WORKER, EncoderPool, auto_split
+from utils.encoders import ClipImageEncoder, ViewEncoder
+from utils.fake_weaviate import FakeCollection
+from utils.ingest import UploadResult
+from utils.metrics import MetricsRegistry
+from utils.pipeline import Pipeline
+from utils.preprocessing import to_pixel_values
+from utils.retry import RetryBudget
+from utils.sources import DirectorySource
+
+BENCHMARK_DIR = Path("benchmarks")
+DATASET_DIR = BENCHMARK_DIR / "data"
+RESULTS_DIR = BENCHMARK_DIR / "results"
+BASELINE_PATH = BENCHMARK_DIR / "baseline.json"
+
+NUM_OBJECTS = 200
+VIEWS_PER_OBJECT = 8
+IMAGE_SIZE = 512  # Cap3D renders are 512x512
+SEED = 0
+
+# Injected latency of the fake collection, roughly a local Weaviate under light load
+REQUEST_LATENCY_S = 0.02
+OBJECT_LATENCY_S = 0.0002
+
+NUM_QUERIES = 200
+QUERY_LIMIT = 10
+
+MAX_REGRESSION = 0.10  # Maximum tolerated drop in objects/sec against the baseline
+
+PROJECTION_GRID_SIZE = 16
+EMBEDDING_DIMENSION = 512
+
+
+class ProjectionEncoder(ViewEncoder):
+    """
+    A cheap, deterministic stand-in for CLIP: a fixed random projection of the preprocessed
+    views, average-pooled to a small grid.
+
+    It runs the same preprocessing as `ClipImageEncoder`, so the benchmark measures every stage
+    except the model's forward pass without needing the model weights.
+    """
+
+    def __init__(
+        self,
+        grid_size: int = PROJECTION_GRID_SIZE,
+        dimension: int = EMBEDDING_DIMENSION,
+        seed: int = SEED,
+    ):
+        self.grid_size = grid_size
+        self.projection: np.ndarray = (
+            np.random.default_rng(seed)
+            .standard_normal((3 * grid_size * grid_size, dimension))
+            .astype(np.float32)
+        )
+
+    def encode_views(self, views: np.ndarray) -> np.ndarray:
+        pixel_values: np.ndarray = to_pixel_values(views)
+        batch_size, channels, height, width = pixel_values.shape
+
+        cell_height, cell_width = height // self.grid_size, width // self.grid_size
+        pooled: np.ndarray = (
+            pixel_values[
+                :, :, : cell_height * self.grid_size, : cell_width * self.grid_size
+            ]
+            .reshape(
+                batch_size,
+                channels,
+                self.grid_size,
+                cell_height,
+                self.grid_size,
+                cell_width,
+            )
+            .mean(axis=(3, 5))
+        )
+
+        return pooled.reshape(batch_size, -1) @ self.projection
+
+
+def generate_dataset(
+    root: Path,
+    num_objects: int = NUM_OBJECTS,
+    views_per_object: int = VIEWS_PER_OBJECT,
+    image_size: int = IMAGE_SIZE,
+    seed: int = SEED,
+) -> Path:
+    """
+    Generate a synthetic Cap3D-like split: one folder per object, each holding RGBA PNG views
+    of a coloured ellipse on a transparent background.
+
+    The dataset is only generated once per set of parameters, and reused by later runs.
+
+    Returns
+    -------
+    Path
+        The folder of object folders.
+    """
+    dataset_dir: Path = (
+        root
+        / f"objects{num_objects}_views{views_per_object}_size{image_size}_seed{seed}"
+    )
+    completed_marker: Path = dataset_dir / ".complete"
+    if completed_marker.exists():
+        return dataset_dir
+
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[:image_size, :image_size] / image_size
+
+    for object_idx in range(num_objects):
+        object_dir: Path = dataset_dir / f"{object_idx:08x}{seed:024x}"
+        object_dir.mkdir(parents=True, exist_ok=True)
+
+        colour: np.ndarray = rng.integers(0, 256, size=3)
+        for view_idx in range(views_per_object):
+            centre_x, centre_y = rng.uniform(0.3, 0.7, size=2)
+            radius_x, radius_y = rng.uniform(0.1, 0.3, size=2)
+            inside: np.ndarray = (
+                ((x - centre_x) / radius_x) ** 2 + ((y - centre_y) / radius_y) ** 2
+            ) <= 1
+
+            view = np.zeros((image_size, image_size, 4), dtype=np.uint8)
+            # Shade the ellipse with a gradient, so views compress like real renders
+            view[inside, :3] = (colour * (0.5 + 0.5 * y[inside, None])).astype(np.uint8)
+            view[inside, 3] = 255
+
+            Image.fromarray(view, mode="RGBA").save(object_dir / f"{view_idx:05d}.png")
+
+    completed_marker.touch()
+
+    return dataset_dir
+
+
+def git_revision() -> Dict[str, Any]:
+    """The current git commit SHA, and whether the working tree has uncommitted changes."""
+    try:
+        sha: str = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty: bool = bool(
+            subprocess.run(
+                ["git", "status", "--porcelain", "--untracked-files=no"],
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout.strip()
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return {"sha": None, "dirty": None}
+
+    return {"sha": sha, "dirty": dirty}
+
+
+def peak_rss_mb() -> Dict[str, float]:
+    """Peak resident set size of this process and of its (encoder) child processes, in MiB."""
+    # ru_maxrss is reported in KiB on Linux
+    return {
+        "self": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "children": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,
+    }
+
+
+def run_benchmark(
+    dataset_dir: Path,
+    encoder: ViewEncoder,
+    encode_workers: int,
+    collection: FakeCollection,
+    metrics: MetricsRegistry,
+) -> Dict[str, Any]:
+    """Run the ingest pipeline over the dataset once, returning its throughput and latency."""
+    source = DirectorySource(dataset_dir)
+    pipeline: Pipeline = build_pipeline(
+        source=source,
+        encoder=encoder,
+        collection=collection,
+        descriptions_dict={},
+        encode_workers=encode_workers,
+        retry_budget=RetryBudget(),
+        metrics=metrics,
+    )
+
+    # When each object entered the pipeline, to measure per-object latency
+    start_times: Dict[int, float] = {}
+
+    def timed_objects() -> Iterator[Tuple[int, str]]:
+        for object_idx, name in iter_objects(source):
+            start_times[object_idx] = time.perf_counter()
+            yield object_idx, name
+
+    object_latencies_s: List[float] = []
+    num_views: int = 0
+    num_failed: int = 0
+
+    start_time: float = time.perf_counter()
+    upload_result: UploadResult
+    for upload_result in pipeline.run(timed_objects()):
+        end_time: float = time.perf_counter()
+
+        for embedded_object in upload_result.succeeded_objects:
+            object_latencies_s.append(
+                end_time - start_times[embedded_object.object_idx]
+            )
+            num_views += embedded_object.num_views
+        num_failed += len(upload_result.errors)
+    elapsed_s: float = time.perf_counter() - start_time
+
+    num_objects: int = len(object_latencies_s)
+    p50_latency_s, p99_latency_s = (
+        np.percentile(object_latencies_s, [50, 99]) if object_latencies_s else (0, 0)
+    )
+
+    return {
+        "num_objects": num_objects,
+        "num_views": num_views,
+        "num_failed": num_failed + len(pipeline.failures),
+        "elapsed_s": elapsed_s,
+        "objects_per_second": num_objects / elapsed_s,
+        "views_per_second": num_views / elapsed_s,
+        "p50_object_latency_s": float(p50_latency_s),
+        "p99_object_latency_s": float(p99_latency_s),
+    }
+
+
+def run_query_benchmark(
+    collection: FakeCollection,
+    num_queries: int = NUM_QUERIES,
+    limit: int = QUERY_LIMIT,
+    seed: int = SEED,
+) -> Dict[str, Any]:
+    """Query the collection with its own (uploaded) vectors, returning query throughput."""
+    vectors: List[List[float]] = [
+        data_object.vector["default"]
+        for data_object in collection.iterator(include_vector=True)
+    ]
+    if not vectors:
+        return {}
+
+    rng = np.random.default_rng(seed)
+    query_latencies_s: List[float] = []
+
+    start_time: float = time.perf_counter()
+    for vector_idx in rng.integers(0, len(vectors), size=num_queries):
+        query_start_time: float = time.perf_counter()
+        collection.query.near_vector(vectors[vector_idx], limit=limit)
+        query_latencies_s.append(time.perf_counter() - query_start_time)
+    elapsed_s: float = time.perf_counter() - start_time
+
+    p50_latency_s, p99_latency_s = np.percentile(query_latencies_s, [50, 99])
+
+    return {
+        "num_queries": num_queries,
+        "limit": limit,
+        "queries_per_second": num_queries / elapsed_s,
+        "p50_query_latency_s": float(p50_latency_s),
+        "p99_query_latency_s": float(p99_latency_s),
+    }
+
+
+def check_failures(results: Dict[str, Any]) -> Optional[str]:
+    """
+    Check that a run uploaded every object.
+
+    Returns
+    -------
+    Optional[str]
+        A description of the failure, or `None` if every object was uploaded.
+    """
+    if results["num_objects"] == 0:
+        return "No objects were uploaded"
+    if results["num_failed"] > 0:
+        return f"{results['num_failed']} objects failed to upload"
+
+    return None
+
+
+def check_regression(
+    result: Dict[str, Any], baseline: Dict[str, Any], max_regression: float
+) -> Optional[str]:
+    """
+    Compare a result's throughput with a baseline's.
+
+    Returns
+    -------
+    Optional[str]
+        A description of the regression, or `None` if throughput is within `max_regression`.
+    """
+    throughput: float = result["results"]["objects_per_second"]
+    baseline_throughput: float = baseline["results"]["objects_per_second"]
+    if baseline_throughput <= 0:
+        return (
+            f"The baseline at {baseline['git']['sha']} has no throughput, record a new one "
+            f"with --update-baseline"
+        )
+    change: float = throughput / baseline_throughput - 1
+
+    if change < -max_regression:
+        return (
+            f"Throughput regressed by {-change:.1%} ({throughput:.1f} vs "
+            f"{baseline_throughput:.1f} objects/s at {baseline['git']['sha']}), more than "
+            f"the {max_regression:.0%} allowed"
+        )
+
+    return None
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Benchmark the ingest pipeline against an in-process Weaviate stand-in."
+    )
+    parser.add_argument("--num-objects", type=int, default=NUM_OBJECTS)
+    parser.add_argument("--views-per-object", type=int, default=VIEWS_PER_OBJECT)
+    parser.add_argument("--image-size", type=int, default=IMAGE_SIZE)
+    parser.add_argument(
+        "--encoder",
+        choices=["projection", "clip"],
+        default="projection",
+        help=(
+            "projection: a cheap stand-in for CLIP that needs no model weights (default); "
+            f"clip: the real {MODEL_NAME} model"
+        ),
+    )
+    parser.add_argument(
+        "--encoder-processes",
+        type=int,
+        default=0,
+        help="CLIP encoder processes (0 to encode in-process, -1 to split the CPUs)",
+    )
+    parser.add_argument(
+        "--request-latency",
+        type=float,
+        default=REQUEST_LATENCY_S,
+        help="Latency injected into every insert_many request, in seconds",
+    )
+    parser.add_argument(
+        "--error-rate",
+        type=float,
+        default=0.0,
+        help="Probability of each uploaded object failing with an injected error",
+    )
+    parser.add_argument(
+        "--baseline",
+        type=Path,
+        default=BASELINE_PATH,
+        help="Baseline results to compare throughput against",
+    )
+    parser.add_argument(
+        "--max-regression",
+        type=float,
+        default=MAX_REGRESSION,
+        help="Fail if objects/sec drops by more than this fraction of the baseline",
+    )
+    parser.add_argument(
+        "--update-baseline",
+        action="store_true",
+        help="Save the results as the new baseline instead of comparing against it",
+    )
+
+    return parser.parse_args()
+
+
+def main():
+    args: argparse.Namespace = parse_args()
+
+    dataset_dir: Path = generate_dataset(
+        DATASET_DIR,
+        num_objects=args.num_objects,
+        views_per_object=args.views_per_object,
+        image_size=args.image_size,
+    )
+    collection = FakeCollection(
+        "BenchmarkCap3DMM",
+        request_latency_s=args.request_latency,
+        object_latency_s=OBJECT_LATENCY_S,
+        error_rate=args.error_rate,
+        seed=SEED,
+    )
+    metrics: MetricsRegistry = new_metrics_registry()
+
+    encoder_pool: Optional[EncoderPool] = None
+    if args.encoder == "projection":
+        encoder: ViewEncoder = ProjectionEncoder()
+        encode_workers: int = 1
+    elif args.encoder_processes == 0:
+        encoder = ClipImageEncoder.from_pretrained(MODEL_NAME)
+        encode_workers = 1
+    else:
+        encoder_processes, encoder_threads = (
+            auto_split()
+            if args.encoder_processes < 0
+            else (args.encoder_processes, THREADS_PER_WORKER)
+        )
+        encoder = encoder_pool = EncoderPool(
+            MODEL_NAME,
+            num_workers=encoder_processes,
+            threads_per_worker=encoder_threads,
+        )
+        encode_workers = encoder_processes
+
+    try:
+        results: Dict[str, Any] = run_benchmark(
+            dataset_dir=dataset_dir,
+            encoder=encoder,
+            encode_workers=encode_workers,
+            collection=collection,
+            metrics=metrics,
+        )
+    finally:
+        if encoder_pool is not None:
+            encoder_pool.close()
+
+    results["query"] = run_query_benchmark(collection)
+    results["peak_rss_mb"] = peak_rss_mb()
+
+    report: Dict[str, Any] = {
+        "git": git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {
+            "num_objects": args.num_objects,
+            "views_per_object": args.views_per_object,
+            "image_size": args.image_size,
+            "encoder": args.encoder,
+            "encoder_processes": args.encoder_processes,
+            "batch_size": BATCH_SIZE,
+            "buffer_size": BUFFER_SIZE,
+            "request_latency_s": args.request_latency,
+            "error_rate": args.error_rate,
+        },
+        "results": results,
+        "metrics": metrics.snapshot(),
+    }
+
+    print(
+        f"{results['num_objects']} objects in {results['elapsed_s']:.2f}s: "
+        f"{results['objects_per_second']:.1f} objects/s, "
+        f"{results['views_per_second']:.1f} views/s, "
+        f"p50 {results['p50_object_latency_s']:.3f}s, "
+        f"p99 {results['p99_object_latency_s']:.3f}s per object, "
+        f"peak RSS {results['peak_rss_mb']['self']:.0f} MiB "
+        f"(+{results['peak_rss_mb']['children']:.0f} MiB in encoder processes)"
+    )
+
+    if results["query"]:
+        print(
+            f"{results['query']['num_queries']} near_vector queries: "
+            f"{results['query']['queries_per_second']:.1f} queries/s, "
+            f"p50 {results['query']['p50_query_latency_s'] * 1000:.2f}ms, "
+            f"p99 {results['query']['p99_query_latency_s'] * 1000:.2f}ms"
+        )
+
+    RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+    results_path: Path = (
+        RESULTS_DIR
+        / f"{time.strftime('%Y%m%dT%H%M%S')}-{(report['git']['sha'] or 'unknown')[:12]}.json"
+    )
+    results_path.write_text(json.dumps(report, indent=2))
+    print(f"Saved results to {results_path}")
+
+    # A failed run is no measure of throughput, so it neither becomes nor is compared with
+    # the baseline
+    failure: Optional[str] = check_failures(results)
+    if failure is not None:
+        print(f"Benchmark failed: {failure}")
+        sys.exit(1)
+
+    if args.update_baseline:
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.baseline.write_text(json.dumps(report, indent=2))
+        print(f"Saved baseline to {args.baseline}")
+        return
+
+    if not args.baseline.exists():
+        print(
+            f"No baseline at {args.baseline}, run with --update-baseline to record one"
+        )
+        return
+
+    baseline: Dict[str, Any] = json.loads(args.baseline.read_text())
+    if baseline["config"] != report["config"]:
+        print("Warning: the baseline was recorded with a different configuration")
+
+    regression: Optional[str] = check_regression(
+        report, baseline, max_regression=args.max_regression
+    )
+    if regression is not None:
+        print(regression)
+        sys.exit(1)
+
+    print(
+        f"Throughput within {args.max_regression:.0%} of the baseline "
+        f"({baseline['results']['objects_per_second']:.1f} objects/s)"
+    )
+
+
+if __name__ == "__main__":
+    main()
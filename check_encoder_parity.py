@@ -0,0 +1,308 @@
+"""
+Accuracy check of an alternative CLIP inference mode against the fp32 reference model.
+
+Embeds every view and caption of a held-out sample of objects (see `evaluate_retrieval.py`)
+with both the fp32 `ClipImageEncoder` and the candidate, and reports:
+
+- the cosine agreement of the candidate's view, pooled object and caption embeddings with the
+  fp32 ones (mean, 1st percentile and minimum),
+- the text-to-object retrieval metrics of both, to show whether retrieval degrades,
+- the encode throughput of both (images/sec), and the size of their weights.
+
+Candidates are:
+
+- `int8`: dynamic int8 quantization of the linear layers (`--quantize-encoder` of
+  `data_loading.py`).
+- `onnx`: the towers exported to ONNX and run with ONNX Runtime (`--encoder-backend onnx`).
+- `onnx-int8`: the ONNX graphs dynamically quantized to int8 by ONNX Runtime.
+
+The check exits with a non-zero status if the mean cosine agreement of the view embeddings
+falls below `--min-cosine`, so it can gate enabling the candidate in `configs/`.
+
+Usage:
+    ```bash
+    python check_encoder_parity.py --candidate int8 --source compressed_imgs_perobj_00.zip
+    python check_encoder_parity.py --candidate onnx --threads 8 --source compressed_imgs_perobj_00.zip
+    ```
+"""
+
+import argparse
+import io
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import torch
+from tqdm import tqdm
+
+from data_loading import (
+    BATCH_SIZE,
+    MODEL_NAME,
+    PATH_TO_EXAMPLE_OBJECTS,
+    PERFORMING_CHECKSUM,
+)
+from evaluate_retrieval import EVALUATION_DIR, held_out_names
+from utils.descriptions import get_latest_descriptions
+from utils.encoders import ClipImageEncoder
+from utils.ingest import ObjectViews, decode_views, pool_embeddings, scan_object
+from utils.retrieval import cosine_agreement, retrieval_metrics
+from utils.sources import ObjectSource, open_source
+
+NUM_OBJECTS = 100
+MIN_COSINE_AGREEMENT = 0.99
+CANDIDATES = ["int8", "onnx", "onnx-int8"]
+
+
+def load_candidate(candidate: str, threads: Optional[int] = None) -> Tuple[Any, float]:
+    """
+    Load the CLIP encoder of a candidate inference mode.
+
+    Returns
+    -------
+    Tuple[Any, float]
+        The encoder, with `encode_views` and `encode_texts` methods, and the size of its
+        weights in MiB.
+    """
+    if candidate == "int8":
+        encoder: ClipImageEncoder = ClipImageEncoder.from_pretrained(
+            MODEL_NAME, quantize=True
+        )
+        return encoder, weights_mb(encoder)
+
+    if candidate in ("onnx", "onnx-int8"):
+        from utils.onnx_encoder import OnnxClipEncoder
+
+        onnx_encoder = OnnxClipEncoder.from_pretrained(
+            MODEL_NAME,
+            quantize=candidate == "onnx-int8",
+            intra_op_threads=threads,
+        )
+
+        return onnx_encoder, sum(
+            path.stat().st_size / 2**20 for path in onnx_encoder.graph_paths()
+        )
+
+    raise ValueError(f"Unknown candidate: {candidate!r}")
+
+
+def weights_mb(encoder: ClipImageEncoder) -> float:
+    """Serialised size of a PyTorch encoder's weights, including packed quantized weights."""
+    buffer = io.BytesIO()
+    torch.save(encoder.model.state_dict(), buffer)
+
+    return buffer.getbuffer().nbytes / 2**20
+
+
+def load_views(source: ObjectSource, names: List[str]) -> Dict[str, List[np.ndarray]]:
+    """The decoded views of each object with any, keyed by name."""
+    views: Dict[str, List[np.ndarray]] = {}
+
+    for object_idx, name in enumerate(tqdm(names, unit="obj")):
+        object_views: Optional[ObjectViews] = decode_views(
+            scan_object(object_idx, name, source=source)
+        )
+        if object_views is not None:
+            views[name] = object_views.images
+
+    return views
+
+
+def embed(
+    encoder: Any,
+    views: Dict[str, List[np.ndarray]],
+    captions: List[str],
+    batch_size: int = BATCH_SIZE,
+) -> Dict[str, Any]:
+    """
+    Embed every view and caption with an encoder.
+
+    Returns
+    -------
+    Dict[str, Any]
+        The `view_embeddings` (of every object's views, concatenated), pooled
+        `object_embeddings`, `text_embeddings`, and the `views_per_second` encoded.
+    """
+    images: np.ndarray = np.stack(
+        [image for object_images in views.values() for image in object_images]
+    )
+
+    start_time_s: float = time.perf_counter()
+    view_embeddings: np.ndarray = np.concatenate(
+        [
+            encoder.encode_views(images[batch_start : batch_start + batch_size])
+            for batch_start in range(0, len(images), batch_size)
+        ]
+    )
+    elapsed_s: float = time.perf_counter() - start_time_s
+
+    object_embeddings: List[List[float]] = []
+    view_start: int = 0
+    for object_images in views.values():
+        object_embeddings.append(
+            pool_embeddings(
+                view_embeddings[view_start : view_start + len(object_images)]
+            )
+        )
+        view_start += len(object_images)
+
+    return {
+        "view_embeddings": view_embeddings,
+        "object_embeddings": np.asarray(object_embeddings, dtype=np.float32),
+        "text_embeddings": encoder.encode_texts(captions),
+        "views_per_second": len(images) / elapsed_s,
+    }
+
+
+def agreement_summary(agreement: np.ndarray) -> Dict[str, float]:
+    return {
+        "mean": float(np.mean(agreement)),
+        "p1": float(np.percentile(agreement, 1)),
+        "min": float(np.min(agreement)),
+    }
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Check a CLIP inference mode's embeddings against the fp32 model."
+    )
+    parser.add_argument("--candidate", choices=CANDIDATES, default=CANDIDATES[0])
+    parser.add_argument(
+        "--source",
+        type=str,
+        nargs="+",
+        default=[PATH_TO_EXAMPLE_OBJECTS],
+        help="Folder of object folders, or Cap3D zip archives, to sample objects from",
+    )
+    parser.add_argument("--num-objects", type=int, default=NUM_OBJECTS)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=None,
+        help="Intra-op threads of the ONNX candidates (default: every core, like PyTorch)",
+    )
+    parser.add_argument(
+        "--min-cosine",
+        type=float,
+        default=MIN_COSINE_AGREEMENT,
+        help="Fail if the mean cosine agreement of view embeddings is below this",
+    )
+    parser.add_argument(
+        "--output",
+        type=Path,
+        default=None,
+        help=f"Where to save the results (default: under {EVALUATION_DIR})",
+    )
+
+    return parser.parse_args()
+
+
+def main():
+    args: argparse.Namespace = parse_args()
+
+    descriptions: Dict[str, str] = get_latest_descriptions(
+        performing_checksum=PERFORMING_CHECKSUM
+    )
+    with open_source(args.source) as source:
+        views: Dict[str, List[np.ndarray]] = load_views(
+            source, held_out_names(source, descriptions, args.num_objects)
+        )
+    captions: List[str] = [descriptions[name] for name in views]
+    print(
+        f"Checking {args.candidate} on {len(views)} objects, "
+        f"{sum(map(len, views.values()))} views"
+    )
+
+    reference_encoder: ClipImageEncoder = ClipImageEncoder.from_pretrained(MODEL_NAME)
+    reference: Dict[str, Any] = embed(
+        reference_encoder, views, captions, batch_size=args.batch_size
+    )
+    reference_weights_mb: float = weights_mb(reference_encoder)
+    del reference_encoder
+
+    candidate_weights_mb: float
+    candidate_encoder, candidate_weights_mb = load_candidate(
+        args.candidate, threads=args.threads
+    )
+    candidate: Dict[str, Any] = embed(
+        candidate_encoder, views, captions, batch_size=args.batch_size
+    )
+
+    results: Dict[str, Any] = {
+        "agreement": {
+            embeddings: agreement_summary(
+                cosine_agreement(candidate[embeddings], reference[embeddings])
+            )
+            for embeddings in [
+                "view_embeddings",
+                "object_embeddings",
+                "text_embeddings",
+            ]
+        },
+        "retrieval": {
+            "fp32": retrieval_metrics(
+                reference["text_embeddings"], reference["object_embeddings"]
+            ),
+            args.candidate: retrieval_metrics(
+                candidate["text_embeddings"], candidate["object_embeddings"]
+            ),
+        },
+        "views_per_second": {
+            "fp32": reference["views_per_second"],
+            args.candidate: candidate["views_per_second"],
+        },
+        "weights_mb": {
+            "fp32": reference_weights_mb,
+            args.candidate: candidate_weights_mb,
+        },
+    }
+
+    for embeddings, summary in results["agreement"].items():
+        print(
+            f"Cosine agreement of {embeddings.replace('_', ' ')}: "
+            f"mean {summary['mean']:.5f}, p1 {summary['p1']:.5f}, min {summary['min']:.5f}"
+        )
+    for encoder_name, metrics in results["retrieval"].items():
+        print(
+            f"{encoder_name:>6} retrieval: "
+            + ", ".join(f"{metric} {value:.3f}" for metric, value in metrics.items())
+        )
+    print(
+        f"{args.candidate} encodes {candidate['views_per_second']:.1f} views/s "
+        f"({candidate['views_per_second'] / reference['views_per_second']:.2f}x fp32), "
+        f"weights {candidate_weights_mb:.0f} MiB (fp32: {reference_weights_mb:.0f} MiB)"
+    )
+
+    output_path: Path = args.output or (
+        EVALUATION_DIR
+        / f"parity-{args.candidate}-{time.strftime('%Y%m%dT%H%M%S')}.json"
+    )
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    output_path.write_text(
+        json.dumps(
+            {
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "model_name": MODEL_NAME,
+                "candidate": args.candidate,
+                "num_objects": len(views),
+                "results": results,
+            },
+            indent=2,
+        )
+    )
+    print(f"Saved results to {output_path}")
+
+    mean_agreement: float = results["agreement"]["view_embeddings"]["mean"]
+    if mean_agreement < args.min_cosine:
+        print(
+            f"Mean cosine agreement {mean_agreement:.5f} is below {args.min_cosine}, "
+            f"{args.candidate} degrades the embeddings"
+        )
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
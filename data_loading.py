@@ -1,25 +1,109 @@
-import base64
+import argparse
+import contextlib
+import itertools
 import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from functools import partial
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
 
 import numpy as np
+import torch
 import weaviate
-import weaviate.classes as wvc
-import weaviate.classes.config as wc
-from PIL import Image
-from sentence_transformers import SentenceTransformer, util
 from tqdm import tqdm
-from weaviate.classes.data import DataObject
 from weaviate.classes.init import AdditionalConfig, Timeout
-from weaviate.classes.query import Filter
 from weaviate.collections import Collection
-from weaviate.collections.classes.batch import BatchObjectReturn, ErrorObject
 from weaviate.connect import ConnectionParams
-from weaviate.util import generate_uuid5
 
+from utils.autotune import (
+    RssSampler,
+    TrialResult,
+    coordinate_search,
+    hardware_info,
+)
+from utils.config import load_config, save_config
+from utils.dead_letter import DeadLetterStore
+from utils.delta import ChangeFilter, delete_objects, find_removed_objects
 from utils.descriptions import get_latest_descriptions
-from utils.weaviate import create_collection
+from utils.early_stopping import CONVERGENCE_THRESHOLD, MIN_VIEWS, EarlyStopping
+from utils.embedding_cache import EmbeddingCache
+from utils.encoder_pool import EncoderPool, auto_split, available_cpus
+from utils.encoders import ClipImageEncoder, ViewEncoder
+from utils.fake_weaviate import FakeWeaviateClient
+from utils.ingest import (
+    PREPROCESSING_VERSION,
+    BatchedEncodeHandler,
+    EmbeddedObject,
+    ObjectViews,
+    UploadHandler,
+    UploadResult,
+    decode_mosaic,
+    decode_views,
+    object_properties,
+    scan_object,
+)
+from utils.ledger import IngestLedger
+from utils.metrics import (
+    Counter,
+    Histogram,
+    JsonlMetricsWriter,
+    MetricsRegistry,
+    MetricsServer,
+    Throughput,
+)
+from utils.mosaic import MOSAIC_GRID_SIZE
+from utils.pipeline import Pipeline, Stage
+from utils.preprocessing import new_batch_buffer
+from utils.reindex import (
+    ACTIVE_COLLECTIONS_PATH,
+    GRACE_PERIOD_S,
+    collection_versions,
+    garbage_collect,
+    promote,
+    resolve_collection_name,
+    retire,
+    spot_check_recall,
+    versioned_name,
+)
+from utils.retry import RetryBudget, RetryPolicy
+from utils.sources import ObjectSource, open_source
+from utils.tenants import (
+    TENANT_ACTIVITIES,
+    ensure_tenants,
+    object_tenant_name,
+    set_tenant_activity,
+    split_tenant_name,
+    tenant_activities,
+)
+from utils.view_filter import (
+    MAX_HASH_DISTANCE,
+    MIN_FOREGROUND_COVERAGE,
+    ViewFilter,
+    ViewSelection,
+    embedding_shift,
+)
+from utils.weaviate import (
+    BQ_RESCORE_LIMIT,
+    BULK_LOAD_PROFILE,
+    COMPRESSION,
+    COMPRESSION_PROFILES,
+    DISTANCE_METRIC,
+    DISTANCE_METRICS,
+    INDEX_PROFILES_PATH,
+    MUTABLE_INDEX_OPTIONS,
+    PQ_CENTROIDS,
+    PQ_SEGMENTS,
+    PQ_TRAINING_LIMIT,
+    create_collection,
+    index_settings,
+    load_index_profile,
+    new_quantizer,
+    update_mutable_index_settings,
+    wait_for_indexing,
+)
 
 HTTP_HOST = "localhost"
 HTTP_PORT = 8080
@@ -36,6 +120,9 @@ INSERT_TIMEOUT_S = 120
 COLLECTION_NAME = "Cap3DMM"
 DATA_UPLOAD_COLLECTION_NAME = "UploadCap3DMM"
 
+# Settings read at startup, overriding the constants below (see utils.config)
+CONFIG_PATH = "configs/data_loading.yml"
+
 BATCH_SIZE = 19
 BUFFER_SIZE = 100
 PATH_TO_EXAMPLE_OBJECTS = "/home/yunusskeete/Documents/data/3D/Cap3D/local-split/unzips/compressed_imgs_perobj_00.zip/Cap3D_Objaverse_renderimgs"
@@ -46,137 +133,1812 @@ DELETE_ON_UPLOAD = False
 
 PERFORMING_CHECKSUM = False
 
+LEDGER_PATH = "ingest_ledger.sqlite"
+
+EMBEDDING_CACHE_DIR = "embedding_cache"
+# Views; the cache's files grow as it fills, to at most ~8GB of float32 512-d embeddings
+EMBEDDING_CACHE_CAPACITY = 4_000_000
+EMBEDDING_DIMENSION = 512
+
+# Worker threads per pipeline stage, and capacity of the queue feeding each stage
+SCAN_WORKERS = 2
+DECODE_WORKERS = 4
+ENCODE_WORKERS = 1
+UPLOAD_WORKERS = 1
+QUEUE_SIZE = 64
+
+# Concurrent insert_many requests per upload worker
+UPLOAD_CONCURRENCY = 4
+
+# Retries of failed objects, and where objects that still fail are kept for `replay`
+DEAD_LETTER_PATH = "dead_letters.sqlite"
+UPLOAD_MAX_ATTEMPTS = 5
+UPLOAD_RETRY_BASE_DELAY_S = 0.5
+UPLOAD_RETRY_MAX_DELAY_S = 30.0
+UPLOAD_RETRY_BUDGET = 1000  # Retries per run, across all requests
+
+# Local Prometheus-style metrics endpoint, and optional JSONL file of metric snapshots
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9464
+METRICS_JSONL_PATH = None
+METRICS_SNAPSHOT_INTERVAL_S = 10.0
+
+# CLIP encoder processes (None: split the available CPUs with `auto_split`, 0: encode
+# in-process, with as many threads as PyTorch or ONNX Runtime choose unless `--encoder-threads`)
+ENCODER_PROCESSES = None
+ENCODER_THREADS_PER_PROCESS = 4
+PIN_ENCODER_CPUS = False
+QUANTIZE_ENCODER = False  # Dynamic int8 quantization of CLIP, for CPU-only hosts
+ENCODER_BACKEND = "torch"  # "torch", or "onnx" to run CLIP through ONNX Runtime
+ENCODER_INTER_OP_THREADS = 1
+
 MODEL_NAME = "clip-ViT-B-32"
 
-path_to_example_objects = Path(PATH_TO_EXAMPLE_OBJECTS)
+# Object embedding recipe: "mean" of every view's embedding, or the embedding of a "mosaic" of
+# views (one CLIP pass per object, see utils.mosaic). Compare them with evaluate_retrieval.py
+EMBEDDING_RECIPE = "mean"
+
+# Stop encoding an object's views once their running mean settles (see utils.early_stopping)
+EARLY_STOPPING = False
+
+# Drop blank and near-duplicate views before encoding (see utils.view_filter)
+VIEW_FILTER = False
+VIEW_FILTER_EVALUATION_OBJECTS = 200
+
+# `calibrate` runs the ingest on a sample of objects, tuning one setting at a time
+CALIBRATION_COLLECTION_NAME = "CalibrationCap3DMM"
+CALIBRATION_OBJECTS = 300
+CALIBRATION_MEMORY_FRACTION = 0.75  # Of physical memory, for the default memory budget
+CALIBRATION_BATCH_SIZES = [8, 16, 19, 32, 64]
+CALIBRATION_THREADS_PER_ENCODER = [1, 2, 4, 8]
+CALIBRATION_DECODE_WORKERS = [2, 4, 8, 16]
+CALIBRATION_BUFFER_SIZES = [50, 100, 200, 400]
+
+# Checks a reindexed collection must pass before it replaces the current one
+REINDEX_MAX_COUNT_DROP = 0.01
+REINDEX_MIN_SPOT_CHECK_RECALL = 0.95
 
 # pil_logger = logging.getLogger("PIL")
 # if pil_logger.hasHandlers():
 #     pil_logger.setLevel(logging.INFO)
 logging.disable(logging.DEBUG)
 
-descriptions_dict = get_latest_descriptions(
-    performing_checksum=PERFORMING_CHECKSUM
-)  # https://huggingface.co/datasets/tiange/Cap3D/resolve/48903d63859fe3d3f17942bf6d5383eb05dd1775/Cap3D_automated_Objaverse_full.csv?download=true
-print(len(descriptions_dict))
-
-
-with weaviate.WeaviateClient(
-    connection_params=ConnectionParams.from_params(
-        http_host=HTTP_HOST,
-        http_port=HTTP_PORT,
-        http_secure=HTTP_SECURE,
-        grpc_host=GRPC_HOST,
-        grpc_port=GRPC_PORT,
-        grpc_secure=GRPC_SECURE,
-    ),
-    additional_config=AdditionalConfig(
-        timeout=Timeout(
-            init=INTIALISATION_TIMEOUT_S, query=QUERY_TIMEOUT_S, insert=INSERT_TIMEOUT_S
-        ),  # Values in seconds
-    ),
-) as client:
-    assert client.is_live(), "Weaviate client is not live"
-    print("Client connection established")
 
-    try:
-        client.collections.delete(COLLECTION_NAME)
+def iter_objects(
+    source: ObjectSource,
+    skip_names: Optional[Set[str]] = None,
+    interleave_splits: bool = False,
+) -> Iterator[Tuple[int, str]]:
+    """
+    Yield the index and name of every object in `source`, skipping any object whose name is
+    in `skip_names`. With `interleave_splits`, objects are taken from each split in turn, so
+    that every split is ingested at once.
+    """
+    skip_names = skip_names or set()
+
+    names: Iterator[str] = (
+        name for name in source.object_names() if name not in skip_names
+    )
+    if interleave_splits:
+        names_by_split: Dict[str, List[str]] = {}
+        for name in names:
+            names_by_split.setdefault(source.split(name), []).append(name)
+
+        names = (
+            name
+            for split_names in itertools.zip_longest(*names_by_split.values())
+            for name in split_names
+            if name is not None
+        )
+
+    yield from enumerate(names)
+
+
+def new_upload_handler(
+    collection: Collection,
+    descriptions_dict: Dict[str, str],
+    retry_budget: Optional[RetryBudget] = None,
+    metrics: Optional[MetricsRegistry] = None,
+    buffer_size: int = BUFFER_SIZE,
+    upload_concurrency: int = UPLOAD_CONCURRENCY,
+    tenant_of: Optional[Callable[[str], str]] = None,
+) -> UploadHandler:
+    """
+    Create an upload handler that retries failed objects under `retry_budget`, inserting
+    each object into the tenant `tenant_of` maps its name to, if given.
+    """
+    return UploadHandler(
+        collection=collection,
+        descriptions=descriptions_dict,
+        buffer_size=buffer_size,
+        max_in_flight=upload_concurrency,
+        retry_policy=RetryPolicy(
+            max_attempts=UPLOAD_MAX_ATTEMPTS,
+            base_delay_s=UPLOAD_RETRY_BASE_DELAY_S,
+            max_delay_s=UPLOAD_RETRY_MAX_DELAY_S,
+        ),
+        retry_budget=retry_budget,
+        metrics=metrics,
+        tenant_of=tenant_of,
+    )
+
+
+def build_pipeline(
+    source: ObjectSource,
+    encoder: ViewEncoder,
+    collection: Collection,
+    descriptions_dict: Dict[str, str],
+    embedding_cache: Optional[EmbeddingCache] = None,
+    change_filter: Optional[ChangeFilter] = None,
+    hash_contents: bool = False,
+    encode_workers: int = ENCODE_WORKERS,
+    retry_budget: Optional[RetryBudget] = None,
+    metrics: Optional[MetricsRegistry] = None,
+    batch_size: int = BATCH_SIZE,
+    buffer_size: int = BUFFER_SIZE,
+    decode_workers: int = DECODE_WORKERS,
+    upload_concurrency: int = UPLOAD_CONCURRENCY,
+    view_filter: Optional[ViewFilter] = None,
+    early_stopping: Optional[EarlyStopping] = None,
+    mosaic_grid_size: Optional[int] = None,
+    tenant_of: Optional[Callable[[str], str]] = None,
+) -> Pipeline:
+    """
+    Build the scan -> decode -> encode -> upload ingest pipeline.
+
+    Each stage runs on its own worker threads, joined by bounded queues, so disk reads, PNG
+    decoding, CLIP inference and Weaviate round-trips overlap. Views found in
+    `embedding_cache` skip decoding and encoding, views rejected by `view_filter` skip
+    encoding, `early_stopping` stops encoding an object's views once their mean settles, and
+    objects rejected by `change_filter` are dropped straight after the scan stage. With
+    `mosaic_grid_size`, each object is embedded from a single mosaic of its views instead.
+    With `tenant_of`, objects are uploaded into the tenant it maps their name to.
+    """
+
+    def scan(indexed_name: Tuple[int, str]) -> Optional[ObjectViews]:
+        object_views: ObjectViews = scan_object(
+            *indexed_name, source=source, hash_contents=hash_contents
+        )
+
+        return object_views if change_filter is None else change_filter(object_views)
+
+    return Pipeline(
+        stages=[
+            Stage.from_function(
+                "scan",
+                scan,
+                workers=SCAN_WORKERS,
+                queue_size=QUEUE_SIZE,
+            ),
+            Stage.from_function(
+                "decode",
+                lambda object_views: (
+                    decode_views(
+                        object_views,
+                        embedding_cache=embedding_cache,
+                        view_filter=view_filter,
+                    )
+                    if mosaic_grid_size is None
+                    else decode_mosaic(
+                        object_views,
+                        grid_size=mosaic_grid_size,
+                        embedding_cache=embedding_cache,
+                        view_filter=view_filter,
+                    )
+                ),
+                workers=decode_workers,
+                queue_size=QUEUE_SIZE,
+            ),
+            Stage(
+                "encode",
+                lambda: BatchedEncodeHandler(
+                    encoder=encoder,
+                    batch_size=batch_size,
+                    embedding_cache=embedding_cache,
+                    early_stopping=early_stopping,
+                    metrics=metrics,
+                ),
+                workers=encode_workers,
+                queue_size=QUEUE_SIZE,
+            ),
+            Stage(
+                "upload",
+                lambda: new_upload_handler(
+                    collection,
+                    descriptions_dict,
+                    retry_budget=retry_budget,
+                    metrics=metrics,
+                    buffer_size=buffer_size,
+                    upload_concurrency=upload_concurrency,
+                    tenant_of=tenant_of,
+                ),
+                workers=UPLOAD_WORKERS,
+                queue_size=QUEUE_SIZE,
+            ),
+        ],
+        metrics=metrics,
+    )
+
+
+def parse_args() -> Tuple[argparse.Namespace, Dict[str, Any]]:
+    """
+    Parse the command line, using the `ingest` section of the config file for defaults.
+
+    Returns
+    -------
+    Tuple[argparse.Namespace, Dict[str, Any]]
+        The parsed arguments, and the whole config file.
+    """
+    config_parser = argparse.ArgumentParser(add_help=False)
+    config_parser.add_argument(
+        "--config",
+        type=str,
+        default=CONFIG_PATH,
+        help="YAML file of settings overriding the built-in defaults",
+    )
+    config_args, _ = config_parser.parse_known_args()
+
+    parser = argparse.ArgumentParser(
+        description="Embed Cap3D objects with CLIP and load them into Weaviate.",
+        parents=[config_parser],
+    )
+    parser.add_argument(
+        "command",
+        nargs="?",
+        choices=[
+            "ingest",
+            "reindex",
+            "replay",
+            "tenants",
+            "calibrate",
+            "evaluate-view-filter",
+        ],
+        default="ingest",
+        help=(
+            "ingest: embed and upload the source (default); "
+            "reindex: build the source into a new version of the collection while the "
+            "current one keeps serving, verify it and cut over to it; "
+            "replay: re-submit the objects in the dead-letter store; "
+            "tenants: list the tenants of a --multi-tenancy collection, or change their "
+            "activity with --set-tenant-activity; "
+            "calibrate: tune the throughput settings on a sample of the source and write "
+            "them to the config file; "
+            "evaluate-view-filter: measure the CLIP inferences saved by the view filter and "
+            "how far it moves the pooled embeddings"
+        ),
+    )
+    parser.add_argument(
+        "--source",
+        type=str,
+        nargs="+",
+        default=[PATH_TO_EXAMPLE_OBJECTS],
+        help=(
+            "Folder of object folders, or one or more Cap3D zip archives "
+            "(e.g. compressed_imgs_perobj_00.zip) to read without extracting"
+        ),
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Keep the existing collection and skip objects the ledger records as uploaded",
+    )
+    parser.add_argument(
+        "--distance-metric",
+        choices=sorted(DISTANCE_METRICS),
+        default=DISTANCE_METRIC,
+        help=(
+            "Vector distance of a newly created collection; object vectors are normalised, so "
+            "dot ranks like cosine without normalising at query time (a resumed collection "
+            "keeps its own distance)"
+        ),
+    )
+    parser.add_argument(
+        "--index-profile",
+        type=str,
+        default=None,
+        help=(
+            "Named vector index profile of a newly created collection, e.g. bulk-load, "
+            "low-latency, high-recall or small-flat (default: Weaviate's HNSW defaults)"
+        ),
+    )
+    parser.add_argument(
+        "--index-profiles-path",
+        type=str,
+        default=str(INDEX_PROFILES_PATH),
+        help="YAML file of named vector index profiles",
+    )
+    parser.add_argument(
+        "--bulk-load",
+        action="store_true",
+        help=(
+            "Create the collection with the cheap build settings of --bulk-load-profile, "
+            "then switch to the --index-profile's query settings and wait for indexing to "
+            "settle once every object is in"
+        ),
+    )
+    parser.add_argument(
+        "--bulk-load-profile",
+        type=str,
+        default=BULK_LOAD_PROFILE,
+        help="Index profile a bulk load builds the collection with",
+    )
+    parser.add_argument(
+        "--compression",
+        choices=COMPRESSION_PROFILES,
+        default=COMPRESSION,
+        help=(
+            "Vector compression of a newly created collection: none, pq (product "
+            "quantization) or bq (binary quantization); compare them with "
+            "benchmark_compression.py"
+        ),
+    )
+    parser.add_argument(
+        "--pq-segments",
+        type=int,
+        default=PQ_SEGMENTS,
+        help="PQ segments per vector (must divide the embedding dimension)",
+    )
+    parser.add_argument(
+        "--pq-centroids",
+        type=int,
+        default=PQ_CENTROIDS,
+        help="PQ centroids per segment",
+    )
+    parser.add_argument(
+        "--pq-training-limit",
+        type=int,
+        default=PQ_TRAINING_LIMIT,
+        help="Objects inserted before PQ is trained and vectors are compressed",
+    )
+    parser.add_argument(
+        "--bq-rescore-limit",
+        type=int,
+        default=BQ_RESCORE_LIMIT,
+        help="BQ candidates re-ranked with the uncompressed vectors",
+    )
+    parser.add_argument(
+        "--multi-tenancy",
+        action="store_true",
+        help=(
+            "Ingest each Cap3D split of the source into its own tenant (e.g. split_00 for "
+            "compressed_imgs_perobj_00.zip) of a multi-tenant collection, filling the "
+            "tenants in parallel"
+        ),
+    )
+    parser.add_argument(
+        "--tenants",
+        type=str,
+        nargs="+",
+        default=None,
+        help="Tenants the tenants command lists or changes (default: every tenant)",
+    )
+    parser.add_argument(
+        "--set-tenant-activity",
+        choices=sorted(TENANT_ACTIVITIES),
+        default=None,
+        help=(
+            "Activity the tenants command sets the --tenants to: inactive tenants are "
+            "unloaded from memory, offloaded ones moved to cloud storage (needs the "
+            "offload-s3 module)"
+        ),
+    )
+    parser.add_argument(
+        "--delta",
+        action="store_true",
+        help=(
+            "Keep the existing collection, upsert only new or changed objects and delete "
+            "objects whose folders have disappeared since the last ingest"
+        ),
+    )
+    parser.add_argument(
+        "--hash-contents",
+        action="store_true",
+        help="Include view file contents, not just sizes and mtimes, in change detection",
+    )
+    parser.add_argument(
+        "--ledger-path",
+        type=str,
+        default=LEDGER_PATH,
+        help="Path to the SQLite checkpoint ledger",
+    )
+    parser.add_argument(
+        "--active-collections-path",
+        type=str,
+        default=str(ACTIVE_COLLECTIONS_PATH),
+        help="YAML file recording which version of the collection reindex made active",
+    )
+    parser.add_argument(
+        "--no-alias",
+        action="store_true",
+        help=(
+            "Cut a reindex over by updating the active-collections file only, for servers "
+            "or clients without collection aliases"
+        ),
+    )
+    parser.add_argument(
+        "--max-count-drop",
+        type=float,
+        default=REINDEX_MAX_COUNT_DROP,
+        help="Fail a reindex with fewer objects than this fraction below the current version",
+    )
+    parser.add_argument(
+        "--min-spot-check-recall",
+        type=float,
+        default=REINDEX_MIN_SPOT_CHECK_RECALL,
+        help="Fail a reindex if fewer sampled objects retrieve themselves",
+    )
+    parser.add_argument(
+        "--grace-period-hours",
+        type=float,
+        default=GRACE_PERIOD_S / 3600,
+        help="Keep versions replaced by a reindex this long before deleting them",
+    )
+    parser.add_argument(
+        "--fake-weaviate",
+        action="store_true",
+        help=(
+            "Upload into an in-process stand-in for Weaviate instead of the server, e.g. to "
+            "measure ingest throughput offline (nothing is persisted)"
+        ),
+    )
+    parser.add_argument(
+        "--dead-letter-path",
+        type=str,
+        default=DEAD_LETTER_PATH,
+        help="Path to the SQLite store of objects that failed to upload",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        default=METRICS_PORT,
+        help=f"Port of the local metrics endpoint (http://{METRICS_HOST}:<port>/metrics)",
+    )
+    parser.add_argument(
+        "--no-metrics-server",
+        action="store_true",
+        help="Do not serve metrics over HTTP",
+    )
+    parser.add_argument(
+        "--metrics-jsonl",
+        type=str,
+        default=METRICS_JSONL_PATH,
+        help="Also append a snapshot of the metrics to this JSONL file periodically",
+    )
+    parser.add_argument(
+        "--embedding-cache-dir",
+        type=str,
+        default=EMBEDDING_CACHE_DIR,
+        help="Directory of the on-disk view embedding cache",
+    )
+    parser.add_argument(
+        "--no-embedding-cache",
+        action="store_true",
+        help="Encode every view, without reading or writing the embedding cache",
+    )
+    parser.add_argument(
+        "--encoder-processes",
+        type=int,
+        default=ENCODER_PROCESSES,
+        help=(
+            "Number of CLIP encoder processes (0 to encode in-process; by default the "
+            "available CPUs are divided by --encoder-threads)"
+        ),
+    )
+    parser.add_argument(
+        "--encoder-threads",
+        type=int,
+        default=None,
+        help=(
+            "Intra-op threads per encoder process, or of the in-process encoder with "
+            f"--encoder-processes 0 (default {ENCODER_THREADS_PER_PROCESS} per process, "
+            "or the backend's own default in-process)"
+        ),
+    )
+    parser.add_argument(
+        "--pin-cpus",
+        action="store_true",
+        default=PIN_ENCODER_CPUS,
+        help="Pin each encoder process to its own set of CPUs",
+    )
+    parser.add_argument(
+        "--quantize-encoder",
+        action="store_true",
+        default=QUANTIZE_ENCODER,
+        help=(
+            "Run CLIP with dynamically quantized int8 linear layers on CPU "
+            "(check its accuracy with check_encoder_parity.py)"
+        ),
+    )
+    parser.add_argument(
+        "--encoder-backend",
+        choices=["torch", "onnx"],
+        default=ENCODER_BACKEND,
+        help=(
+            "torch: eager PyTorch (default); onnx: ONNX Runtime, exporting the model to "
+            "ONNX on first use"
+        ),
+    )
+    parser.add_argument(
+        "--encoder-inter-op-threads",
+        type=int,
+        default=ENCODER_INTER_OP_THREADS,
+        help="Inter-op threads per encoder process",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=BATCH_SIZE,
+        help="Views per CLIP forward pass",
+    )
+    parser.add_argument(
+        "--buffer-size",
+        type=int,
+        default=BUFFER_SIZE,
+        help="Objects per insert_many request",
+    )
+    parser.add_argument(
+        "--decode-workers",
+        type=int,
+        default=DECODE_WORKERS,
+        help="Threads reading and decoding view images",
+    )
+    parser.add_argument(
+        "--upload-concurrency",
+        type=int,
+        default=UPLOAD_CONCURRENCY,
+        help="Concurrent insert_many requests",
+    )
+    parser.add_argument(
+        "--calibration-objects",
+        type=int,
+        default=CALIBRATION_OBJECTS,
+        help="Objects ingested by each calibration trial",
+    )
+    parser.add_argument(
+        "--memory-budget-gb",
+        type=float,
+        default=None,
+        help=(
+            "Peak memory allowed during calibration "
+            f"(default: {CALIBRATION_MEMORY_FRACTION:.0%} of physical memory)"
+        ),
+    )
+
+    parser.add_argument(
+        "--view-filter",
+        action="store_true",
+        default=VIEW_FILTER,
+        help="Skip encoding blank and near-duplicate views",
+    )
+    parser.add_argument(
+        "--min-foreground-coverage",
+        type=float,
+        default=MIN_FOREGROUND_COVERAGE,
+        help="Fraction of opaque pixels below which a view is blank",
+    )
+    parser.add_argument(
+        "--max-hash-distance",
+        type=int,
+        default=MAX_HASH_DISTANCE,
+        help=(
+            "Difference-hash bits within which two views of an object are near-duplicates "
+            "(negative: keep duplicates)"
+        ),
+    )
+    parser.add_argument(
+        "--embedding-recipe",
+        choices=["mean", "mosaic"],
+        default=EMBEDDING_RECIPE,
+        help=(
+            "mean: average the embeddings of every view (default); "
+            "mosaic: embed a grid of views with a single CLIP pass per object"
+        ),
+    )
+    parser.add_argument(
+        "--mosaic-grid-size",
+        type=int,
+        default=MOSAIC_GRID_SIZE,
+        help="Views along each side of the mosaic",
+    )
+    parser.add_argument(
+        "--early-stopping",
+        action="store_true",
+        default=EARLY_STOPPING,
+        help="Stop encoding an object's views once their running mean settles",
+    )
+    parser.add_argument(
+        "--min-views",
+        type=int,
+        default=MIN_VIEWS,
+        help="Views encoded per object before early stopping may stop",
+    )
+    parser.add_argument(
+        "--convergence-threshold",
+        type=float,
+        default=CONVERGENCE_THRESHOLD,
+        help="Cosine change of the running mean below which early stopping stops",
+    )
+    parser.add_argument(
+        "--evaluation-objects",
+        type=int,
+        default=VIEW_FILTER_EVALUATION_OBJECTS,
+        help="Objects sampled by evaluate-view-filter",
+    )
+
+    config: Dict[str, Any] = load_config(config_args.config)
+    ingest_config: Dict[str, Any] = config.get("ingest") or {}
+
+    option_names: Set[str] = {action.dest for action in parser._actions}
+    unknown_options: Set[str] = set(ingest_config) - option_names
+    if unknown_options:
+        parser.error(
+            f"Unknown options in the ingest section of {config_args.config}: "
+            f"{sorted(unknown_options)}"
+        )
+    parser.set_defaults(**ingest_config)
+
+    args: argparse.Namespace = parser.parse_args()
+
+    # Fail before any existing collection is dropped and recreated
+    index_types: Dict[str, str] = {}
+    for index_profile_name in [args.index_profile] + (
+        [args.bulk_load_profile] if args.bulk_load else []
+    ):
+        if index_profile_name is None:
+            index_types[index_profile_name] = "hnsw"
+            continue
+
+        try:
+            index_profile: Dict[str, Any] = load_index_profile(
+                index_profile_name, args.index_profiles_path
+            )
+        except ValueError as error:
+            parser.error(str(error))
+
+        index_types[index_profile_name] = index_profile["type"]
+        if index_profile["type"] == "flat" and args.compression == "pq":
+            parser.error(
+                f"Index profile {index_profile_name!r} is a flat index, which does not "
+                "support PQ compression"
+            )
+
+    if args.multi_tenancy or args.command == "tenants":
+        if args.fake_weaviate:
+            parser.error("multi-tenancy needs a Weaviate server, not --fake-weaviate")
+        if args.delta:
+            parser.error(
+                "--delta cannot find the tenants of removed objects, so it does not "
+                "support --multi-tenancy"
+            )
+        if args.command == "reindex":
+            parser.error("reindex does not support --multi-tenancy")
+    if args.command == "tenants" and args.set_tenant_activity and not args.tenants:
+        parser.error("--set-tenant-activity needs the --tenants to change")
+
+    if args.command == "reindex":
+        if args.fake_weaviate:
+            parser.error("reindex needs a Weaviate server, not --fake-weaviate")
+        if args.delta:
+            parser.error("reindex builds a new collection, so it cannot be a --delta")
+
+    if args.bulk_load:
+        if args.fake_weaviate:
+            parser.error("--bulk-load needs a Weaviate server, not --fake-weaviate")
+        if len(set(index_types.values())) > 1:
+            parser.error(
+                "--bulk-load cannot switch between flat and HNSW indexes: "
+                f"{args.bulk_load_profile!r} is {index_types[args.bulk_load_profile]}, "
+                f"the production index is {index_types[args.index_profile]}"
+            )
+
+    return args, config
+
+
+def connect_to_weaviate(
+    http_host: str = HTTP_HOST,
+    http_port: int = HTTP_PORT,
+    http_secure: bool = HTTP_SECURE,
+    grpc_host: str = GRPC_HOST,
+    grpc_port: int = GRPC_PORT,
+    grpc_secure: bool = GRPC_SECURE,
+    init_timeout_s: float = INTIALISATION_TIMEOUT_S,
+    query_timeout_s: float = QUERY_TIMEOUT_S,
+    insert_timeout_s: float = INSERT_TIMEOUT_S,
+) -> weaviate.WeaviateClient:
+    """
+    Create a client for the Weaviate server, to be used as a context manager.
+
+    The arguments can be overridden by the `weaviate` section of the config file.
+    """
+    return weaviate.WeaviateClient(
+        connection_params=ConnectionParams.from_params(
+            http_host=http_host,
+            http_port=http_port,
+            http_secure=http_secure,
+            grpc_host=grpc_host,
+            grpc_port=grpc_port,
+            grpc_secure=grpc_secure,
+        ),
+        additional_config=AdditionalConfig(
+            timeout=Timeout(
+                init=init_timeout_s,
+                query=query_timeout_s,
+                insert=insert_timeout_s,
+            ),  # Values in seconds
+        ),
+    )
+
+
+def open_encoder(
+    stack: contextlib.ExitStack,
+    encoder_processes: Optional[int],
+    encoder_threads: Optional[int],
+    pin_cpus: bool = PIN_ENCODER_CPUS,
+    quantize: bool = QUANTIZE_ENCODER,
+    backend: str = ENCODER_BACKEND,
+    inter_op_threads: int = ENCODER_INTER_OP_THREADS,
+) -> Tuple[ViewEncoder, int]:
+    """
+    Load the CLIP model, either in-process (`encoder_processes == 0`) or replicated across
+    encoder processes (by default, as many as the available CPUs allow), closed with `stack`.
+    `encoder_threads` is the intra-op thread count of each process, or of the in-process model
+    (left to the backend if `None`).
+    With `quantize`, its linear layers are dynamically quantized to int8. With the "onnx"
+    `backend`, it is exported to ONNX (once) and run with ONNX Runtime.
+
+    Returns
+    -------
+    Tuple[ViewEncoder, int]
+        The encoder, and the number of encode-stage threads needed to keep it busy.
+    """
+    if backend == "onnx":
+        # ONNX Runtime is an optional dependency
+        from utils.onnx_encoder import OnnxClipEncoder, export_onnx
+
+        export_onnx(MODEL_NAME, quantize=quantize)
+
+    if encoder_processes == 0:
+        if backend == "onnx":
+            encoder: ViewEncoder = OnnxClipEncoder.from_pretrained(
+                MODEL_NAME,
+                quantize=quantize,
+                intra_op_threads=encoder_threads,
+                inter_op_threads=inter_op_threads,
+            )
+        else:
+            if encoder_threads is not None:
+                torch.set_num_threads(encoder_threads)
+            encoder = ClipImageEncoder.from_pretrained(MODEL_NAME, quantize=quantize)
+        return encoder, ENCODE_WORKERS
+
+    if encoder_threads is None:
+        encoder_threads = ENCODER_THREADS_PER_PROCESS
+    if encoder_processes is None:
+        encoder_processes, encoder_threads = auto_split(
+            threads_per_worker=encoder_threads
+        )
+
+    encoder = stack.enter_context(
+        EncoderPool(
+            MODEL_NAME,
+            num_workers=encoder_processes,
+            threads_per_worker=encoder_threads,
+            pin_cpus=pin_cpus,
+            quantize=quantize,
+            backend=backend,
+            inter_op_threads=inter_op_threads,
+        )
+    )
+
+    # One encode-stage thread per process keeps every process busy
+    return encoder, encoder_processes
+
+
+def new_view_filter(
+    args: argparse.Namespace, metrics: Optional[MetricsRegistry] = None
+) -> ViewFilter:
+    """Create the view filter configured by the command line options."""
+    return ViewFilter(
+        min_coverage=args.min_foreground_coverage,
+        max_hash_distance=args.max_hash_distance,
+        metrics=metrics,
+    )
+
+
+def new_collection_quantizer(args: argparse.Namespace) -> Optional[Any]:
+    """The vector compression configured by the command line options."""
+    return new_quantizer(
+        args.compression,
+        pq_segments=args.pq_segments,
+        pq_centroids=args.pq_centroids,
+        pq_training_limit=args.pq_training_limit,
+        bq_rescore_limit=args.bq_rescore_limit,
+    )
+
+
+def get_or_create_collection(
+    client: weaviate.WeaviateClient,
+    collection_name: str,
+    resume: bool,
+    distance_metric: str = DISTANCE_METRIC,
+    quantizer: Optional[Any] = None,
+    index_profile: Optional[str] = None,
+    index_profiles_path: str = str(INDEX_PROFILES_PATH),
+    drop_upload_collection: bool = True,
+    multi_tenancy: bool = False,
+) -> Tuple[Collection, bool]:
+    """
+    Get the collection to ingest into, dropping and recreating it (with `distance_metric`,
+    `quantizer`, `index_profile` and `multi_tenancy`) unless resuming an existing ingest. The
+    data upload collection is dropped along with it, unless `drop_upload_collection` is
+    `False`.
+
+    Returns
+    -------
+    Tuple[Collection, bool]
+        The collection, and whether it was (re)created empty, which it is when resuming if
+        the collection no longer exists.
+    """
+    if resume and client.collections.exists(collection_name):
+        return client.collections.get(collection_name), False
+
+    client.collections.delete(collection_name)
+    if drop_upload_collection:
         client.collections.delete(DATA_UPLOAD_COLLECTION_NAME)
 
-        cap3d: Collection = create_collection(
-            client=client,
-            collection_name=COLLECTION_NAME,
-            configure_upload_collection=False,
+    collection: Collection = create_collection(
+        client=client,
+        collection_name=collection_name,
+        configure_upload_collection=False,
+        distance_metric=distance_metric,
+        quantizer=quantizer,
+        index_profile=index_profile,
+        index_profiles_path=index_profiles_path,
+        multi_tenancy=multi_tenancy,
+    )
+    if not multi_tenancy:
+        assert collection.aggregate.over_all(total_count=True).total_count == 0
+
+    return collection, True
+
+
+def new_metrics_registry() -> MetricsRegistry:
+    """Create the ingest's metrics registry, with objects/sec and views/sec gauges."""
+    metrics = MetricsRegistry()
+
+    objects = metrics.counter(
+        "ingest_objects", "Objects uploaded or given up on", ["outcome"]
+    )
+    views_uploaded = metrics.counter(
+        "ingest_views_uploaded", "Views of the objects uploaded"
+    )
+    metrics.gauge(
+        "ingest_objects_per_second",
+        "Objects uploaded per second, over a sliding window",
+    ).set_function(Throughput(lambda: objects.value(outcome="uploaded")))
+    metrics.gauge(
+        "ingest_views_per_second", "Views uploaded per second, over a sliding window"
+    ).set_function(Throughput(views_uploaded.total))
+
+    return metrics
+
+
+def record_upload_result(
+    upload_result: UploadResult,
+    ledger: IngestLedger,
+    dead_letters: DeadLetterStore,
+    descriptions_dict: Dict[str, str],
+) -> None:
+    """
+    Record an upload in the ledger, and move its failed objects into the dead-letter store
+    (and its uploaded objects out of it).
+    """
+    ledger.record_uploaded(upload_result.succeeded_objects)
+    ledger.record_failed(upload_result.failures())
+
+    dead_letters.remove(
+        embedded_object.name for embedded_object in upload_result.succeeded_objects
+    )
+    dead_letters.add(
+        upload_result.failures(),
+        attempts=upload_result.attempts,
+        properties=partial(object_properties, descriptions=descriptions_dict),
+    )
+
+
+def ingest(
+    args: argparse.Namespace,
+    client: weaviate.WeaviateClient,
+    stack: contextlib.ExitStack,
+    ledger: IngestLedger,
+    dead_letters: DeadLetterStore,
+    metrics: Optional[MetricsRegistry] = None,
+    collection_name: str = COLLECTION_NAME,
+    rebuild_alongside: bool = False,
+) -> None:
+    """
+    Embed the objects in the source and upload them to the collection `collection_name`.
+    With `rebuild_alongside`, the collection is a new version built while the current one
+    serves, so the data upload collection is left alone.
+    """
+    descriptions_dict = get_latest_descriptions(
+        performing_checksum=PERFORMING_CHECKSUM
+    )  # https://huggingface.co/datasets/tiange/Cap3D/resolve/48903d63859fe3d3f17942bf6d5383eb05dd1775/Cap3D_automated_Objaverse_full.csv?download=true
+    print(len(descriptions_dict))
+
+    source: ObjectSource = stack.enter_context(open_source(args.source))
+
+    cap3d: Collection
+    created: bool
+    cap3d, created = get_or_create_collection(
+        client=client,
+        collection_name=collection_name,
+        resume=args.resume or args.delta,
+        distance_metric=args.distance_metric,
+        quantizer=new_collection_quantizer(args),
+        index_profile=args.bulk_load_profile if args.bulk_load else args.index_profile,
+        index_profiles_path=args.index_profiles_path,
+        drop_upload_collection=not rebuild_alongside,
+        multi_tenancy=args.multi_tenancy,
+    )
+
+    tenant_of: Optional[Callable[[str], str]] = None
+    if args.multi_tenancy:
+        ensure_tenants(cap3d, map(split_tenant_name, source.splits()))
+        tenant_of = partial(object_tenant_name, source)
+        print(f"Ingesting {len(source.splits())} splits into their own tenants")
+
+    already_uploaded: Set[str] = set()
+    change_filter: Optional[ChangeFilter] = None
+
+    if created and (args.resume or args.delta):
+        # Nothing the ledger records as uploaded is in the new collection any more
+        print(
+            f"Collection {collection_name} does not exist, so the ingest starts over "
+            f"instead of {'a delta' if args.delta else 'resuming'}"
+        )
+        ledger.reset()
+        dead_letters.reset()
+    elif args.delta:
+        change_filter = ChangeFilter(ledger.uploaded_fingerprints())
+        print(
+            f"Delta ingest against {len(change_filter.uploaded_fingerprints)} objects"
         )
-        assert cap3d.aggregate.over_all(total_count=True).total_count == 0
+    elif args.resume:
+        already_uploaded = ledger.uploaded_names()
+        print(f"Resuming ingest, skipping {len(already_uploaded)} objects")
+    else:
+        ledger.reset()
+        dead_letters.reset()
 
-        # Load CLIP model
-        model = SentenceTransformer(MODEL_NAME)
+    embedding_cache: Optional[EmbeddingCache] = (
+        None
+        if args.no_embedding_cache
+        else stack.enter_context(
+            EmbeddingCache(
+                args.embedding_cache_dir,
+                # Quantized embeddings differ from fp32 ones (and between backends), so they
+                # are cached apart; fp32 ONNX embeddings match PyTorch's
+                model_name=(
+                    f"{MODEL_NAME}-{args.encoder_backend}-int8"
+                    if args.quantize_encoder
+                    else MODEL_NAME
+                ),
+                preprocessing_version=PREPROCESSING_VERSION,
+                dimension=EMBEDDING_DIMENSION,
+                capacity=EMBEDDING_CACHE_CAPACITY,
+            )
+        )
+    )
 
-        objects_buffer: List[DataObject] = []
-        failed_objects: List[List[int, str]] = []
+    encoder, encode_workers = open_encoder(
+        stack,
+        args.encoder_processes,
+        args.encoder_threads,
+        pin_cpus=args.pin_cpus,
+        quantize=args.quantize_encoder,
+        backend=args.encoder_backend,
+        inter_op_threads=args.encoder_inter_op_threads,
+    )
 
-        for object_idx, object_folder in tqdm(
-            enumerate(path_to_example_objects.iterdir())
+    view_filter: Optional[ViewFilter] = (
+        new_view_filter(args, metrics=metrics) if args.view_filter else None
+    )
+
+    retry_budget = RetryBudget(max_retries=UPLOAD_RETRY_BUDGET)
+    pipeline: Pipeline = build_pipeline(
+        source=source,
+        encoder=encoder,
+        collection=cap3d,
+        descriptions_dict=descriptions_dict,
+        embedding_cache=embedding_cache,
+        change_filter=change_filter,
+        hash_contents=args.hash_contents,
+        encode_workers=encode_workers,
+        retry_budget=retry_budget,
+        metrics=metrics,
+        batch_size=args.batch_size,
+        buffer_size=args.buffer_size,
+        decode_workers=args.decode_workers,
+        upload_concurrency=args.upload_concurrency,
+        view_filter=view_filter,
+        early_stopping=(
+            EarlyStopping(
+                min_views=args.min_views, threshold=args.convergence_threshold
+            )
+            if args.early_stopping
+            else None
+        ),
+        mosaic_grid_size=(
+            args.mosaic_grid_size if args.embedding_recipe == "mosaic" else None
+        ),
+        tenant_of=tenant_of,
+    )
+
+    num_uploaded: int = 0
+    num_upload_failures: int = 0
+    upload_latencies_s: List[float] = []
+
+    start_time_s: float = time.perf_counter()
+    with tqdm(unit="obj") as progress_bar:
+        upload_result: UploadResult
+        for upload_result in pipeline.run(
+            iter_objects(
+                source,
+                skip_names=already_uploaded,
+                interleave_splits=args.multi_tenancy,
+            )
         ):
-            object_description: str = descriptions_dict.get(
-                object_folder.name, ""
-            )  # TODO: Add log if object could not be found, add to tracking list and DO NOT UPLOAD
-
-            object_image_files: List[Path] = [
-                file
-                for file in object_folder.iterdir()
-                if file.suffix == IMAGE_FILE_EXTENSION
-                and IMAGE_FILE_DELIMETER not in file.name
-            ]
+            record_upload_result(upload_result, ledger, dead_letters, descriptions_dict)
 
-            images: List[Image] = [
-                Image.open(object_image) for object_image in object_image_files
-            ]
+            num_uploaded += len(upload_result.succeeded_objects)
+            num_upload_failures += len(upload_result.errors)
+            upload_latencies_s.append(upload_result.latency_s)
+            progress_bar.update(len(upload_result.objects))
+    stream_s: float = time.perf_counter() - start_time_s
 
-            # Average embeddings from each angle before inserting into database
-            try:
-                average_embedding: List[float] = np.mean(
-                    model.encode(images, show_progress_bar=False),
-                    axis=0,
-                ).tolist()
-            except Exception as e:
-                print(f"Numpy exception: {e}")
+    print(
+        f"Uploaded {num_uploaded} objects "
+        f"({num_upload_failures + len(pipeline.failures)} failed)"
+    )
+    print(
+        f"Used {retry_budget.used} of {retry_budget.max_retries} upload retries, "
+        f"{len(dead_letters)} objects in the dead-letter store "
+        f"(re-submit them with `python data_loading.py replay`)"
+    )
+    for stage_failure in pipeline.failures:
+        print(
+            f"Failed in {stage_failure.stage} stage: {stage_failure.name} "
+            f"({stage_failure.error})"
+        )
+
+    if upload_latencies_s:
+        p50_latency_s, p99_latency_s = np.percentile(upload_latencies_s, [50, 99])
+        print(
+            f"insert_many latency over {len(upload_latencies_s)} requests: "
+            f"p50 {p50_latency_s:.3f}s, p99 {p99_latency_s:.3f}s"
+        )
+
+    if change_filter is not None:
+        print(
+            f"Delta ingest: {change_filter.num_new} new, "
+            f"{change_filter.num_changed} changed, "
+            f"{change_filter.num_unchanged} unchanged objects"
+        )
+
+        removed_names: List[str] = find_removed_objects(
+            uploaded_names=change_filter.uploaded_fingerprints,
+            current_names=set(source.object_names()),
+        )
+        deleted_names: List[str] = delete_objects(cap3d, removed_names)
+        ledger.remove(deleted_names)
+
+        print(f"Deleted {len(deleted_names)} of {len(removed_names)} removed objects")
+    if view_filter is not None:
+        views_filtered: Counter = view_filter.views_filtered
+        print(
+            f"View filter saved {views_filtered.total():.0f} CLIP inferences "
+            f"({views_filtered.value(reason='blank'):.0f} blank, "
+            f"{views_filtered.value(reason='duplicate'):.0f} near-duplicate views)"
+        )
+    if args.early_stopping and metrics is not None:
+        views_used: Histogram = metrics.histogram("ingest_views_used", "")
+        if views_used.count():
+            print(
+                f"Early stopping used {views_used.sum() / views_used.count():.1f} views "
+                f"per object on average, skipping "
+                f"{metrics.counter('ingest_views_skipped', '').total():.0f} views"
+            )
+    if embedding_cache is not None:
+        print(
+            f"Embedding cache hit rate: {embedding_cache.hit_rate:.1%} "
+            f"({embedding_cache.hits} hits, {embedding_cache.misses} misses)"
+        )
+
+    if args.bulk_load:
+        finish_bulk_load(args, client, cap3d, num_uploaded, stream_s)
+
+
+def finish_bulk_load(
+    args: argparse.Namespace,
+    client: weaviate.WeaviateClient,
+    collection: Collection,
+    num_uploaded: int,
+    stream_s: float,
+) -> None:
+    """
+    Switch a bulk-loaded collection to the production index settings, wait for indexing to
+    settle, and report the time and throughput of both phases.
+
+    Only the mutable settings (ef, the dynamic-ef bounds, the vector cache and the flat search
+    cutoff) can be switched; the graph keeps the bulk-load profile's build settings.
+    """
+    production_profile: Optional[Dict[str, Any]] = (
+        load_index_profile(args.index_profile, args.index_profiles_path)
+        if args.index_profile is not None
+        else None
+    )
+    bulk_load_settings: Dict[str, Any] = index_settings(
+        load_index_profile(args.bulk_load_profile, args.index_profiles_path)
+    )
+    production_settings: Dict[str, Any] = index_settings(production_profile)
+
+    start_time_s: float = time.perf_counter()
+    applied_settings: Dict[str, Any] = update_mutable_index_settings(
+        collection, production_profile
+    )
+    settle_s: float = wait_for_indexing(client, collection.name)
+    finish_s: float = time.perf_counter() - start_time_s
+
+    print(
+        f"Bulk load: streamed {num_uploaded} objects in {stream_s:.1f}s "
+        f"({num_uploaded / max(stream_s, 1e-9):.1f} objects/s), then applied "
+        f"{args.index_profile or 'default'} index settings {applied_settings} and "
+        f"indexing settled in {finish_s:.1f}s ({settle_s:.1f}s waiting); "
+        f"{num_uploaded / max(stream_s + finish_s, 1e-9):.1f} objects/s overall"
+    )
+
+    build_differences: List[str] = [
+        f"{option}={bulk_load_settings[option]} (production: {value})"
+        for option, value in production_settings.items()
+        if option != "type"
+        and option not in MUTABLE_INDEX_OPTIONS[production_settings["type"]]
+        and bulk_load_settings.get(option) != value
+    ]
+    if build_differences:
+        print(
+            "The index keeps the bulk-load build settings "
+            f"{', '.join(build_differences)}, which cannot be changed once built"
+        )
+
+
+def _versioned_path(path: str, collection_name: str) -> str:
+    """The path of a collection version's own ledger or dead-letter store."""
+    root, extension = os.path.splitext(path)
+
+    return f"{root}.{collection_name}{extension}"
+
+
+def reindex(
+    args: argparse.Namespace,
+    client: weaviate.WeaviateClient,
+    stack: contextlib.ExitStack,
+    ledger: IngestLedger,
+    dead_letters: DeadLetterStore,
+    metrics: Optional[MetricsRegistry] = None,
+) -> None:
+    """
+    Build the source into a new version of the collection while the current one keeps
+    serving, verify its object count and a recall spot-check, then cut over to it and delete
+    versions replaced more than the grace period ago (see `utils.reindex`).
+
+    The new version has its own ledger and dead-letter store until the cut-over, when they
+    replace `ledger` and `dead_letters`. With `--resume`, an interrupted or unverified
+    version newer than the active one is resumed instead of starting another; other versions
+    that were never promoted are retired, so they are deleted after the grace period too.
+    """
+    live_name: str = resolve_collection_name(
+        COLLECTION_NAME, args.active_collections_path
+    )
+    versions: Dict[int, str] = collection_versions(client, COLLECTION_NAME)
+    live_version: int = next(
+        (version for version, name in versions.items() if name == live_name), 0
+    )
+    latest_version: int = max(versions, default=0)
+
+    version: int = (
+        latest_version
+        if args.resume and latest_version > live_version
+        else latest_version + 1
+    )
+    collection_name: str = versioned_name(COLLECTION_NAME, version)
+    print(f"Reindexing into {collection_name} while {live_name} keeps serving")
+
+    # Versions left by earlier runs that were never promoted are garbage-collected like
+    # replaced ones
+    abandoned_names: List[str] = retire(
+        COLLECTION_NAME,
+        [
+            name
+            for name in versions.values()
+            if name not in (live_name, collection_name)
+        ],
+        state_path=args.active_collections_path,
+    )
+    if abandoned_names:
+        print(
+            f"Retired unpromoted versions {', '.join(abandoned_names)}, to be deleted "
+            f"after the grace period"
+        )
+
+    build_ledger: IngestLedger = stack.enter_context(
+        IngestLedger(_versioned_path(args.ledger_path, collection_name))
+    )
+    build_dead_letters: DeadLetterStore = stack.enter_context(
+        DeadLetterStore(_versioned_path(args.dead_letter_path, collection_name))
+    )
+    ingest(
+        args,
+        client,
+        stack,
+        build_ledger,
+        build_dead_letters,
+        metrics=metrics,
+        collection_name=collection_name,
+        rebuild_alongside=True,
+    )
+
+    # Verify the new version before any query can reach it
+    wait_for_indexing(client, collection_name)
+    collection: Collection = client.collections.get(collection_name)
+    num_objects: int = collection.aggregate.over_all(total_count=True).total_count
+    num_expected: int = len(build_ledger.uploaded_names())
+    num_live: int = (
+        client.collections.get(live_name)
+        .aggregate.over_all(total_count=True)
+        .total_count
+        if client.collections.exists(live_name)
+        else 0
+    )
+    recall: float = spot_check_recall(collection)
+    print(
+        f"{collection_name} holds {num_objects} objects ({num_expected} recorded as "
+        f"uploaded, {num_live} in {live_name}), spot-check recall {recall:.3f}"
+    )
+
+    problems: List[str] = []
+    if num_objects != num_expected:
+        problems.append(
+            f"it holds {num_objects} objects, but {num_expected} were uploaded"
+        )
+    if num_objects < (1 - args.max_count_drop) * num_live:
+        problems.append(
+            f"it holds {num_objects} objects, more than {args.max_count_drop:.1%} fewer "
+            f"than the {num_live} of {live_name}"
+        )
+    if recall < args.min_spot_check_recall:
+        problems.append(
+            f"only {recall:.1%} of sampled objects retrieve themselves "
+            f"(minimum {args.min_spot_check_recall:.1%})"
+        )
+    if problems:
+        print(
+            f"Not cutting over to {collection_name}: {'; '.join(problems)}. "
+            f"{live_name} keeps serving; fix the problem and run `reindex --resume`, or "
+            f"delete {collection_name}"
+        )
+        return
+
+    pointer: str = promote(
+        client,
+        COLLECTION_NAME,
+        collection_name,
+        state_path=args.active_collections_path,
+        use_alias=not args.no_alias,
+    )
+    ledger.replace_with(build_ledger.path)
+    dead_letters.replace_with(build_dead_letters.path)
+    print(f"{COLLECTION_NAME} now serves {collection_name} (via {pointer})")
+
+    deleted_names: List[str] = garbage_collect(
+        client,
+        COLLECTION_NAME,
+        grace_period_s=args.grace_period_hours * 3600,
+        state_path=args.active_collections_path,
+    )
+    for deleted_name in deleted_names:
+        for path in (args.ledger_path, args.dead_letter_path):
+            for suffix in ("", "-wal", "-shm"):
+                Path(_versioned_path(path, deleted_name) + suffix).unlink(
+                    missing_ok=True
+                )
+    if deleted_names:
+        print(
+            f"Deleted {', '.join(deleted_names)}, replaced more than "
+            f"{args.grace_period_hours:g} hours ago"
+        )
+
+
+def replay(
+    args: argparse.Namespace,
+    client: weaviate.WeaviateClient,
+    stack: contextlib.ExitStack,
+    ledger: IngestLedger,
+    dead_letters: DeadLetterStore,
+    metrics: Optional[MetricsRegistry] = None,
+    collection_name: str = COLLECTION_NAME,
+) -> None:
+    """
+    Re-submit the objects in the dead-letter store, with their stored vectors. With
+    `--multi-tenancy`, each object goes back to the tenant of its split in `--source`.
+    """
+    if not client.collections.exists(collection_name):
+        print(f"Collection {collection_name} does not exist, nothing to replay into")
+        return
+
+    print(f"Replaying {len(dead_letters)} dead letters")
+    collection: Collection = client.collections.get(collection_name)
+
+    # Dead letters do not record their tenant, so it is found from their split in the source
+    tenant_of: Optional[Callable[[str], str]] = None
+    source_names: Optional[Set[str]] = None
+    if args.multi_tenancy:
+        source: ObjectSource = stack.enter_context(open_source(args.source))
+        ensure_tenants(collection, map(split_tenant_name, source.splits()))
+        tenant_of = partial(object_tenant_name, source)
+        source_names = set(source.object_names())
+
+    # Replayed objects carry their own properties, so no descriptions are needed
+    upload_handler: UploadHandler = new_upload_handler(
+        collection,
+        descriptions_dict={},
+        retry_budget=RetryBudget(max_retries=UPLOAD_RETRY_BUDGET),
+        metrics=metrics,
+        buffer_size=args.buffer_size,
+        upload_concurrency=args.upload_concurrency,
+        tenant_of=tenant_of,
+    )
+
+    # Objects missing from the source have no known tenant, so they stay in the store
+    skipped_names: List[str] = []
 
-            # Build the object payload
-            object_uuid: str = generate_uuid5(object_folder.name)
+    def upload_results() -> Iterator[UploadResult]:
+        embedded_object: EmbeddedObject
+        for object_idx, dead_letter in enumerate(dead_letters):
+            embedded_object = dead_letter.embedded_object
+            if source_names is not None and embedded_object.name not in source_names:
+                skipped_names.append(embedded_object.name)
+                continue
 
-            obj: Dict[str, str] = {
-                "description": object_description,
-                "datasetUID": object_uuid,
-            }
+            embedded_object.object_idx = object_idx
+            yield from upload_handler.process(embedded_object)
 
+        yield from upload_handler.flush()
+        upload_handler.close()
+
+    num_uploaded: int = 0
+    with tqdm(unit="obj") as progress_bar:
+        for upload_result in upload_results():
+            record_upload_result(upload_result, ledger, dead_letters, {})
+
+            num_uploaded += len(upload_result.succeeded_objects)
+            progress_bar.update(len(upload_result.objects))
+
+    print(
+        f"Replayed {num_uploaded} objects, {len(dead_letters)} still in the dead-letter store"
+    )
+    if skipped_names:
+        print(
+            f"Kept {len(skipped_names)} dead letters whose objects are not in --source, so "
+            f"their tenants are unknown (e.g. {skipped_names[0]}); replay them with the "
+            f"--source they were ingested from"
+        )
+
+
+def manage_tenants(
+    args: argparse.Namespace,
+    client: weaviate.WeaviateClient,
+    collection_name: str = COLLECTION_NAME,
+) -> None:
+    """
+    Set the activity of the `--tenants` of a multi-tenant collection to
+    `--set-tenant-activity`, if given, then list the tenants with their activity and the
+    number of objects in the active ones.
+    """
+    if not client.collections.exists(collection_name):
+        print(f"Collection {collection_name} does not exist, it has no tenants")
+        return
+
+    collection: Collection = client.collections.get(collection_name)
+    if args.set_tenant_activity is not None:
+        set_tenant_activity(collection, args.tenants, args.set_tenant_activity)
+        print(f"Set {', '.join(args.tenants)} to {args.set_tenant_activity}")
+
+    activities: Dict[str, str] = tenant_activities(collection)
+    for tenant_name in sorted(args.tenants or activities):
+        activity: Optional[str] = activities.get(tenant_name)
+        if activity is None:
+            print(f"{tenant_name}: no such tenant")
+            continue
+
+        if activity != "active":
+            print(f"{tenant_name}: {activity}")
+            continue
+
+        num_objects: int = (
+            collection.with_tenant(tenant_name)
+            .aggregate.over_all(total_count=True)
+            .total_count
+        )
+        print(f"{tenant_name}: {activity}, {num_objects} objects")
+
+
+def encoder_candidates(num_cpus: int) -> List[Dict[str, int]]:
+    """Splits of `num_cpus` into encoder processes and threads per process to calibrate."""
+    candidates: List[Dict[str, int]] = []
+
+    for threads_per_encoder in CALIBRATION_THREADS_PER_ENCODER:
+        if threads_per_encoder > num_cpus and candidates:
+            break
+
+        encoder_processes, encoder_threads = auto_split(
+            num_cpus=num_cpus, threads_per_worker=threads_per_encoder
+        )
+        candidates.append(
+            {"encoder_processes": encoder_processes, "encoder_threads": encoder_threads}
+        )
+
+    return candidates
+
+
+def calibrate(
+    args: argparse.Namespace,
+    client: weaviate.WeaviateClient,
+    stack: contextlib.ExitStack,
+    config: Dict[str, Any],
+) -> None:
+    """
+    Tune the throughput settings by ingesting a sample of the source into a scratch
+    collection, and write the best settings to the `ingest` section of the config file.
+    """
+    descriptions_dict = get_latest_descriptions(performing_checksum=PERFORMING_CHECKSUM)
+    source: ObjectSource = stack.enter_context(open_source(args.source))
+    sample: List[Tuple[int, str]] = list(
+        itertools.islice(iter_objects(source), args.calibration_objects)
+    )
+
+    hardware: Dict[str, Any] = hardware_info()
+    memory_budget_mb: Optional[float] = (
+        args.memory_budget_gb * 2**10
+        if args.memory_budget_gb is not None
+        else (
+            hardware["memory_gb"] * 2**10 * CALIBRATION_MEMORY_FRACTION
+            if hardware["memory_gb"] is not None
+            else None
+        )
+    )
+    print(
+        f"Calibrating on {len(sample)} objects"
+        + (f", within {memory_budget_mb:.0f} MiB" if memory_budget_mb else "")
+    )
+
+    # Loading CLIP dominates a trial, so the encoder is only replaced when its settings change
+    encoder_stack: contextlib.ExitStack = stack.enter_context(contextlib.ExitStack())
+    encoder_settings: Optional[Tuple[int, int]] = None
+    encoder: Optional[ViewEncoder] = None
+    encode_workers: int = ENCODE_WORKERS
+
+    def run_trial(settings: Dict[str, Any]) -> TrialResult:
+        nonlocal encoder_settings, encoder, encode_workers
+
+        client.collections.delete(CALIBRATION_COLLECTION_NAME)
+        collection: Collection = create_collection(
+            client=client,
+            collection_name=CALIBRATION_COLLECTION_NAME,
+            configure_upload_collection=False,
+            distance_metric=args.distance_metric,
+            quantizer=new_collection_quantizer(args),
+            index_profile=args.index_profile,
+            index_profiles_path=args.index_profiles_path,
+        )
+
+        start_time_s: float = 0.0
+        num_uploaded: int = 0
+        error: Optional[str] = None
+
+        with RssSampler() as rss_sampler:
             try:
-                objects_buffer.append(
-                    DataObject(
-                        properties=obj,
-                        vector=average_embedding,
-                        uuid=object_uuid,
+                if (
+                    settings["encoder_processes"],
+                    settings["encoder_threads"],
+                ) != encoder_settings:
+                    encoder_stack.close()
+                    encoder_settings = (
+                        settings["encoder_processes"],
+                        settings["encoder_threads"],
                     )
+                    encoder, encode_workers = open_encoder(
+                        encoder_stack,
+                        *encoder_settings,
+                        pin_cpus=args.pin_cpus,
+                        quantize=args.quantize_encoder,
+                        backend=args.encoder_backend,
+                        inter_op_threads=args.encoder_inter_op_threads,
+                    )
+
+                    # Load the model in every encoder process before timing
+                    warm_up_batch: np.ndarray = new_batch_buffer(1)
+                    warm_up_batch.fill(0)
+                    with ThreadPoolExecutor(max_workers=encode_workers) as executor:
+                        list(
+                            executor.map(
+                                encoder.encode_views, [warm_up_batch] * encode_workers
+                            )
+                        )
+
+                pipeline: Pipeline = build_pipeline(
+                    source=source,
+                    encoder=encoder,
+                    collection=collection,
+                    descriptions_dict=descriptions_dict,
+                    encode_workers=encode_workers,
+                    batch_size=settings["batch_size"],
+                    buffer_size=settings["buffer_size"],
+                    decode_workers=settings["decode_workers"],
+                    upload_concurrency=args.upload_concurrency,
                 )
+
+                start_time_s = time.perf_counter()
+                for upload_result in pipeline.run(iter(sample)):
+                    num_uploaded += len(upload_result.succeeded_objects)
+
+                if num_uploaded < len(sample):
+                    error = f"{len(sample) - num_uploaded} objects failed"
+
             except Exception as e:
-                print(e)
-                failed_object_identifier: List[int, str] = [
-                    object_idx,
-                    object_folder.name,
-                ]
-                failed_objects.append(failed_object_identifier)
-                print(failed_object_identifier)
-                print(f"Error appending DataObject to buffer: {e}")
-
-            # Check if the buffer is full
-            if len(objects_buffer) >= BUFFER_SIZE:
-                try:
-                    # Insert into the database
-                    batch_objects_return: BatchObjectReturn = cap3d.data.insert_many(
-                        objects_buffer
-                    )  # Insert in batch
-                except Exception as e:
-                    print(f"Insert many objects exception: {e}")
-
-                # Clear the buffer
-                objects_buffer = []
-
-                # Check for failed inserts
-                if batch_objects_return.has_errors:
-                    errors: Dict[int, ErrorObject] = batch_objects_return.errors
-                    print(f"Failed to upload {len(errors)} objects")
-
-                    for error_object in errors:
-                        print(
-                            f"Failed to upload object with error: {error_object.message}"
-                        )
-                    # TODO: Handle errors
-        # TODO: Check buffer is empty, JSON dump failed_objects
+                encoder_stack.close()
+                encoder_settings = None
+                error = str(e)
+
+        elapsed_s: float = time.perf_counter() - start_time_s if start_time_s else 0.0
+
+        return TrialResult(
+            settings=settings,
+            num_objects=num_uploaded,
+            elapsed_s=elapsed_s,
+            objects_per_second=num_uploaded / elapsed_s if elapsed_s else 0.0,
+            peak_rss_mb=rss_sampler.peak_rss_mb,
+            error=error,
+        )
+
+    initial_settings: Dict[str, Any] = {
+        "encoder_processes": args.encoder_processes,
+        "encoder_threads": args.encoder_threads,
+        "batch_size": args.batch_size,
+        "decode_workers": args.decode_workers,
+        "buffer_size": args.buffer_size,
+    }
+    if initial_settings["encoder_processes"] is None:
+        (
+            initial_settings["encoder_processes"],
+            initial_settings["encoder_threads"],
+        ) = auto_split(
+            threads_per_worker=args.encoder_threads or ENCODER_THREADS_PER_PROCESS
+        )
+
+    try:
+        best_settings, best_trial, trials = coordinate_search(
+            run_trial,
+            initial_settings=initial_settings,
+            search_space=[
+                ("encoder", encoder_candidates(len(available_cpus()))),
+                (
+                    "batch_size",
+                    [{"batch_size": size} for size in CALIBRATION_BATCH_SIZES],
+                ),
+                (
+                    "decode_workers",
+                    [{"decode_workers": num} for num in CALIBRATION_DECODE_WORKERS],
+                ),
+                (
+                    "buffer_size",
+                    [{"buffer_size": size} for size in CALIBRATION_BUFFER_SIZES],
+                ),
+            ],
+            memory_budget_mb=memory_budget_mb,
+        )
+    finally:
+        client.collections.delete(CALIBRATION_COLLECTION_NAME)
+
+    for trial in trials:
+        print(
+            f"{trial.settings}: {trial.objects_per_second:.2f} objects/s, "
+            f"peak RSS {trial.peak_rss_mb:.0f} MiB"
+            + (f" (failed: {trial.error})" if trial.error else "")
+        )
+
+    if best_trial is None:
+        print("No calibration trial succeeded within budget, config left unchanged")
+        return
 
-    except Exception as e:
-        print(f"client operation failed: {e}")
+    config["ingest"] = {**(config.get("ingest") or {}), **best_settings}
+    config["calibration"] = {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "hardware": hardware,
+        "num_objects": len(sample),
+        "memory_budget_mb": (
+            round(memory_budget_mb) if memory_budget_mb is not None else None
+        ),
+        "objects_per_second": round(best_trial.objects_per_second, 2),
+        "peak_rss_mb": round(best_trial.peak_rss_mb, 1),
+        "trials": [trial.to_dict() for trial in trials],
+    }
+    save_config(
+        args.config,
+        config,
+        header=(
+            "Written by `python data_loading.py calibrate`; the ingest section sets the\n"
+            "defaults of the command line options of data_loading.py."
+        ),
+    )
 
     print(
-        "Closing client connection"
-    )  # The connection is closed automatically when the context manager exits
+        f"Best settings {best_settings}: {best_trial.objects_per_second:.2f} objects/s, "
+        f"peak RSS {best_trial.peak_rss_mb:.0f} MiB, written to {args.config}"
+    )
+
+
+def evaluate_view_filter(args: argparse.Namespace, stack: contextlib.ExitStack) -> None:
+    """
+    Encode every view of a sample of objects, and report how many CLIP inferences the view
+    filter would save and how far it would move the objects' pooled embeddings.
+    """
+    source: ObjectSource = stack.enter_context(open_source(args.source))
+    encoder, _ = open_encoder(
+        stack,
+        args.encoder_processes,
+        args.encoder_threads,
+        pin_cpus=args.pin_cpus,
+        quantize=args.quantize_encoder,
+        backend=args.encoder_backend,
+        inter_op_threads=args.encoder_inter_op_threads,
+    )
+    view_filter: ViewFilter = new_view_filter(args)
+
+    num_views: int = 0
+    num_blank: int = 0
+    num_duplicate: int = 0
+    shifts: List[float] = []
+
+    for object_idx, name in tqdm(
+        itertools.islice(iter_objects(source), args.evaluation_objects),
+        total=args.evaluation_objects,
+        unit="obj",
+    ):
+        object_views: Optional[ObjectViews] = decode_views(
+            scan_object(object_idx, name, source=source)
+        )
+        if object_views is None:
+            continue
+
+        images: np.ndarray = np.stack(object_views.images)
+        embeddings: np.ndarray = np.concatenate(
+            [
+                encoder.encode_views(
+                    images[batch_start : batch_start + args.batch_size]
+                )
+                for batch_start in range(0, len(images), args.batch_size)
+            ]
+        )
+        selection: ViewSelection = view_filter.select(images)
+
+        num_views += len(images)
+        num_blank += selection.num_blank
+        num_duplicate += selection.num_duplicate
+        shifts.append(embedding_shift(embeddings, selection.kept_idxs))
+
+    if not shifts:
+        print("No objects with views to evaluate")
+        return
+
+    print(
+        f"View filter over {len(shifts)} objects would save "
+        f"{num_blank + num_duplicate} of {num_views} CLIP inferences "
+        f"({(num_blank + num_duplicate) / num_views:.1%}): "
+        f"{num_blank} blank, {num_duplicate} near-duplicate views"
+    )
+    p50_shift, p95_shift = np.percentile(shifts, [50, 95])
+    print(
+        "Cosine distance between the pooled embeddings with and without the filter: "
+        f"mean {np.mean(shifts):.5f}, p50 {p50_shift:.5f}, p95 {p95_shift:.5f}, "
+        f"max {np.max(shifts):.5f}"
+    )
+
+
+def main():
+    args, config = parse_args()
+
+    if args.command == "evaluate-view-filter":
+        # Runs offline, so it needs no Weaviate server
+        with contextlib.ExitStack() as stack:
+            evaluate_view_filter(args, stack)
+        return
+
+    with (
+        FakeWeaviateClient()
+        if args.fake_weaviate
+        else connect_to_weaviate(**(config.get("weaviate") or {}))
+    ) as client, contextlib.ExitStack() as stack:
+        assert client.is_live(), "Weaviate client is not live"
+        print("Client connection established")
+
+        ledger: IngestLedger = stack.enter_context(IngestLedger(args.ledger_path))
+        dead_letters: DeadLetterStore = stack.enter_context(
+            DeadLetterStore(args.dead_letter_path)
+        )
+
+        metrics: MetricsRegistry = new_metrics_registry()
+        if not args.no_metrics_server:
+            stack.enter_context(
+                MetricsServer(metrics, host=METRICS_HOST, port=args.metrics_port)
+            )
+            print(
+                f"Serving metrics on http://{METRICS_HOST}:{args.metrics_port}/metrics"
+            )
+        if args.metrics_jsonl is not None:
+            stack.enter_context(
+                JsonlMetricsWriter(
+                    metrics, args.metrics_jsonl, interval_s=METRICS_SNAPSHOT_INTERVAL_S
+                )
+            )
+
+        # After a reindex, the collection is whichever version was last made active
+        collection_name: str = resolve_collection_name(
+            COLLECTION_NAME, args.active_collections_path
+        )
+
+        try:
+            if args.command == "replay":
+                replay(
+                    args,
+                    client,
+                    stack,
+                    ledger,
+                    dead_letters,
+                    metrics=metrics,
+                    collection_name=collection_name,
+                )
+            elif args.command == "reindex":
+                reindex(args, client, stack, ledger, dead_letters, metrics=metrics)
+            elif args.command == "tenants":
+                manage_tenants(args, client, collection_name=collection_name)
+            elif args.command == "calibrate":
+                calibrate(args, client, stack, config)
+            elif collection_name != COLLECTION_NAME and not (args.resume or args.delta):
+                # A full ingest drops and recreates its collection, which here is serving
+                print(
+                    f"{collection_name} is the active version of {COLLECTION_NAME}, and a "
+                    f"full ingest would delete it with no way to roll back. Rebuild it with "
+                    f"`python data_loading.py reindex`, or add --resume or --delta"
+                )
+            else:
+                ingest(
+                    args,
+                    client,
+                    stack,
+                    ledger,
+                    dead_letters,
+                    metrics=metrics,
+                    collection_name=collection_name,
+                )
+
+        except Exception as e:
+            print(f"client operation failed: {e}")
+
+        print(
+            "Closing client connection"
+        )  # The connection is closed automatically when the context manager exits
+
+
+if __name__ == "__main__":
+    main()
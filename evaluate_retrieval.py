@@ -0,0 +1,235 @@
+"""
+Text-to-object retrieval evaluation of the object-embedding recipes.
+
+Embeds a held-out sample of objects from a split with each recipe, embeds their Cap3D captions
+with CLIP's text tower, and reports how well each caption retrieves its own object among the
+sample (recall@k, mean reciprocal rank and median rank), together with the CLIP forward passes
+and encode time each recipe needed. Recipes are:
+
+- `mean`: the mean of every view's embedding, as ingested by default.
+- `mosaic<N>`: the embedding of an NxN mosaic of views (see `utils.mosaic`), e.g. `mosaic2`.
+
+Results are saved as JSON, so the recipe for each split (`--embedding-recipe` of
+`data_loading.py`) can be chosen by comparing them.
+
+Usage:
+    ```bash
+    python evaluate_retrieval.py --source compressed_imgs_perobj_00.zip
+    ```
+"""
+
+import argparse
+import json
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from tqdm import tqdm
+
+from data_loading import (
+    BATCH_SIZE,
+    MODEL_NAME,
+    PATH_TO_EXAMPLE_OBJECTS,
+    PERFORMING_CHECKSUM,
+)
+from utils.checksum import sha256_hash
+from utils.descriptions import get_latest_descriptions
+from utils.encoders import ClipImageEncoder
+from utils.ingest import ObjectViews, decode_views, pool_embeddings, scan_object
+from utils.mosaic import mosaic_view_idxs, tile_views
+from utils.retrieval import retrieval_metrics
+from utils.sources import ObjectSource, open_source
+
+EVALUATION_DIR = Path("benchmarks") / "evaluations"
+
+NUM_OBJECTS = 500
+RECIPES = ["mean", "mosaic2", "mosaic3"]
+
+
+def mosaic_grid_size(recipe: str) -> Optional[int]:
+    """The grid size of a `mosaic<N>` recipe, or `None` for the `mean` recipe."""
+    if recipe == "mean":
+        return None
+    if recipe.startswith("mosaic") and recipe[len("mosaic") :].isdigit():
+        return int(recipe[len("mosaic") :])
+
+    raise ValueError(f"Unknown embedding recipe: {recipe!r}")
+
+
+def held_out_names(
+    source: ObjectSource, descriptions: Dict[str, str], num_objects: int
+) -> List[str]:
+    """
+    A deterministic pseudo-random sample of the captioned objects in a source, ordered by the
+    hash of their names so the same objects are chosen on every run.
+    """
+    return sorted(
+        (name for name in source.object_names() if descriptions.get(name)),
+        key=lambda name: sha256_hash(name.encode()),
+    )[:num_objects]
+
+
+def _encode(
+    encoder: ClipImageEncoder, images: np.ndarray, batch_size: int
+) -> np.ndarray:
+    return np.concatenate(
+        [
+            encoder.encode_views(images[batch_start : batch_start + batch_size])
+            for batch_start in range(0, len(images), batch_size)
+        ]
+    )
+
+
+def embed_objects(
+    source: ObjectSource,
+    names: Sequence[str],
+    encoder: ClipImageEncoder,
+    recipes: Sequence[str],
+    batch_size: int = BATCH_SIZE,
+) -> Tuple[List[str], Dict[str, Dict[str, Any]]]:
+    """
+    Embed objects with every recipe, skipping objects without views.
+
+    Returns
+    -------
+    Tuple[List[str], Dict[str, Dict[str, Any]]]
+        The names of the objects embedded and, for each recipe, the object `embeddings` (in the
+        same order), and the number of `forward_passes` (views or mosaics encoded) and
+        `encode_s` seconds they took.
+    """
+    embedded_names: List[str] = []
+    embedded: Dict[str, Dict[str, Any]] = {
+        recipe: {"embeddings": [], "forward_passes": 0, "encode_s": 0.0}
+        for recipe in recipes
+    }
+
+    for object_idx, name in enumerate(tqdm(names, unit="obj")):
+        object_views: Optional[ObjectViews] = decode_views(
+            scan_object(object_idx, name, source=source)
+        )
+        if object_views is None:
+            continue
+
+        embedded_names.append(name)
+        images: np.ndarray = np.stack(object_views.images)
+
+        for recipe in recipes:
+            grid_size: Optional[int] = mosaic_grid_size(recipe)
+            recipe_images: np.ndarray = (
+                images
+                if grid_size is None
+                else tile_views(
+                    [images[idx] for idx in mosaic_view_idxs(len(images), grid_size)],
+                    grid_size,
+                )[None]
+            )
+
+            start_time_s: float = time.perf_counter()
+            view_embeddings: np.ndarray = _encode(encoder, recipe_images, batch_size)
+            embedded[recipe]["encode_s"] += time.perf_counter() - start_time_s
+            embedded[recipe]["forward_passes"] += len(recipe_images)
+
+            embedded[recipe]["embeddings"].append(pool_embeddings(view_embeddings))
+
+    for recipe_embedded in embedded.values():
+        recipe_embedded["embeddings"] = np.asarray(
+            recipe_embedded["embeddings"], dtype=np.float32
+        )
+
+    return embedded_names, embedded
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Compare text-to-object retrieval across object-embedding recipes."
+    )
+    parser.add_argument(
+        "--source",
+        type=str,
+        nargs="+",
+        default=[PATH_TO_EXAMPLE_OBJECTS],
+        help="The split to evaluate: a folder of object folders, or Cap3D zip archives",
+    )
+    parser.add_argument("--num-objects", type=int, default=NUM_OBJECTS)
+    parser.add_argument(
+        "--recipes",
+        nargs="+",
+        default=RECIPES,
+        help="Recipes to compare: mean, or mosaic<N> for an NxN mosaic",
+    )
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument(
+        "--output",
+        type=Path,
+        default=None,
+        help=f"Where to save the results (default: under {EVALUATION_DIR})",
+    )
+
+    return parser.parse_args()
+
+
+def main():
+    args: argparse.Namespace = parse_args()
+    for recipe in args.recipes:
+        mosaic_grid_size(recipe)  # Fail on unknown recipes before loading anything
+
+    descriptions: Dict[str, str] = get_latest_descriptions(
+        performing_checksum=PERFORMING_CHECKSUM
+    )
+    encoder: ClipImageEncoder = ClipImageEncoder.from_pretrained(MODEL_NAME)
+
+    with open_source(args.source) as source:
+        names: List[str] = held_out_names(source, descriptions, args.num_objects)
+        print(f"Evaluating {len(names)} held-out objects")
+
+        names, embedded = embed_objects(
+            source, names, encoder, args.recipes, batch_size=args.batch_size
+        )
+
+    query_embeddings: np.ndarray = encoder.encode_texts(
+        [descriptions[name] for name in names]
+    )
+
+    results: Dict[str, Dict[str, float]] = {}
+    for recipe, recipe_embedded in embedded.items():
+        results[recipe] = {
+            **retrieval_metrics(query_embeddings, recipe_embedded["embeddings"]),
+            "forward_passes": recipe_embedded["forward_passes"],
+            "encode_s": recipe_embedded["encode_s"],
+        }
+
+        print(
+            f"{recipe:>10}: "
+            + ", ".join(
+                f"{metric} {value:.3f}"
+                for metric, value in results[recipe].items()
+                if metric.startswith("recall@") or metric == "mrr"
+            )
+            + f", median rank {results[recipe]['median_rank']:.0f}, "
+            f"{results[recipe]['forward_passes']} CLIP passes "
+            f"in {results[recipe]['encode_s']:.1f}s"
+        )
+
+    split: str = "+".join(Path(path).stem for path in args.source)
+    output_path: Path = args.output or (
+        EVALUATION_DIR / f"retrieval-{split}-{time.strftime('%Y%m%dT%H%M%S')}.json"
+    )
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    output_path.write_text(
+        json.dumps(
+            {
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "split": split,
+                "model_name": MODEL_NAME,
+                "num_objects": len(names),
+                "results": results,
+            },
+            indent=2,
+        )
+    )
+    print(f"Saved results to {output_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+"""
+Calibration of the ingest's throughput settings for the machine it runs on.
+
+`coordinate_search` tunes one setting at a time: for each setting in turn, it runs a trial for
+every candidate value (keeping the best values found so far for every other setting), and keeps
+the value with the highest throughput whose peak memory stays within budget. This needs a
+handful of trials per setting rather than one per combination of settings, at the cost of
+missing interactions between settings that are tuned later.
+
+Peak memory is measured by `RssSampler`, which samples the resident set size of this process
+and its child processes (e.g. encoder processes) on a background thread.
+"""
+
+import logging
+import os
+import platform
+import threading
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+SAMPLE_INTERVAL_S = 0.05
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+@dataclass
+class TrialResult:
+    """The outcome of running the ingest once with a set of settings."""
+
+    settings: Dict[str, Any]
+    num_objects: int
+    elapsed_s: float
+    objects_per_second: float
+    peak_rss_mb: float
+    error: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def _rss_bytes(pid: int) -> int:
+    try:
+        resident_pages: str = Path(f"/proc/{pid}/statm").read_text().split()[1]
+    except (OSError, IndexError):
+        return 0
+
+    return int(resident_pages) * _PAGE_SIZE
+
+
+def _child_pids(pid: int) -> List[int]:
+    child_pids: List[int] = []
+
+    try:
+        for task in Path(f"/proc/{pid}/task").iterdir():
+            child_pids.extend(map(int, (task / "children").read_text().split()))
+    except OSError:
+        pass
+
+    return child_pids
+
+
+def process_tree_rss_bytes(pid: Optional[int] = None) -> int:
+    """
+    Resident set size of a process and all of its descendants, in bytes.
+
+    Read from `/proc`, so only available on Linux; returns 0 elsewhere.
+    """
+    pending_pids: List[int] = [os.getpid() if pid is None else pid]
+    rss_bytes: int = 0
+
+    while pending_pids:
+        current_pid: int = pending_pids.pop()
+        rss_bytes += _rss_bytes(current_pid)
+        pending_pids.extend(_child_pids(current_pid))
+
+    return rss_bytes
+
+
+class RssSampler:
+    """
+    Samples the resident set size of this process tree in the background, recording its peak.
+
+    Example:
+        ```python
+        with RssSampler() as rss_sampler:
+            run_ingest()
+
+        print(rss_sampler.peak_rss_mb)
+        ```
+    """
+
+    def __init__(self, interval_s: float = SAMPLE_INTERVAL_S):
+        self.interval_s = interval_s
+        self.peak_rss_bytes: int = 0
+
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def peak_rss_mb(self) -> float:
+        return self.peak_rss_bytes / 2**20
+
+    def _sample(self) -> None:
+        self.peak_rss_bytes = max(self.peak_rss_bytes, process_tree_rss_bytes())
+
+    def _run(self) -> None:
+        while not self._stop_event.wait(self.interval_s):
+            self._sample()
+
+    def __enter__(self) -> "RssSampler":
+        self._sample()
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="rss-sampler", daemon=True
+        )
+        self._thread.start()
+
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._stop_event.set()
+        self._thread.join()
+        self._sample()
+
+
+def hardware_info() -> Dict[str, Any]:
+    """A description of the machine, recorded alongside the settings tuned for it."""
+    info: Dict[str, Any] = {
+        "hostname": platform.node(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "cpu_model": None,
+        "memory_gb": None,
+        "gpu": None,
+    }
+
+    try:
+        for line in Path("/proc/cpuinfo").read_text().splitlines():
+            if line.startswith("model name"):
+                info["cpu_model"] = line.split(":", 1)[1].strip()
+                break
+    except OSError:
+        pass
+
+    try:
+        info["memory_gb"] = round(
+            os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE") / 2**30, 1
+        )
+    except (AttributeError, ValueError, OSError):
+        pass
+
+    try:
+        import torch
+
+        if torch.cuda.is_available():
+            info["gpu"] = torch.cuda.get_device_name(0)
+    except ImportError:
+        pass
+
+    return info
+
+
+def coordinate_search(
+    run_trial: Callable[[Dict[str, Any]], TrialResult],
+    initial_settings: Dict[str, Any],
+    search_space: Sequence[Tuple[str, Sequence[Dict[str, Any]]]],
+    memory_budget_mb: Optional[float] = None,
+    logger: Optional[logging.Logger] = None,
+) -> Tuple[Dict[str, Any], Optional[TrialResult], List[TrialResult]]:
+    """
+    Tune settings one dimension at a time, maximising throughput within a memory budget.
+
+    Parameters
+    ----------
+    run_trial : Callable[[Dict[str, Any]], TrialResult]
+        Runs the ingest with the given settings and measures it.
+    initial_settings : Dict[str, Any]
+        The settings to start from, e.g. the current defaults.
+    search_space : Sequence[Tuple[str, Sequence[Dict[str, Any]]]]
+        The dimensions to tune, in order, each with its candidate values. A candidate may set
+        several settings at once, e.g. `{"encoder_processes": 2, "encoder_threads": 4}`.
+    memory_budget_mb : Optional[float]
+        Trials whose peak RSS exceeds this are never selected.
+    logger : Optional[logging.Logger]
+        Logger for trial results.
+
+    Returns
+    -------
+    Tuple[Dict[str, Any], Optional[TrialResult], List[TrialResult]]
+        The best settings found, the trial that measured them (`None` if no trial succeeded
+        within budget), and every trial run.
+    """
+    logger = logger or logging.getLogger(__name__)
+
+    best_settings: Dict[str, Any] = dict(initial_settings)
+    best_trial: Optional[TrialResult] = None
+    trials: List[TrialResult] = []
+    measured: Dict[Tuple, TrialResult] = {}
+
+    for dimension, candidates in search_space:
+        dimension_best: Optional[TrialResult] = None
+
+        for candidate in candidates:
+            settings: Dict[str, Any] = {**best_settings, **candidate}
+            settings_key: Tuple = tuple(sorted(settings.items()))
+
+            # The best candidate of the previous dimension is re-visited by this one
+            trial: Optional[TrialResult] = measured.get(settings_key)
+            if trial is None:
+                trial = run_trial(settings)
+                measured[settings_key] = trial
+                trials.append(trial)
+
+                logger.info(
+                    "Trial %s: %.2f objects/s, peak RSS %.0f MiB%s",
+                    candidate,
+                    trial.objects_per_second,
+                    trial.peak_rss_mb,
+                    f" (failed: {trial.error})" if trial.error else "",
+                )
+
+            within_budget: bool = (
+                memory_budget_mb is None or trial.peak_rss_mb <= memory_budget_mb
+            )
+            if (
+                trial.error is None
+                and within_budget
+                and (
+                    dimension_best is None
+                    or trial.objects_per_second > dimension_best.objects_per_second
+                )
+            ):
+                dimension_best = trial
+
+        if dimension_best is not None:
+            best_settings = dict(dimension_best.settings)
+            best_trial = dimension_best
+
+        logger.info("Best %s: %s", dimension, best_settings)
+
+    return best_settings, best_trial, trials
@@ -0,0 +1,70 @@
+"""
+Loading and saving the YAML configuration of `data_loading.py` (`configs/data_loading.yml`).
+
+The file has up to three sections, all optional:
+
+- `ingest`: defaults for the command line options of `data_loading.py`, keyed by option name
+  with underscores (e.g. `batch_size`, `decode_workers`). Options given on the command line
+  still take precedence.
+- `weaviate`: connection settings (hosts, ports and timeouts) passed to `connect_to_weaviate`.
+- `calibration`: a record of the `calibrate` run that produced the `ingest` settings.
+
+Example:
+    ```yaml
+    ingest:
+      batch_size: 32
+      decode_workers: 8
+    weaviate:
+      http_host: weaviate.internal
+      insert_timeout_s: 300
+    ```
+"""
+
+import os
+from pathlib import Path
+from typing import Any, Dict, Union
+
+import yaml
+
+
+def load_config(path: Union[str, os.PathLike]) -> Dict[str, Any]:
+    """
+    Load a YAML configuration file.
+
+    Returns
+    -------
+    Dict[str, Any]
+        The configuration, or an empty dictionary if the file is missing or empty.
+
+    Raises
+    ------
+    ValueError
+        If the file does not contain a mapping.
+    """
+    path = Path(path)
+    if not path.exists():
+        return {}
+
+    with path.open(encoding="utf-8") as config_file:
+        config = yaml.safe_load(config_file)
+
+    if config is None:
+        return {}
+    if not isinstance(config, dict):
+        raise ValueError(f"Expected a mapping in {path}, got {type(config).__name__}")
+
+    return config
+
+
+def save_config(
+    path: Union[str, os.PathLike], config: Dict[str, Any], header: str = ""
+) -> None:
+    """Save a configuration as YAML, preceded by `header` as a comment."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    with path.open("w", encoding="utf-8") as config_file:
+        for line in header.splitlines():
+            config_file.write(f"# {line}\n")
+
+        yaml.safe_dump(config, config_file, sort_keys=False)
@@ -0,0 +1,194 @@
+"""
+A persistent, SQLite-backed dead-letter store for objects that failed to upload.
+
+Every object that still fails after its retries is stored with everything needed to upload it
+again without re-embedding it (its vector and properties), along with the last error and the
+number of attempts made so far. The `replay` command of `data_loading.py` re-submits them.
+
+Example:
+    ```python
+    with DeadLetterStore("dead_letters.sqlite") as dead_letters:
+        dead_letters.add(
+            upload_result.failures(),
+            attempts=upload_result.attempts,
+            properties=partial(object_properties, descriptions=descriptions),
+        )
+
+        for dead_letter in dead_letters:
+            ...
+    ```
+"""
+
+import json
+import os
+import sqlite3
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, Iterator, Optional, Tuple, Union
+
+import numpy as np
+
+from utils.ingest import EmbeddedObject
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS dead_letters (
+    name TEXT PRIMARY KEY,
+    uuid TEXT NOT NULL,
+    vector BLOB NOT NULL,
+    properties TEXT NOT NULL,
+    num_views INTEGER NOT NULL,
+    fingerprint TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL,
+    updated_at REAL NOT NULL
+)
+"""
+_COLUMNS = "name, uuid, vector, properties, num_views, fingerprint, error, attempts, updated_at"
+
+
+@dataclass
+class DeadLetter:
+    """An object that failed to upload, with the error it last failed with."""
+
+    embedded_object: EmbeddedObject
+    error: Optional[str]
+    attempts: int
+
+
+class DeadLetterStore:
+    """
+    Stores failed uploads in a local SQLite database until they are replayed.
+
+    Parameters
+    ----------
+    path : Union[str, os.PathLike]
+        Path to the SQLite database file. Created if it does not exist.
+    """
+
+    def __init__(self, path: Union[str, os.PathLike]):
+        self.path = path
+        self.connection: sqlite3.Connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(_SCHEMA)
+        self.connection.commit()
+
+    def __enter__(self) -> "DeadLetterStore":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self.connection.execute("SELECT COUNT(*) FROM dead_letters").fetchone()[
+            0
+        ]
+
+    def __iter__(self) -> Iterator[DeadLetter]:
+        # Materialised up front, so letters can be added and removed while replaying them
+        rows = self.connection.execute(
+            "SELECT name, uuid, vector, properties, num_views, fingerprint, error, attempts "
+            "FROM dead_letters ORDER BY updated_at"
+        ).fetchall()
+
+        for (
+            name,
+            uuid,
+            vector,
+            properties,
+            num_views,
+            fingerprint,
+            error,
+            attempts,
+        ) in rows:
+            yield DeadLetter(
+                embedded_object=EmbeddedObject(
+                    object_idx=-1,
+                    name=name,
+                    uuid=uuid,
+                    vector=np.frombuffer(vector, dtype=np.float32).tolist(),
+                    num_views=num_views,
+                    fingerprint=fingerprint,
+                    properties=json.loads(properties),
+                ),
+                error=error,
+                attempts=attempts,
+            )
+
+    def close(self) -> None:
+        """Close the underlying database connection."""
+        self.connection.close()
+
+    def add(
+        self,
+        failures: Iterable[Tuple[EmbeddedObject, str]],
+        attempts: int,
+        properties: Callable[[EmbeddedObject], Dict[str, str]],
+    ) -> None:
+        """
+        Store failed objects, or update them if they are already stored.
+
+        Parameters
+        ----------
+        failures : Iterable[Tuple[EmbeddedObject, str]]
+            The objects that failed to upload, paired with their error messages.
+        attempts : int
+            The number of upload attempts made for the objects.
+        properties : Callable[[EmbeddedObject], Dict[str, str]]
+            Function building the Weaviate properties of an object.
+        """
+        updated_at: float = time.time()
+
+        with self.connection:
+            self.connection.executemany(
+                "INSERT INTO dead_letters "
+                "(name, uuid, vector, properties, num_views, fingerprint, error, attempts, "
+                "updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET "
+                "vector = excluded.vector, properties = excluded.properties, "
+                "num_views = excluded.num_views, fingerprint = excluded.fingerprint, "
+                "error = excluded.error, attempts = attempts + excluded.attempts, "
+                "updated_at = excluded.updated_at",
+                (
+                    (
+                        embedded_object.name,
+                        embedded_object.uuid,
+                        np.asarray(embedded_object.vector, dtype=np.float32).tobytes(),
+                        json.dumps(properties(embedded_object)),
+                        embedded_object.num_views,
+                        embedded_object.fingerprint,
+                        error,
+                        attempts,
+                        updated_at,
+                    )
+                    for embedded_object, error in failures
+                ),
+            )
+
+    def reset(self) -> None:
+        """Remove every object from the store, e.g. when the collection is rebuilt."""
+        with self.connection:
+            self.connection.execute("DELETE FROM dead_letters")
+
+    def replace_with(self, path: Union[str, os.PathLike]) -> None:
+        """
+        Replace every stored object with those of another store, e.g. once a collection
+        rebuilt alongside the current one (see `utils.reindex`) replaces it.
+        """
+        self.connection.execute("ATTACH DATABASE ? AS other", (str(path),))
+        try:
+            with self.connection:
+                self.connection.execute("DELETE FROM dead_letters")
+                self.connection.execute(
+                    f"INSERT INTO dead_letters ({_COLUMNS}) "
+                    f"SELECT {_COLUMNS} FROM other.dead_letters"
+                )
+        finally:
+            self.connection.execute("DETACH DATABASE other")
+
+    def remove(self, names: Iterable[str]) -> None:
+        """Remove objects from the store, e.g. once they have been uploaded."""
+        with self.connection:
+            self.connection.executemany(
+                "DELETE FROM dead_letters WHERE name = ?", ((name,) for name in names)
+            )
@@ -0,0 +1,134 @@
+"""
+Change detection for incremental (delta) ingests.
+
+A delta ingest compares the fingerprint of every object folder's view files (see
+`utils.ingest.fingerprint_views`) with the fingerprint recorded in the ingest ledger at its last
+successful upload. Only new or changed objects are re-embedded and upserted, and objects whose
+folders have disappeared are deleted from the collection.
+"""
+
+import logging
+import threading
+from typing import Dict, Iterable, List, Optional, Set
+
+from weaviate.classes.query import Filter
+from weaviate.collections import Collection
+from weaviate.util import generate_uuid5
+
+from utils.ingest import ObjectViews
+
+DELETE_CHUNK_SIZE = 1000
+
+
+class ChangeFilter:
+    """
+    Scan-stage filter dropping objects whose view files are unchanged since their last upload.
+
+    Thread-safe, so a single filter can be shared by every scan worker.
+
+    Parameters
+    ----------
+    uploaded_fingerprints : Dict[str, Optional[str]]
+        Fingerprints of the objects recorded as uploaded in the ingest ledger, keyed by name.
+    """
+
+    def __init__(self, uploaded_fingerprints: Dict[str, Optional[str]]):
+        self.uploaded_fingerprints = uploaded_fingerprints
+
+        self.num_new: int = 0
+        self.num_changed: int = 0
+        self.num_unchanged: int = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, object_views: ObjectViews) -> Optional[ObjectViews]:
+        """
+        Return `object_views` if the object is new or changed, otherwise `None`.
+        """
+        uploaded_fingerprint: Optional[str] = self.uploaded_fingerprints.get(
+            object_views.name
+        )
+
+        with self._lock:
+            if object_views.name not in self.uploaded_fingerprints:
+                self.num_new += 1
+                return object_views
+
+            if uploaded_fingerprint != object_views.fingerprint:
+                self.num_changed += 1
+                return object_views
+
+            self.num_unchanged += 1
+            return None
+
+
+def find_removed_objects(
+    uploaded_names: Iterable[str], current_names: Set[str]
+) -> List[str]:
+    """
+    Find the uploaded objects whose folders no longer exist.
+
+    Parameters
+    ----------
+    uploaded_names : Iterable[str]
+        Names of the objects recorded as uploaded in the ingest ledger.
+    current_names : Set[str]
+        Names of the object folders currently present in the dataset.
+
+    Returns
+    -------
+    List[str]
+        Names of the objects to delete from the collection.
+    """
+    return sorted(name for name in uploaded_names if name not in current_names)
+
+
+def delete_objects(
+    collection: Collection,
+    names: List[str],
+    chunk_size: int = DELETE_CHUNK_SIZE,
+    logger: Optional[logging.Logger] = None,
+) -> List[str]:
+    """
+    Delete objects from a collection by name, in chunks of `chunk_size`.
+
+    Object uuids are derived from their names with `generate_uuid5`, as they are on upload.
+
+    Parameters
+    ----------
+    collection : Collection
+        The collection to delete objects from.
+    names : List[str]
+        Names of the objects to delete.
+    chunk_size : int, default DELETE_CHUNK_SIZE
+        Number of objects deleted per request.
+    logger : Optional[logging.Logger]
+        Logger for deletion errors.
+
+    Returns
+    -------
+    List[str]
+        Names of the objects in chunks that were deleted without errors.
+    """
+    logger = logger or logging.getLogger(__name__)
+    deleted_names: List[str] = []
+
+    for chunk_start in range(0, len(names), chunk_size):
+        chunk_names: List[str] = names[chunk_start : chunk_start + chunk_size]
+
+        try:
+            delete_many_return = collection.data.delete_many(
+                where=Filter.by_id().contains_any(
+                    [generate_uuid5(name) for name in chunk_names]
+                )
+            )
+        except Exception as e:
+            logger.error("Delete many objects exception: %s", e)
+            continue
+
+        if delete_many_return.failed:
+            logger.error("Failed to delete %d objects", delete_many_return.failed)
+            continue
+
+        deleted_names.extend(chunk_names)
+
+    return deleted_names
@@ -0,0 +1,95 @@
+"""
+Adaptive early stopping of an object's view encoding.
+
+An object's embedding is the mean of its view embeddings, and that mean often stops changing
+after a handful of views. With early stopping, the encoder embeds an object's views one at a
+time in `diverse_view_order` (so that each new view comes from an angle far from those already
+seen) and stops once adding a view moves the running mean by less than `threshold` in cosine
+distance, having encoded at least `min_views` views. The object's embedding is then the mean of
+the views encoded so far.
+
+The stopping point only depends on the view embeddings, not on how views are batched, so an
+object gets the same embedding in every run.
+"""
+
+from dataclasses import dataclass
+from typing import List, Set
+
+import numpy as np
+
+MIN_VIEWS = 4
+CONVERGENCE_THRESHOLD = 1e-3
+
+
+def _van_der_corput(index: int) -> float:
+    # Reverse the binary digits of `index` after the binary point: 0, 1/2, 1/4, 3/4, 1/8, ...
+    value: float = 0.0
+    denominator: float = 1.0
+
+    while index:
+        denominator *= 2
+        index, digit = divmod(index, 2)
+        value += digit / denominator
+
+    return value
+
+
+def diverse_view_order(num_views: int) -> List[int]:
+    """
+    An order of `num_views` views rendered at evenly spaced angles, in which every view is as
+    far as possible from the views before it (e.g. 0, 10, 5, 15, 2, 12, ... for 20 views).
+    """
+    order: List[int] = []
+    seen: Set[int] = set()
+    index: int = 0
+
+    while len(order) < num_views:
+        view_idx: int = int(_van_der_corput(index) * num_views)
+        index += 1
+
+        if view_idx not in seen:
+            seen.add(view_idx)
+            order.append(view_idx)
+
+    return order
+
+
+@dataclass
+class EarlyStopping:
+    """
+    Decides when enough of an object's views have been encoded.
+
+    Parameters
+    ----------
+    min_views : int, default MIN_VIEWS
+        Minimum number of views to encode before stopping (at least 2).
+    threshold : float, default CONVERGENCE_THRESHOLD
+        Cosine distance between successive running means below which encoding stops.
+    """
+
+    min_views: int = MIN_VIEWS
+    threshold: float = CONVERGENCE_THRESHOLD
+
+    def converged(self, embeddings: np.ndarray) -> bool:
+        """
+        Whether the running mean of an object's view embeddings has settled.
+
+        Parameters
+        ----------
+        embeddings : np.ndarray
+            The embeddings of the views encoded so far, in encoding order.
+        """
+        num_views: int = len(embeddings)
+        if num_views < max(self.min_views, 2):
+            return False
+
+        # The sums are proportional to the means, which is all the cosine needs
+        current_sum: np.ndarray = embeddings.sum(axis=0)
+        previous_sum: np.ndarray = current_sum - embeddings[-1]
+        cosine: float = float(
+            previous_sum
+            @ current_sum
+            / (np.linalg.norm(previous_sum) * np.linalg.norm(current_sum))
+        )
+
+        return 1.0 - cosine < self.threshold
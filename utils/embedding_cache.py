@@ -0,0 +1,322 @@
+"""
+A persistent, size-bounded on-disk cache of view embeddings.
+
+Embeddings are keyed by the SHA-256 hash of the rendered view file's contents together with
+the model name and preprocessing version, so re-ingesting an unchanged dataset (e.g. after a
+schema change or a Weaviate wipe) only costs reading and hashing the view files, not decoding
+and encoding them again.
+
+The embeddings themselves are stored in a memory-mapped float32 array, and an SQLite index maps
+cache keys to rows of that array. The array's file starts small and doubles as the cache fills,
+up to a fixed capacity, so it never takes much more disk than the entries it holds. When the
+cache is full, the least recently used entry is evicted and its row reused. Each row's key digest is stored alongside
+it, so an index row left pointing at a reused row (the index is written in batches) is
+detected as a miss rather than served.
+
+Example:
+    ```python
+    with EmbeddingCache("embedding_cache", model_name="clip-ViT-B-32") as cache:
+        embedding = cache.get(content_hash)
+        if embedding is None:
+            embedding = model.encode(image)
+            cache.put(content_hash, embedding)
+
+        print(f"Cache hit rate: {cache.hit_rate:.1%}")
+    ```
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+EMBEDDING_DIMENSION = 512
+CACHE_CAPACITY = 1_000_000
+INITIAL_ROWS = 16_384  # Rows allocated in the files of a new cache, doubled as it fills
+INDEX_FLUSH_INTERVAL = 1024
+
+KEY_DIGEST_SIZE = 16
+
+EMBEDDINGS_FILE_NAME = "embeddings.f32"
+KEY_DIGESTS_FILE_NAME = "keys.digest"
+INDEX_FILE_NAME = "index.sqlite"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    slot INTEGER NOT NULL,
+    last_used REAL NOT NULL
+);
+"""
+
+
+class EmbeddingCache:
+    """
+    A thread-safe embedding cache backed by a memory-mapped array and an SQLite index.
+
+    Parameters
+    ----------
+    directory : Union[str, os.PathLike]
+        Directory holding the cache files. Created if it does not exist.
+    model_name : str
+        Name of the model producing the embeddings. Part of every cache key.
+    preprocessing_version : int, default 1
+        Version of the image preprocessing. Part of every cache key, so bumping it
+        invalidates embeddings computed with older preprocessing.
+    dimension : int, default EMBEDDING_DIMENSION
+        Dimension of the cached embeddings.
+    capacity : int, default CACHE_CAPACITY
+        Maximum number of embeddings held by the cache. Disk space is allocated as the cache
+        fills, not up front.
+
+    Raises
+    ------
+    ValueError
+        If an existing cache in `directory` was created with a different dimension or capacity.
+    """
+
+    def __init__(
+        self,
+        directory: Union[str, os.PathLike],
+        model_name: str,
+        preprocessing_version: int = 1,
+        dimension: int = EMBEDDING_DIMENSION,
+        capacity: int = CACHE_CAPACITY,
+    ):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        self.key_prefix = f"{model_name}:{preprocessing_version}:"
+        self.dimension = dimension
+        self.capacity = capacity
+
+        self.hits: int = 0
+        self.misses: int = 0
+
+        self._lock = threading.Lock()
+        self._connection: sqlite3.Connection = sqlite3.connect(
+            self.directory / INDEX_FILE_NAME, check_same_thread=False
+        )
+        self._connection.executescript(_SCHEMA)
+        self._check_layout()
+
+        # The key each row was written for, to check index rows against
+        if not (self.directory / KEY_DIGESTS_FILE_NAME).exists():
+            # A cache from before key digests were stored cannot be checked, so it starts over
+            with self._connection:
+                self._connection.execute("DELETE FROM entries")
+
+        self._embeddings: Optional[np.memmap] = None
+        self._key_digests: Optional[np.memmap] = None
+        self._rows: int = 0
+        self._resize(max(self._file_rows(), min(INITIAL_ROWS, capacity)))
+
+        # In-memory LRU index (least recently used first), mirrored to SQLite in batches
+        self._slots: "OrderedDict[str, int]" = OrderedDict(
+            self._connection.execute(
+                "SELECT key, slot FROM entries ORDER BY last_used"
+            ).fetchall()
+        )
+        self._next_slot: int = max(self._slots.values(), default=-1) + 1
+        self._free_slots: List[int] = []
+        self._pending_writes: Dict[str, Tuple[int, float]] = {}
+        self._pending_deletes: List[str] = []
+
+    def _file_rows(self) -> int:
+        # Rows already allocated in the embeddings file of an existing cache
+        embeddings_path: Path = self.directory / EMBEDDINGS_FILE_NAME
+        if not embeddings_path.exists():
+            return 0
+
+        return embeddings_path.stat().st_size // (4 * self.dimension)
+
+    def _resize(self, rows: int) -> None:
+        # The files are extended (never shrunk) to `rows` rows, and the arrays remapped
+        if self._embeddings is not None:
+            self._embeddings.flush()
+            self._key_digests.flush()
+
+        for file_name, row_size in (
+            (EMBEDDINGS_FILE_NAME, 4 * self.dimension),
+            (KEY_DIGESTS_FILE_NAME, KEY_DIGEST_SIZE),
+        ):
+            with open(self.directory / file_name, "ab") as file:
+                if file.tell() < rows * row_size:
+                    file.truncate(rows * row_size)
+
+        self._embeddings = np.memmap(
+            self.directory / EMBEDDINGS_FILE_NAME,
+            dtype=np.float32,
+            mode="r+",
+            shape=(rows, self.dimension),
+        )
+        self._key_digests = np.memmap(
+            self.directory / KEY_DIGESTS_FILE_NAME,
+            dtype=np.uint8,
+            mode="r+",
+            shape=(rows, KEY_DIGEST_SIZE),
+        )
+        self._rows = rows
+
+    @staticmethod
+    def _key_digest(key: str) -> np.ndarray:
+        return np.frombuffer(
+            hashlib.sha256(key.encode()).digest()[:KEY_DIGEST_SIZE], dtype=np.uint8
+        )
+
+    def _check_layout(self) -> None:
+        layout: Dict[str, str] = dict(
+            self._connection.execute("SELECT key, value FROM meta").fetchall()
+        )
+        expected_layout: Dict[str, str] = {
+            "dimension": str(self.dimension),
+            "capacity": str(self.capacity),
+        }
+
+        if not layout:
+            with self._connection:
+                self._connection.executemany(
+                    "INSERT INTO meta (key, value) VALUES (?, ?)",
+                    expected_layout.items(),
+                )
+        elif layout != expected_layout:
+            raise ValueError(
+                f"Embedding cache at '{self.directory}' has layout {layout}, "
+                f"expected {expected_layout}"
+            )
+
+    def __enter__(self) -> "EmbeddingCache":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    @property
+    def hit_rate(self) -> float:
+        """Fraction of lookups served from the cache since it was opened."""
+        lookups: int = self.hits + self.misses
+
+        return self.hits / lookups if lookups else 0.0
+
+    def get(self, content_hash: str) -> Optional[np.ndarray]:
+        """
+        Look up the embedding of a view by the hash of its file contents.
+
+        Parameters
+        ----------
+        content_hash : str
+            SHA-256 hash of the view file's contents.
+
+        Returns
+        -------
+        Optional[np.ndarray]
+            A copy of the cached embedding, or `None` on a cache miss.
+        """
+        key: str = self.key_prefix + content_hash
+
+        with self._lock:
+            slot: Optional[int] = self._slots.get(key)
+            if slot is not None and not np.array_equal(
+                self._key_digests[slot], self._key_digest(key)
+            ):
+                # The row was reused for another key whose index row was never written (the
+                # index is written together with the deletes), so the row is free again
+                del self._slots[key]
+                self._pending_writes.pop(key, None)
+                self._pending_deletes.append(key)
+                self._free_slots.append(slot)
+                slot = None
+
+            if slot is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._slots.move_to_end(key)
+            self._pending_writes[key] = (slot, time.time())
+
+            return np.array(self._embeddings[slot])
+
+    def put(self, content_hash: str, embedding: np.ndarray) -> None:
+        """
+        Store the embedding of a view, evicting the least recently used entry if full.
+
+        Parameters
+        ----------
+        content_hash : str
+            SHA-256 hash of the view file's contents.
+        embedding : np.ndarray
+            The view's embedding, of shape `(dimension,)`.
+        """
+        key: str = self.key_prefix + content_hash
+
+        with self._lock:
+            slot: Optional[int] = self._slots.get(key)
+
+            if slot is None:
+                if self._free_slots:
+                    slot = self._free_slots.pop()
+                elif self._next_slot < self.capacity:
+                    if self._next_slot >= self._rows:
+                        self._resize(min(2 * self._rows, self.capacity))
+                    slot = self._next_slot
+                    self._next_slot += 1
+                else:
+                    evicted_key, slot = self._slots.popitem(last=False)
+                    self._pending_writes.pop(evicted_key, None)
+                    self._pending_deletes.append(evicted_key)
+
+            self._embeddings[slot] = embedding
+            self._key_digests[slot] = self._key_digest(key)
+            self._slots[key] = slot
+            self._slots.move_to_end(key)
+            self._pending_writes[key] = (slot, time.time())
+
+            if len(self._pending_writes) >= INDEX_FLUSH_INTERVAL:
+                self._flush_index()
+
+    def _flush_index(self) -> None:
+        # Embeddings must reach the array before the index rows pointing at them
+        self._embeddings.flush()
+        self._key_digests.flush()
+
+        with self._connection:
+            self._connection.executemany(
+                "DELETE FROM entries WHERE key = ?",
+                ((key,) for key in self._pending_deletes),
+            )
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO entries (key, slot, last_used) VALUES (?, ?, ?)",
+                (
+                    (key, slot, last_used)
+                    for key, (slot, last_used) in self._pending_writes.items()
+                ),
+            )
+
+        self._pending_deletes = []
+        self._pending_writes = {}
+
+    def flush(self) -> None:
+        """Persist all pending index updates and embeddings to disk."""
+        with self._lock:
+            self._flush_index()
+
+    def close(self) -> None:
+        """Flush the cache to disk and release its files."""
+        self.flush()
+        self._connection.close()
+        del self._embeddings
+        del self._key_digests
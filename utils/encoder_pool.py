@@ -0,0 +1,211 @@
+"""
+A pool of CLIP encoder processes for CPU-bound ingests.
+
+PyTorch's intra-op threading scales poorly past a handful of threads at ingest batch sizes, so
+rather than running one model across every core, the pool runs several worker processes, each
+with its own copy of the model and a small, pinned thread budget. Batches are sharded across
+the workers, so throughput scales with the number of cores.
+
+The pool exposes the same `encode_views` interface as `utils.encoders.ClipImageEncoder`, so it
+can be used as a drop-in replacement for the encoder in `utils.ingest.BatchedEncodeHandler`.
+
+Example:
+    ```python
+    num_workers, threads_per_worker = auto_split()
+
+    with EncoderPool("clip-ViT-B-32", num_workers, threads_per_worker) as pool:
+        embeddings = pool.encode_views(views)
+    ```
+"""
+
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from utils.encoders import ViewEncoder
+
+THREADS_PER_WORKER = 4
+
+# Per-process state of an encoder worker, set by `_initialise_worker`
+_worker_encoder: Optional[ViewEncoder] = None
+
+
+def available_cpus() -> List[int]:
+    """The CPUs the current process may run on."""
+    try:
+        return sorted(os.sched_getaffinity(0))
+    except AttributeError:  # Not available on macOS or Windows
+        return list(range(os.cpu_count() or 1))
+
+
+def auto_split(
+    num_cpus: Optional[int] = None, threads_per_worker: int = THREADS_PER_WORKER
+) -> Tuple[int, int]:
+    """
+    Split the available CPUs into encoder worker processes and threads per worker.
+
+    A heuristic: the CPUs are divided by a fixed per-worker thread budget, without measuring
+    anything. `python data_loading.py calibrate` measures the candidate splits instead.
+
+    Parameters
+    ----------
+    num_cpus : Optional[int]
+        Number of CPUs to use. Defaults to every CPU available to the current process.
+    threads_per_worker : int, default THREADS_PER_WORKER
+        Preferred intra-op thread budget of each worker.
+
+    Returns
+    -------
+    Tuple[int, int]
+        The number of worker processes and the number of threads per worker.
+    """
+    num_cpus = num_cpus or len(available_cpus())
+    threads_per_worker = max(1, min(threads_per_worker, num_cpus))
+
+    return max(1, num_cpus // threads_per_worker), threads_per_worker
+
+
+def _initialise_worker(
+    model_name: str,
+    num_threads: int,
+    pin_cpus: bool,
+    quantize: bool,
+    backend: str,
+    inter_op_threads: int,
+    worker_counter: "multiprocessing.sharedctypes.Synchronized",
+) -> None:
+    global _worker_encoder
+
+    with worker_counter.get_lock():
+        worker_idx: int = worker_counter.value
+        worker_counter.value += 1
+
+    if pin_cpus:
+        cpus: List[int] = available_cpus()
+        first_cpu: int = (worker_idx * num_threads) % len(cpus)
+        os.sched_setaffinity(
+            0,
+            {
+                cpus[(first_cpu + cpu_offset) % len(cpus)]
+                for cpu_offset in range(num_threads)
+            },
+        )
+
+    if backend == "onnx":
+        from utils.onnx_encoder import OnnxClipEncoder
+
+        _worker_encoder = OnnxClipEncoder.from_pretrained(
+            model_name,
+            quantize=quantize,
+            intra_op_threads=num_threads,
+            inter_op_threads=inter_op_threads,
+        )
+        return
+
+    import torch
+
+    from utils.encoders import ClipImageEncoder
+
+    torch.set_num_threads(num_threads)
+    torch.set_num_interop_threads(inter_op_threads)
+
+    _worker_encoder = ClipImageEncoder.from_pretrained(model_name, quantize=quantize)
+
+
+def _encode_views(views: np.ndarray) -> np.ndarray:
+    return _worker_encoder.encode_views(views)
+
+
+class EncoderPool(ViewEncoder):
+    """
+    Encodes inputs with a model replicated across several worker processes.
+
+    `encode_views` is thread-safe and blocks until its inputs are encoded, so the pool is fed by
+    calling it from as many threads as there are workers (e.g. one encode-stage worker thread
+    per process).
+
+    Parameters
+    ----------
+    model_name : str
+        Name of the SentenceTransformer CLIP model loaded by every worker.
+    num_workers : int
+        Number of worker processes.
+    threads_per_worker : int, default THREADS_PER_WORKER
+        Number of intra-op threads of each worker.
+    pin_cpus : bool, default False
+        Whether to pin each worker to its own set of `threads_per_worker` CPUs.
+    quantize : bool, default False
+        Whether every worker quantizes its model to int8 (see
+        `utils.encoders.quantize_dynamic_int8`).
+    backend : str, default "torch"
+        Inference backend of the workers: "torch", or "onnx" for ONNX Runtime (see
+        `utils.onnx_encoder`; export the model with `export_onnx` before starting the pool, so
+        the workers do not all export it at once).
+    inter_op_threads : int, default 1
+        Number of inter-op threads of each worker.
+    logger : Optional[logging.Logger]
+        Logger for pool lifecycle events.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        num_workers: int,
+        threads_per_worker: int = THREADS_PER_WORKER,
+        pin_cpus: bool = False,
+        quantize: bool = False,
+        backend: str = "torch",
+        inter_op_threads: int = 1,
+        logger: Optional[logging.Logger] = None,
+    ):
+        self.model_name = model_name
+        self.num_workers = num_workers
+        self.threads_per_worker = threads_per_worker
+        self.logger = logger or logging.getLogger(__name__)
+
+        # Spawn rather than fork, as forking a process with PyTorch threads running is unsafe
+        context = multiprocessing.get_context("spawn")
+
+        self.logger.info(
+            "Starting %d encoder processes with %d threads each",
+            num_workers,
+            threads_per_worker,
+        )
+        self._executor = ProcessPoolExecutor(
+            max_workers=num_workers,
+            mp_context=context,
+            initializer=_initialise_worker,
+            initargs=(
+                model_name,
+                threads_per_worker,
+                pin_cpus,
+                quantize,
+                backend,
+                inter_op_threads,
+                context.Value("i", 0),
+            ),
+        )
+
+    def __enter__(self) -> "EncoderPool":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def encode_views(self, views: np.ndarray) -> np.ndarray:
+        """
+        Embed a batch of views on one of the worker processes.
+
+        The uint8 batch is sent to the worker as is; alpha compositing and normalisation
+        happen on the worker, which keeps inter-process traffic to a quarter of the float32
+        pixel values.
+        """
+        return self._executor.submit(_encode_views, views).result()
+
+    def close(self) -> None:
+        """Shut down the worker processes."""
+        self._executor.shutdown(wait=True)
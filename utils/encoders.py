@@ -0,0 +1,115 @@
+"""
+CLIP encoders used by the ingest pipeline.
+
+`ClipImageEncoder` runs the vision tower of a SentenceTransformer CLIP model directly on
+preprocessed pixel batches (see `utils.preprocessing`), bypassing the per-image preprocessing
+done by `SentenceTransformer.encode`. Its embeddings match those of `SentenceTransformer.encode`
+for the same preprocessed images. It also embeds captions with the model's text tower, for
+evaluating text-to-object retrieval.
+
+On CPU-only hosts, `quantize_dynamic_int8` trades a little accuracy for speed and memory:
+the weights of every linear layer in both towers are stored as int8, and activations are
+quantized on the fly. `check_encoder_parity.py` measures how closely the quantized embeddings
+agree with the fp32 ones.
+"""
+
+from typing import List, Tuple
+
+import numpy as np
+import torch
+from sentence_transformers import SentenceTransformer
+
+from utils.preprocessing import BACKGROUND_COLOUR, to_pixel_values
+
+
+def quantize_dynamic_int8(model: SentenceTransformer) -> SentenceTransformer:
+    """
+    Dynamically quantize the linear layers of a CLIP model's vision and text towers to int8,
+    in place. Quantized layers only run on CPU.
+    """
+    if model.device.type != "cpu":
+        raise ValueError(
+            f"Dynamic int8 quantization needs a model on CPU, not {model.device}"
+        )
+
+    return torch.ao.quantization.quantize_dynamic(
+        model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True
+    )
+
+
+class ViewEncoder:
+    """Interface of the encoders used by the ingest's encode stage."""
+
+    def encode_views(self, views: np.ndarray) -> np.ndarray:
+        """
+        Embed a batch of views.
+
+        Parameters
+        ----------
+        views : np.ndarray
+            A uint8 RGBA batch of shape `(batch_size, height, width, 4)`, already resized to
+            the model's input size.
+
+        Returns
+        -------
+        np.ndarray
+            The view embeddings, of shape `(batch_size, dimension)`.
+        """
+        raise NotImplementedError
+
+
+class ClipImageEncoder(ViewEncoder):
+    """
+    Encodes batches of preprocessed views with the vision tower of a CLIP model.
+
+    Parameters
+    ----------
+    model : SentenceTransformer
+        A SentenceTransformer CLIP model, e.g. `clip-ViT-B-32`.
+    background_colour : Tuple[int, int, int], default BACKGROUND_COLOUR
+        RGB colour composited behind transparent pixels of the views.
+    """
+
+    def __init__(
+        self,
+        model: SentenceTransformer,
+        background_colour: Tuple[int, int, int] = BACKGROUND_COLOUR,
+    ):
+        self.model = model
+        self.background_colour = background_colour
+
+        # The Hugging Face `CLIPModel` wrapped by the SentenceTransformer's only module
+        self.clip_model = model[0].model
+        self.clip_model.eval()
+
+    @classmethod
+    def from_pretrained(
+        cls, model_name: str, quantize: bool = False, **kwargs
+    ) -> "ClipImageEncoder":
+        """
+        Load the SentenceTransformer CLIP model `model_name` and wrap it, optionally
+        quantizing it to int8 (on CPU) with `quantize_dynamic_int8`.
+        """
+        if quantize:
+            return cls(
+                quantize_dynamic_int8(SentenceTransformer(model_name, device="cpu")),
+                **kwargs,
+            )
+
+        return cls(SentenceTransformer(model_name), **kwargs)
+
+    def encode_views(self, views: np.ndarray) -> np.ndarray:
+        pixel_values: torch.Tensor = torch.from_numpy(
+            to_pixel_values(views, background_colour=self.background_colour)
+        ).to(self.model.device)
+
+        with torch.inference_mode():
+            embeddings: torch.Tensor = self.clip_model.get_image_features(
+                pixel_values=pixel_values
+            )
+
+        return embeddings.float().cpu().numpy()
+
+    def encode_texts(self, texts: List[str]) -> np.ndarray:
+        """Embed captions with the text tower, e.g. as retrieval queries."""
+        return self.model.encode(texts, convert_to_numpy=True)
@@ -0,0 +1,731 @@
+"""
+An in-process, NumPy-backed stand-in for a Weaviate server, for offline testing and benchmarking.
+
+`FakeWeaviateClient` and `FakeCollection` implement the part of the Weaviate v4 client surface
+used by this repository, returning the client's own result types:
+
+- `client.collections`: `create`, `delete`, `get`, `exists` and `list_all`.
+- `collection.data`: `insert_many` and `delete_many`.
+- `collection.aggregate.over_all(total_count=True)`.
+- `collection.query`: `fetch_object_by_id` and `near_vector`, with an exact (brute-force) search
+  over the stored vectors using the collection's distance metric.
+- `collection.batch`: the `dynamic`, `fixed_size` and `rate_limit` context managers.
+- `collection.iterator()`.
+
+A configurable latency can be injected into every request, and errors into inserted objects
+and whole requests, to mimic a real server under load.
+
+Example:
+    ```python
+    with FakeWeaviateClient(request_latency_s=0.02, error_rate=0.001) as client:
+        collection = create_collection(client, "Cap3DMM")
+        collection.data.insert_many(data_objects)
+        response = collection.query.near_vector(query_vector, limit=5)
+    ```
+"""
+
+import dataclasses
+import datetime
+import random
+import threading
+import time
+import uuid as uuid_package
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Set, Union
+
+import numpy as np
+from weaviate.classes.data import DataObject
+from weaviate.collections.classes.aggregate import AggregateReturn
+from weaviate.collections.classes.batch import (
+    BatchObjectReturn,
+    DeleteManyReturn,
+    ErrorObject,
+    _BatchObject,
+)
+from weaviate.collections.classes.internal import (
+    MetadataReturn,
+    MetadataSingleObjectReturn,
+    Object,
+    ObjectSingleReturn,
+    QueryReturn,
+)
+
+DEFAULT_DISTANCE_METRIC = "cosine"
+DEFAULT_BATCH_SIZE = 100
+INITIAL_CAPACITY = 1024
+
+UUID = Union[str, uuid_package.UUID]
+
+
+def _to_uuid(object_uuid: UUID) -> uuid_package.UUID:
+    return (
+        object_uuid
+        if isinstance(object_uuid, uuid_package.UUID)
+        else uuid_package.UUID(str(object_uuid))
+    )
+
+
+def _distance_metric(vector_index_config: Any) -> str:
+    """The distance metric (e.g. "cosine") of a `Configure.VectorIndex` config, if any."""
+    distance = getattr(vector_index_config, "distance", None)
+    if distance is None:
+        return DEFAULT_DISTANCE_METRIC
+
+    return str(getattr(distance, "value", distance))
+
+
+def _batch_object(**fields: Any) -> _BatchObject:
+    """A `_BatchObject`, given only the fields of the installed client version's."""
+    field_names: Set[str] = {field.name for field in dataclasses.fields(_BatchObject)}
+
+    return _BatchObject(
+        **{name: value for name, value in fields.items() if name in field_names}
+    )
+
+
+class _FakeData:
+    """The `collection.data` namespace of a `FakeCollection`."""
+
+    def __init__(self, collection: "FakeCollection"):
+        self._collection = collection
+
+    def insert_many(self, objects: Sequence[DataObject]) -> BatchObjectReturn:
+        """Insert objects, failing each with probability `error_rate`."""
+        collection: FakeCollection = self._collection
+        start_time: float = time.perf_counter()
+
+        collection._request(num_objects=len(objects))
+
+        errors: Dict[int, ErrorObject] = {}
+        uuids: Dict[int, uuid_package.UUID] = {}
+
+        for object_idx, data_object in enumerate(objects):
+            object_uuid = _to_uuid(data_object.uuid or uuid_package.uuid4())
+
+            if collection._should_fail(collection.error_rate):
+                errors[object_idx] = ErrorObject(
+                    message="Injected error",
+                    object_=_batch_object(
+                        collection=collection.name,
+                        vector=data_object.vector,
+                        uuid=str(object_uuid),
+                        properties=data_object.properties,
+                        tenant=None,
+                        references=None,
+                        index=object_idx,
+                    ),
+                    original_uuid=data_object.uuid,
+                )
+                continue
+
+            collection._store(object_uuid, data_object.properties, data_object.vector)
+            uuids[object_idx] = object_uuid
+
+        # The fields of the return value differ between client versions (e.g. the private
+        # `_all_responses` of 4.10+), so only the ones every version has are filled in
+        batch_objects_return = BatchObjectReturn()
+        batch_objects_return.elapsed_seconds = time.perf_counter() - start_time
+        batch_objects_return.errors = errors
+        batch_objects_return.uuids = uuids
+        batch_objects_return.has_errors = bool(errors)
+
+        return batch_objects_return
+
+    def delete_many(
+        self, where: Any, verbose: bool = False, *, dry_run: bool = False
+    ) -> DeleteManyReturn:
+        """Delete the objects matching a filter, e.g. `Filter.by_id().contains_any(...)`."""
+        collection: FakeCollection = self._collection
+        collection._request()
+
+        matches: List[uuid_package.UUID] = collection._filter(where)
+        if not dry_run:
+            collection._remove(matches)
+
+        return DeleteManyReturn(
+            failed=0,
+            matches=len(matches),
+            objects=None,
+            successful=0 if dry_run else len(matches),
+        )
+
+
+class _FakeAggregate:
+    """The `collection.aggregate` namespace of a `FakeCollection`."""
+
+    def __init__(self, collection: "FakeCollection"):
+        self._collection = collection
+
+    def over_all(
+        self, *, filters: Any = None, total_count: bool = True, **kwargs
+    ) -> AggregateReturn:
+        """Count the objects in the collection, optionally matching a filter."""
+        collection: FakeCollection = self._collection
+        collection._request()
+
+        num_objects: int = (
+            len(collection) if filters is None else len(collection._filter(filters))
+        )
+
+        return AggregateReturn(
+            properties={}, total_count=num_objects if total_count else None
+        )
+
+
+class _FakeQuery:
+    """The `collection.query` namespace of a `FakeCollection`."""
+
+    def __init__(self, collection: "FakeCollection"):
+        self._collection = collection
+
+    def fetch_object_by_id(
+        self, uuid: UUID, include_vector: bool = False, **kwargs
+    ) -> Optional[ObjectSingleReturn]:
+        """Fetch an object by its UUID, or `None` if it does not exist."""
+        collection: FakeCollection = self._collection
+        collection._query()
+
+        object_uuid: uuid_package.UUID = _to_uuid(uuid)
+        with collection._lock:
+            row: Optional[int] = collection._rows.get(object_uuid)
+            if row is None:
+                return None
+
+            properties: Dict[str, Any] = dict(collection._properties[row])
+            vector: Optional[List[float]] = (
+                collection._vectors[row].tolist()
+                if include_vector and collection._has_vector[row]
+                else None
+            )
+            created_at: datetime.datetime = collection._created_at[row]
+
+        return ObjectSingleReturn(
+            uuid=object_uuid,
+            metadata=MetadataSingleObjectReturn(
+                creation_time=created_at,
+                last_update_time=created_at,
+                is_consistent=True,
+            ),
+            properties=properties,
+            references=None,
+            vector={} if vector is None else {"default": vector},
+            collection=collection.name,
+        )
+
+    def near_vector(
+        self,
+        near_vector: Sequence[float],
+        *,
+        distance: Optional[float] = None,
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+        filters: Any = None,
+        include_vector: bool = False,
+        **kwargs,
+    ) -> QueryReturn:
+        """
+        Find the objects nearest to a vector, by exhaustive search over every stored vector.
+
+        Results are exact, so they are also a ground truth for measuring the recall of a real
+        (approximate) HNSW index.
+        """
+        collection: FakeCollection = self._collection
+        collection._query()
+
+        offset = offset or 0
+        with collection._lock:
+            candidate_rows: np.ndarray = (
+                np.flatnonzero(collection._has_vector[: len(collection._uuids)])
+                if filters is None
+                else np.asarray(
+                    [
+                        collection._rows[object_uuid]
+                        for object_uuid in collection._filter(filters)
+                        if collection._has_vector[collection._rows[object_uuid]]
+                    ],
+                    dtype=np.int64,
+                )
+            )
+            distances: np.ndarray = collection._distances(
+                np.asarray(near_vector, dtype=np.float32), candidate_rows
+            )
+
+            if distance is not None:
+                within_distance: np.ndarray = distances <= distance
+                candidate_rows, distances = (
+                    candidate_rows[within_distance],
+                    distances[within_distance],
+                )
+
+            num_results: int = min(
+                len(distances),
+                offset + (limit if limit is not None else len(distances)),
+            )
+            if num_results < len(distances):
+                nearest: np.ndarray = np.argpartition(distances, num_results - 1)[
+                    :num_results
+                ]
+            else:
+                nearest = np.arange(len(distances))
+            nearest = nearest[np.argsort(distances[nearest], kind="stable")][offset:]
+
+            objects: List[Object] = [
+                Object(
+                    uuid=collection._uuids[candidate_rows[result_idx]],
+                    metadata=MetadataReturn(distance=float(distances[result_idx])),
+                    properties=dict(collection._properties[candidate_rows[result_idx]]),
+                    references=None,
+                    vector=(
+                        {
+                            "default": collection._vectors[
+                                candidate_rows[result_idx]
+                            ].tolist()
+                        }
+                        if include_vector
+                        else {}
+                    ),
+                    collection=collection.name,
+                )
+                for result_idx in nearest
+            ]
+
+        return QueryReturn(objects=objects)
+
+
+class _FakeBatch:
+    """A client-side batch, sending `insert_many` requests of `batch_size` objects."""
+
+    def __init__(self, collection: "FakeCollection", batch_size: int):
+        self._collection = collection
+        self.batch_size = batch_size
+
+        self._buffer: List[DataObject] = []
+        self.failed_objects: List[ErrorObject] = []
+
+    @property
+    def number_errors(self) -> int:
+        """The number of objects that failed to insert so far."""
+        return len(self.failed_objects)
+
+    def add_object(
+        self,
+        properties: Optional[Dict[str, Any]] = None,
+        references: Any = None,
+        uuid: Optional[UUID] = None,
+        vector: Optional[Sequence[float]] = None,
+    ) -> uuid_package.UUID:
+        """Add an object to the batch, returning its UUID."""
+        object_uuid: uuid_package.UUID = _to_uuid(uuid or uuid_package.uuid4())
+        self._buffer.append(
+            DataObject(properties=properties, uuid=object_uuid, vector=vector)
+        )
+
+        if len(self._buffer) >= self.batch_size:
+            self.flush()
+
+        return object_uuid
+
+    def flush(self) -> None:
+        """Send the buffered objects."""
+        if not self._buffer:
+            return
+
+        batch_objects_return: BatchObjectReturn = self._collection.data.insert_many(
+            self._buffer
+        )
+        self.failed_objects.extend(batch_objects_return.errors.values())
+        self._buffer = []
+
+
+class _FakeBatchNamespace:
+    """The `collection.batch` namespace of a `FakeCollection`."""
+
+    def __init__(self, collection: "FakeCollection"):
+        self._collection = collection
+        self.failed_objects: List[ErrorObject] = []
+
+    @contextmanager
+    def _batch(self, batch_size: int) -> Iterator[_FakeBatch]:
+        batch = _FakeBatch(self._collection, batch_size=batch_size)
+        try:
+            yield batch
+        finally:
+            batch.flush()
+            self.failed_objects = batch.failed_objects
+
+    def dynamic(self) -> Iterator[_FakeBatch]:
+        """A batch of a fixed default size (the fake has no load to adapt to)."""
+        return self._batch(DEFAULT_BATCH_SIZE)
+
+    def fixed_size(
+        self, batch_size: int = DEFAULT_BATCH_SIZE, concurrent_requests: int = 2
+    ) -> Iterator[_FakeBatch]:
+        """A batch sending `batch_size` objects per request."""
+        return self._batch(batch_size)
+
+    def rate_limit(self, requests_per_minute: int) -> Iterator[_FakeBatch]:
+        """A batch for rate-limited vectorizers; objects are sent one per request."""
+        return self._batch(1)
+
+
+class FakeCollection:
+    """
+    An in-memory collection backed by a growable NumPy matrix of vectors.
+
+    Parameters
+    ----------
+    name : str
+        Name of the collection.
+    distance_metric : str, default DEFAULT_DISTANCE_METRIC
+        Distance used by `near_vector`: "cosine", "dot" or "l2-squared".
+    request_latency_s : float, default 0.0
+        Latency added to every write or aggregate request, in seconds.
+    object_latency_s : float, default 0.0
+        Latency added per object in an `insert_many` request, in seconds.
+    query_latency_s : float, default 0.0
+        Latency added to every query, in seconds.
+    error_rate : float, default 0.0
+        Probability of each inserted object failing with an injected error.
+    request_error_rate : float, default 0.0
+        Probability of a whole request raising an injected `ConnectionError`.
+    seed : Optional[int]
+        Seed for the injected errors.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        distance_metric: str = DEFAULT_DISTANCE_METRIC,
+        request_latency_s: float = 0.0,
+        object_latency_s: float = 0.0,
+        query_latency_s: float = 0.0,
+        error_rate: float = 0.0,
+        request_error_rate: float = 0.0,
+        seed: Optional[int] = None,
+    ):
+        if distance_metric not in ("cosine", "dot", "l2-squared"):
+            raise ValueError(f"Unsupported distance metric: '{distance_metric}'")
+
+        self.name = name
+        self.distance_metric = distance_metric
+        self.request_latency_s = request_latency_s
+        self.object_latency_s = object_latency_s
+        self.query_latency_s = query_latency_s
+        self.error_rate = error_rate
+        self.request_error_rate = request_error_rate
+
+        self.data = _FakeData(self)
+        self.aggregate = _FakeAggregate(self)
+        self.query = _FakeQuery(self)
+        self.batch = _FakeBatchNamespace(self)
+
+        # Objects are stored densely by row; deleting an object moves the last row into its place
+        self._uuids: List[uuid_package.UUID] = []
+        self._rows: Dict[uuid_package.UUID, int] = {}
+        self._properties: List[Dict[str, Any]] = []
+        self._created_at: List[datetime.datetime] = []
+        self._vectors: np.ndarray = np.empty((0, 0), dtype=np.float32)
+        self._has_vector: np.ndarray = np.zeros(0, dtype=bool)
+
+        self._lock = threading.RLock()
+        self._random = random.Random(seed)
+
+    def __len__(self) -> int:
+        return len(self._uuids)
+
+    def iterator(
+        self, include_vector: bool = False, after: Optional[UUID] = None, **kwargs
+    ) -> Iterator[Object]:
+        """Iterate over every object in the collection, in UUID order."""
+        with self._lock:
+            object_uuids: List[uuid_package.UUID] = sorted(self._uuids)
+
+        if after is not None:
+            object_uuids = [
+                object_uuid
+                for object_uuid in object_uuids
+                if object_uuid > _to_uuid(after)
+            ]
+
+        for object_uuid in object_uuids:
+            with self._lock:
+                row: Optional[int] = self._rows.get(object_uuid)
+                if row is None:
+                    continue
+
+                yield Object(
+                    uuid=object_uuid,
+                    metadata=MetadataReturn(),
+                    properties=dict(self._properties[row]),
+                    references=None,
+                    vector=(
+                        {"default": self._vectors[row].tolist()}
+                        if include_vector and self._has_vector[row]
+                        else {}
+                    ),
+                    collection=self.name,
+                )
+
+    def _should_fail(self, rate: float) -> bool:
+        if rate <= 0:
+            return False
+
+        with self._lock:
+            return self._random.random() < rate
+
+    def _request(self, num_objects: int = 0) -> None:
+        latency_s: float = self.request_latency_s + self.object_latency_s * num_objects
+        if latency_s > 0:
+            time.sleep(latency_s)
+
+        if self._should_fail(self.request_error_rate):
+            raise ConnectionError("Injected request failure")
+
+    def _query(self) -> None:
+        if self.query_latency_s > 0:
+            time.sleep(self.query_latency_s)
+
+        if self._should_fail(self.request_error_rate):
+            raise ConnectionError("Injected request failure")
+
+    def _reserve(self, num_rows: int, dimension: int) -> None:
+        if self._vectors.shape[1] == 0 and dimension > 0:
+            self._vectors = np.zeros((len(self._has_vector), dimension), np.float32)
+        elif dimension not in (0, self._vectors.shape[1]):
+            raise ValueError(
+                f"Vector of dimension {dimension} does not match the collection's "
+                f"dimension {self._vectors.shape[1]}"
+            )
+
+        if num_rows > len(self._has_vector):
+            capacity: int = max(num_rows, 2 * len(self._has_vector), INITIAL_CAPACITY)
+            vectors: np.ndarray = np.zeros(
+                (capacity, self._vectors.shape[1]), dtype=np.float32
+            )
+            vectors[: len(self._uuids)] = self._vectors[: len(self._uuids)]
+            has_vector: np.ndarray = np.zeros(capacity, dtype=bool)
+            has_vector[: len(self._uuids)] = self._has_vector[: len(self._uuids)]
+
+            self._vectors, self._has_vector = vectors, has_vector
+
+    def _store(
+        self,
+        object_uuid: uuid_package.UUID,
+        properties: Optional[Dict[str, Any]],
+        vector: Optional[Sequence[float]],
+    ) -> None:
+        vector_array: Optional[np.ndarray] = (
+            None if vector is None else np.asarray(vector, dtype=np.float32)
+        )
+
+        with self._lock:
+            row: Optional[int] = self._rows.get(object_uuid)
+            if row is None:
+                row = len(self._uuids)
+                self._reserve(row + 1, 0 if vector_array is None else len(vector_array))
+                self._uuids.append(object_uuid)
+                self._properties.append({})
+                self._created_at.append(datetime.datetime.now(datetime.timezone.utc))
+                self._rows[object_uuid] = row
+            elif vector_array is not None:
+                self._reserve(row + 1, len(vector_array))
+
+            self._properties[row] = dict(properties or {})
+            self._has_vector[row] = vector_array is not None
+            if vector_array is not None:
+                self._vectors[row] = vector_array
+
+    def _remove(self, object_uuids: Sequence[uuid_package.UUID]) -> None:
+        with self._lock:
+            for object_uuid in object_uuids:
+                row: Optional[int] = self._rows.pop(object_uuid, None)
+                if row is None:
+                    continue
+
+                last_row: int = len(self._uuids) - 1
+                if row != last_row:
+                    moved_uuid: uuid_package.UUID = self._uuids[last_row]
+                    self._uuids[row] = moved_uuid
+                    self._properties[row] = self._properties[last_row]
+                    self._created_at[row] = self._created_at[last_row]
+                    self._vectors[row] = self._vectors[last_row]
+                    self._has_vector[row] = self._has_vector[last_row]
+                    self._rows[moved_uuid] = row
+
+                self._uuids.pop()
+                self._properties.pop()
+                self._created_at.pop()
+                self._has_vector[last_row] = False
+
+    def _matches(self, filters: Any, row: int) -> bool:
+        # Compound filters (`Filter.all_of`, `Filter.any_of`, `&`, `|`) hold their operands
+        if hasattr(filters, "filters"):
+            combine = all if "And" in type(filters).__name__ else any
+            return combine(self._matches(operand, row) for operand in filters.filters)
+
+        target: str = str(filters.target)
+        value: Any = (
+            str(self._uuids[row])
+            if target == "_id"
+            else self._properties[row].get(target)
+        )
+        operator: str = str(getattr(filters.operator, "value", filters.operator))
+        filter_values: List[Any] = (
+            [str(filter_value) for filter_value in filters.value]
+            if target == "_id"
+            else (
+                list(filters.value)
+                if isinstance(filters.value, (list, tuple, set))
+                else [filters.value]
+            )
+        )
+
+        if operator == "Equal":
+            return value == filter_values[0]
+        if operator == "NotEqual":
+            return value != filter_values[0]
+        if operator == "ContainsAny":
+            values: List[Any] = value if isinstance(value, list) else [value]
+            return any(value in filter_values for value in values)
+
+        raise NotImplementedError(f"Unsupported filter operator: '{operator}'")
+
+    def _filter(self, filters: Any) -> List[uuid_package.UUID]:
+        with self._lock:
+            return [
+                object_uuid
+                for row, object_uuid in enumerate(self._uuids)
+                if self._matches(filters, row)
+            ]
+
+    def _distances(self, query_vector: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        vectors: np.ndarray = self._vectors[rows]
+
+        if self.distance_metric == "dot":
+            return -(vectors @ query_vector)
+
+        if self.distance_metric == "l2-squared":
+            return np.sum((vectors - query_vector) ** 2, axis=1)
+
+        norms: np.ndarray = np.linalg.norm(vectors, axis=1) * np.linalg.norm(
+            query_vector
+        )
+        return 1 - (vectors @ query_vector) / np.maximum(
+            norms, np.finfo(np.float32).tiny
+        )
+
+
+class _FakeCollections:
+    """The `client.collections` namespace of a `FakeWeaviateClient`."""
+
+    def __init__(self, client: "FakeWeaviateClient"):
+        self._client = client
+        self._collections: Dict[str, FakeCollection] = {}
+        self._configs: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(name: str) -> str:
+        # Weaviate capitalises the first letter of collection names
+        return name[:1].upper() + name[1:]
+
+    def create(
+        self, name: str, vector_index_config: Any = None, **config
+    ) -> FakeCollection:
+        """Create a collection, raising `ValueError` if it already exists."""
+        with self._lock:
+            key: str = self._key(name)
+            if key in self._collections:
+                raise ValueError(f"Collection '{key}' already exists")
+
+            self._collections[key] = self._client._new_collection(
+                key, distance_metric=_distance_metric(vector_index_config)
+            )
+            self._configs[key] = {"vector_index_config": vector_index_config, **config}
+
+            return self._collections[key]
+
+    def delete(self, name: Union[str, List[str]]) -> None:
+        """Delete one or more collections, ignoring any that do not exist."""
+        names: List[str] = [name] if isinstance(name, str) else list(name)
+
+        with self._lock:
+            for collection_name in names:
+                self._collections.pop(self._key(collection_name), None)
+                self._configs.pop(self._key(collection_name), None)
+
+    def delete_all(self) -> None:
+        """Delete every collection."""
+        with self._lock:
+            self._collections.clear()
+            self._configs.clear()
+
+    def exists(self, name: str) -> bool:
+        """Whether a collection exists."""
+        return self._key(name) in self._collections
+
+    def get(self, name: str) -> FakeCollection:
+        """Get a collection, raising `KeyError` if it does not exist."""
+        try:
+            return self._collections[self._key(name)]
+        except KeyError:
+            raise KeyError(f"Collection '{self._key(name)}' does not exist") from None
+
+    def list_all(self, simple: bool = True) -> Dict[str, Dict[str, Any]]:
+        """The configuration of every collection, keyed by name."""
+        return {
+            name: {"name": name, **config} for name, config in self._configs.items()
+        }
+
+
+class FakeWeaviateClient:
+    """
+    An in-process stand-in for `weaviate.WeaviateClient`, holding `FakeCollection`s.
+
+    Parameters
+    ----------
+    request_latency_s, object_latency_s, query_latency_s, error_rate, request_error_rate, seed
+        Passed on to every `FakeCollection` created by the client.
+    """
+
+    def __init__(
+        self,
+        request_latency_s: float = 0.0,
+        object_latency_s: float = 0.0,
+        query_latency_s: float = 0.0,
+        error_rate: float = 0.0,
+        request_error_rate: float = 0.0,
+        seed: Optional[int] = None,
+    ):
+        self.collection_kwargs: Dict[str, Any] = {
+            "request_latency_s": request_latency_s,
+            "object_latency_s": object_latency_s,
+            "query_latency_s": query_latency_s,
+            "error_rate": error_rate,
+            "request_error_rate": request_error_rate,
+            "seed": seed,
+        }
+        self.collections = _FakeCollections(self)
+
+    def __enter__(self) -> "FakeWeaviateClient":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _new_collection(self, name: str, distance_metric: str) -> FakeCollection:
+        return FakeCollection(
+            name, distance_metric=distance_metric, **self.collection_kwargs
+        )
+
+    def is_live(self) -> bool:
+        return True
+
+    def is_ready(self) -> bool:
+        return True
+
+    def connect(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
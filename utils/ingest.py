@@ -0,0 +1,891 @@
+"""
+Stages of the Cap3D ingest pipeline used by `data_loading.py`.
+
+The ingest is split into four stages, each run by `utils.pipeline.Pipeline`:
+
+- scan: list the rendered view files of an object and fingerprint them.
+- decode: read every view file and, unless its embedding is already cached, decode and resize
+  it to the CLIP input size, optionally dropping blank and near-duplicate views. In mosaic
+  mode, a subset of the views is tiled into a single image instead (see `utils.mosaic`).
+- encode: embed the views with CLIP in fixed-size batches packed across objects, and average
+  each object's view embeddings into a single object embedding, optionally stopping early once
+  the average settles.
+- upload: buffer the embedded objects and insert them into Weaviate in batches, with several
+  requests in flight at once, retrying only the objects that failed.
+"""
+
+import json
+import logging
+import time
+from collections import deque
+from concurrent.futures import (
+    ALL_COMPLETED,
+    FIRST_COMPLETED,
+    Future,
+    ThreadPoolExecutor,
+    wait,
+)
+from dataclasses import dataclass, field
+from typing import Callable, Deque, Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+from weaviate.classes.data import DataObject
+from weaviate.collections import Collection
+from weaviate.collections.classes.batch import BatchObjectReturn, ErrorObject
+from weaviate.util import generate_uuid5
+
+from utils.checksum import sha256_hash
+from utils.early_stopping import EarlyStopping, diverse_view_order
+from utils.embedding_cache import EmbeddingCache
+from utils.encoders import ViewEncoder
+from utils.metrics import Histogram, MetricsRegistry
+from utils.mosaic import mosaic_view_idxs, tile_views
+from utils.pipeline import BatchFailure, StageHandler
+from utils.preprocessing import load_view, new_batch_buffer
+from utils.retry import RetryBudget, RetryPolicy
+from utils.sources import ObjectSource, ViewFile
+from utils.view_filter import ViewFilter, ViewSelection
+
+UPLOAD_CONCURRENCY = 4
+VIEWS_USED_BUCKETS = (1, 2, 4, 6, 8, 10, 12, 16, 20, 24, 32)
+
+# Bump whenever view decoding or preprocessing changes, to invalidate cached embeddings
+PREPROCESSING_VERSION = 2
+
+
+@dataclass
+class ObjectViews:
+    """
+    A Cap3D object and its rendered views as it moves through the ingest pipeline.
+
+    Parameters
+    ----------
+    object_idx : int
+        Position of the object in the scan order.
+    name : str
+        Name of the object, i.e. the Cap3D dataset UID.
+    views : List[ViewFile]
+        The rendered view images of the object.
+    fingerprint : Optional[str]
+        Fingerprint of the object's view files, populated by the scan stage.
+    view_hashes : List[str]
+        SHA-256 hashes of the view files' contents, populated by the decode stage.
+    images : List[Optional[np.ndarray]]
+        Decoded uint8 RGBA view images, resized to the CLIP input size by the decode stage.
+        `None` for views whose embedding was found in the embedding cache.
+    embeddings : List[Optional[np.ndarray]]
+        Cached view embeddings, populated by the decode stage. `None` for views that still need
+        to be encoded.
+    """
+
+    object_idx: int
+    name: str
+    views: List[ViewFile] = field(default_factory=list)
+    fingerprint: Optional[str] = None
+    view_hashes: List[str] = field(default_factory=list)
+    images: List[Optional[np.ndarray]] = field(default_factory=list)
+    embeddings: List[Optional[np.ndarray]] = field(default_factory=list)
+
+
+@dataclass
+class EmbeddedObject:
+    """
+    A Cap3D object with its averaged view embedding, ready for upload.
+
+    `properties` holds the object's Weaviate properties once they have been built, e.g. when the
+    object is replayed from the dead-letter store; otherwise they are built at upload time.
+    """
+
+    object_idx: int
+    name: str
+    uuid: str
+    vector: List[float]
+    num_views: int
+    fingerprint: Optional[str] = None
+    properties: Optional[Dict[str, str]] = None
+
+
+@dataclass
+class UploadResult:
+    """
+    The outcome of uploading a buffer of objects with `insert_many`, after any retries.
+
+    Parameters
+    ----------
+    objects : List[EmbeddedObject]
+        The objects sent in the request, in request order.
+    errors : Dict[int, str]
+        Error messages of the objects that still failed after the last attempt, keyed by index
+        into `objects`. If the request as a whole failed, every object is included.
+    attempts : int
+        Number of `insert_many` requests made.
+    latency_s : Optional[float]
+        Wall-clock duration of the first request, in seconds.
+    """
+
+    objects: List[EmbeddedObject]
+    errors: Dict[int, str] = field(default_factory=dict)
+    attempts: int = 1
+    latency_s: Optional[float] = None
+
+    def failures(self) -> List[Tuple[EmbeddedObject, str]]:
+        """The objects that failed to upload, paired with their error messages."""
+        return [
+            (self.objects[error_idx], error_message)
+            for error_idx, error_message in self.errors.items()
+        ]
+
+    @property
+    def failed_objects(self) -> List[EmbeddedObject]:
+        """The objects that failed to upload."""
+        return [embedded_object for embedded_object, _ in self.failures()]
+
+    @property
+    def succeeded_objects(self) -> List[EmbeddedObject]:
+        """The objects that Weaviate confirmed as uploaded."""
+        return [
+            embedded_object
+            for object_idx, embedded_object in enumerate(self.objects)
+            if object_idx not in self.errors
+        ]
+
+
+def fingerprint_views(views: List[ViewFile], hash_contents: bool = False) -> str:
+    """
+    Fingerprint an object's view files by their names, sizes and modification times (or CRCs,
+    for views stored in zip archives).
+
+    Parameters
+    ----------
+    views : List[ViewFile]
+        The rendered view images of the object.
+    hash_contents : bool, default False
+        Whether to also include a hash of every file's contents, to detect changes that
+        preserve size and modification time at the cost of reading every file.
+
+    Returns
+    -------
+    str
+        The hexadecimal SHA-256 fingerprint of the view files.
+    """
+    view_signatures: List[str] = []
+    for view in views:
+        view_signature: str = view.signature()
+
+        if hash_contents:
+            view_signature += f":{sha256_hash(view.read_bytes())}"
+
+        view_signatures.append(view_signature)
+
+    return sha256_hash("\n".join(view_signatures).encode())
+
+
+def scan_object(
+    object_idx: int, name: str, source: ObjectSource, hash_contents: bool = False
+) -> ObjectViews:
+    """
+    Scan stage: list and fingerprint the view files of an object.
+
+    Parameters
+    ----------
+    object_idx : int
+        Position of the object in the scan order.
+    name : str
+        Name of the object to scan.
+    source : ObjectSource
+        The source holding the object's views.
+    hash_contents : bool, default False
+        Whether the fingerprint includes a hash of every view file's contents.
+
+    Returns
+    -------
+    ObjectViews
+        The object with its `views` and `fingerprint` populated.
+    """
+    views: List[ViewFile] = source.list_views(name)
+
+    return ObjectViews(
+        object_idx=object_idx,
+        name=name,
+        views=views,
+        fingerprint=fingerprint_views(views, hash_contents=hash_contents),
+    )
+
+
+def decode_views(
+    object_views: ObjectViews,
+    embedding_cache: Optional[EmbeddingCache] = None,
+    view_filter: Optional[ViewFilter] = None,
+) -> Optional[ObjectViews]:
+    """
+    Decode stage: read every view of an object, decoding those not in the embedding cache.
+
+    Images are decoded and resized eagerly, so that disk reads, PNG decoding and resampling
+    happen on the decode workers, not on the encoder. Views whose embedding is found in
+    `embedding_cache` (keyed by the hash of the file's contents) are not decoded at all, unless
+    `view_filter` is given: every view is then decoded so that the same views are dropped
+    whether or not they are cached.
+
+    Parameters
+    ----------
+    object_views : ObjectViews
+        The object produced by the scan stage.
+    embedding_cache : Optional[EmbeddingCache]
+        Cache of previously computed view embeddings.
+    view_filter : Optional[ViewFilter]
+        Filter dropping blank and near-duplicate views, which are removed from `views`.
+
+    Returns
+    -------
+    Optional[ObjectViews]
+        The object with its `view_hashes`, `images` and `embeddings` populated, or `None` if
+        the object has no views.
+    """
+    if not object_views.views:
+        return None
+
+    views_bytes: List[bytes] = [view.read_bytes() for view in object_views.views]
+    images: List[Optional[np.ndarray]] = [None] * len(views_bytes)
+
+    if view_filter is not None:
+        images = [load_view(view_bytes) for view_bytes in views_bytes]
+        selection: ViewSelection = view_filter.select(images)
+
+        object_views.views = [object_views.views[idx] for idx in selection.kept_idxs]
+        views_bytes = [views_bytes[idx] for idx in selection.kept_idxs]
+        images = [images[idx] for idx in selection.kept_idxs]
+
+    for view_bytes, image in zip(views_bytes, images):
+        view_hash: str = sha256_hash(view_bytes)
+
+        embedding: Optional[np.ndarray] = (
+            embedding_cache.get(view_hash) if embedding_cache is not None else None
+        )
+
+        if embedding is None and image is None:
+            image = load_view(view_bytes)
+
+        object_views.view_hashes.append(view_hash)
+        object_views.embeddings.append(embedding)
+        object_views.images.append(image if embedding is None else None)
+
+    return object_views
+
+
+def decode_mosaic(
+    object_views: ObjectViews,
+    grid_size: int,
+    embedding_cache: Optional[EmbeddingCache] = None,
+    view_filter: Optional[ViewFilter] = None,
+) -> Optional[ObjectViews]:
+    """
+    Decode stage, in mosaic mode: tile a subset of an object's views into a single image.
+
+    Only the views in the mosaic are read, unless `view_filter` is given, in which case the
+    mosaic's views are chosen among the views the filter keeps. The mosaic is cached under a
+    hash of its views' hashes and `grid_size`, and without a `view_filter`, its views are only
+    decoded if it is not in `embedding_cache`.
+
+    Parameters
+    ----------
+    object_views : ObjectViews
+        The object produced by the scan stage.
+    grid_size : int
+        Number of tiles along each side of the mosaic.
+    embedding_cache : Optional[EmbeddingCache]
+        Cache of previously computed embeddings.
+    view_filter : Optional[ViewFilter]
+        Filter dropping blank and near-duplicate views before the mosaic's views are chosen.
+
+    Returns
+    -------
+    Optional[ObjectViews]
+        The object with its `views` reduced to the views in the mosaic, and a single entry in
+        `view_hashes`, `images` and `embeddings` for the mosaic, or `None` if the object has no
+        views.
+    """
+    images: Optional[List[Optional[np.ndarray]]] = None
+    views_bytes: List[bytes] = []
+    if view_filter is not None:
+        # The filter needs every view decoded, cached or not (see `decode_views`)
+        decoded_views: Optional[ObjectViews] = decode_views(
+            object_views, view_filter=view_filter
+        )
+        if decoded_views is None:
+            return None
+
+        images = decoded_views.images
+        view_hashes: List[str] = decoded_views.view_hashes
+    else:
+        if not object_views.views:
+            return None
+
+        object_views.views = [
+            object_views.views[view_idx]
+            for view_idx in mosaic_view_idxs(len(object_views.views), grid_size)
+        ]
+        views_bytes = [view.read_bytes() for view in object_views.views]
+        view_hashes = [sha256_hash(view_bytes) for view_bytes in views_bytes]
+
+    mosaic_idxs: List[int] = mosaic_view_idxs(len(object_views.views), grid_size)
+    mosaic_hash: str = sha256_hash(
+        f"mosaic{grid_size}:".encode()
+        + ",".join(view_hashes[idx] for idx in mosaic_idxs).encode()
+    )
+    embedding: Optional[np.ndarray] = (
+        embedding_cache.get(mosaic_hash) if embedding_cache is not None else None
+    )
+
+    # Views are only decoded to build the mosaic if its embedding is not cached
+    mosaic: Optional[np.ndarray] = None
+    if embedding is None:
+        mosaic = tile_views(
+            [
+                images[idx] if images is not None else load_view(views_bytes[idx])
+                for idx in mosaic_idxs
+            ],
+            grid_size,
+        )
+
+    return ObjectViews(
+        object_idx=object_views.object_idx,
+        name=object_views.name,
+        views=[object_views.views[idx] for idx in mosaic_idxs],
+        fingerprint=object_views.fingerprint,
+        view_hashes=[mosaic_hash],
+        images=[mosaic],
+        embeddings=[embedding],
+    )
+
+
+def object_properties(
+    embedded_object: EmbeddedObject, descriptions: Dict[str, str]
+) -> Dict[str, str]:
+    """
+    The Weaviate properties of an object: its stored properties if it has any, otherwise its
+    description (looked up in `descriptions`) and dataset UID.
+    """
+    if embedded_object.properties is not None:
+        return embedded_object.properties
+
+    object_description: str = descriptions.get(embedded_object.name, "")
+
+    return {
+        "description": object_description,
+        "datasetUID": embedded_object.uuid,
+    }
+
+
+def operation_seconds(metrics: MetricsRegistry) -> Histogram:
+    """The histogram of ingest operation durations (encode, mean-pool, insert, retry)."""
+    return metrics.histogram(
+        "ingest_operation_seconds",
+        "Duration of individual ingest operations",
+        ["operation"],
+    )
+
+
+def pool_embeddings(embeddings: np.ndarray) -> List[float]:
+    """
+    Average the embeddings of an object's views into a single object embedding, L2-normalised
+    so that collections can rank objects by dot product instead of cosine distance.
+    """
+    mean_embedding: np.ndarray = np.mean(embeddings, axis=0)
+    norm: float = float(np.linalg.norm(mean_embedding))
+
+    return (mean_embedding / norm if norm > 0 else mean_embedding).tolist()
+
+
+class _PendingObject:
+    """
+    An object whose views are queued for, or partway through, batched encoding.
+
+    Views are used in `order`; only the first `num_queued` views in that order have been queued
+    (or found in the cache), and `num_used` is set once the object needs no more views.
+    """
+
+    def __init__(self, object_views: ObjectViews, adaptive: bool = False):
+        self.object_views = object_views
+        self.embeddings: List[Optional[np.ndarray]] = list(object_views.embeddings)
+        self.order: List[int] = (
+            diverse_view_order(len(self.embeddings))
+            if adaptive
+            else list(range(len(self.embeddings)))
+        )
+        self.num_queued: int = 0
+        self.num_used: Optional[int] = None
+        self.remaining: int = 0
+
+    def used_embeddings(self) -> np.ndarray:
+        """The embeddings of the views queued so far, in order."""
+        return np.stack(
+            [self.embeddings[view_idx] for view_idx in self.order[: self.num_queued]]
+        )
+
+
+class BatchedEncodeHandler(StageHandler):
+    """
+    Encode stage: pack views from many objects into fixed-size batches for CLIP.
+
+    Views are queued across object boundaries and copied `batch_size` at a time into a
+    preallocated uint8 batch buffer, so every forward pass has the same shape regardless of how
+    many views each object has. Embeddings are scattered back to their objects, and an object
+    is emitted (with its views averaged) as soon as all of its views have been encoded.
+
+    Parameters
+    ----------
+    encoder : ViewEncoder
+        The CLIP encoder used to embed batches of views.
+    batch_size : int
+        Number of views per forward pass.
+    pad_batches : bool, default True
+        Whether to pad the final, partial batch up to `batch_size` (by repeating its last view)
+        so every forward pass has the same shape. Padded outputs are discarded.
+    embedding_cache : Optional[EmbeddingCache]
+        Cache to store newly computed view embeddings in. Views already cached by the decode
+        stage are not encoded again.
+    early_stopping : Optional[EarlyStopping]
+        If given, each object's views are queued one at a time in a diverse order, and no more
+        are queued once their running mean has converged; only the views queued so far are
+        averaged. Otherwise every view is encoded and averaged.
+    metrics : Optional[MetricsRegistry]
+        Registry to record encode and mean-pool durations, the number of views encoded and the
+        number of views used per object on.
+    """
+
+    def __init__(
+        self,
+        encoder: ViewEncoder,
+        batch_size: int,
+        pad_batches: bool = True,
+        embedding_cache: Optional[EmbeddingCache] = None,
+        early_stopping: Optional[EarlyStopping] = None,
+        metrics: Optional[MetricsRegistry] = None,
+    ):
+        self.encoder = encoder
+        self.batch_size = batch_size
+        self.pad_batches = pad_batches
+        self.embedding_cache = embedding_cache
+        self.early_stopping = early_stopping
+
+        metrics = metrics or MetricsRegistry()
+        self._operation_seconds: Histogram = operation_seconds(metrics)
+        self._views_encoded = metrics.counter(
+            "ingest_views_encoded", "Views embedded with CLIP, excluding padding"
+        )
+        self._views_used = metrics.histogram(
+            "ingest_views_used",
+            "Views averaged into each object embedding",
+            buckets=VIEWS_USED_BUCKETS,
+        )
+        self._views_skipped = metrics.counter(
+            "ingest_views_skipped", "Views left unencoded by early stopping"
+        )
+
+        self.batch_buffer: np.ndarray = new_batch_buffer(batch_size)
+
+        self.pending_objects: Deque[_PendingObject] = deque()
+        self.pending_views: List[Tuple[_PendingObject, int]] = []
+
+    def _encode_batch(self, batch: List[Tuple[_PendingObject, int]]) -> None:
+        for buffer_idx, (pending_object, view_idx) in enumerate(batch):
+            self.batch_buffer[buffer_idx] = pending_object.object_views.images[view_idx]
+            # The view's pixels now live in the batch buffer
+            pending_object.object_views.images[view_idx] = None
+
+        num_views: int = len(batch)
+        if self.pad_batches and num_views < self.batch_size:
+            self.batch_buffer[num_views:] = self.batch_buffer[num_views - 1]
+            num_views = self.batch_size
+
+        with self._operation_seconds.time(operation="encode"):
+            embeddings: np.ndarray = self.encoder.encode_views(
+                self.batch_buffer[:num_views]
+            )
+        self._views_encoded.inc(len(batch))
+
+        for (pending_object, view_idx), embedding in zip(batch, embeddings):
+            pending_object.embeddings[view_idx] = embedding
+            pending_object.remaining -= 1
+
+            if self.embedding_cache is not None:
+                self.embedding_cache.put(
+                    pending_object.object_views.view_hashes[view_idx], embedding
+                )
+
+            if pending_object.remaining == 0:
+                self._queue_views(pending_object)
+
+    def _queue_views(self, pending_object: _PendingObject) -> None:
+        # Called whenever the object has no views awaiting encoding
+        while pending_object.num_used is None:
+            num_views: int = len(pending_object.order)
+
+            if pending_object.num_queued == num_views or (
+                self.early_stopping is not None
+                and pending_object.num_queued > 0
+                and self.early_stopping.converged(pending_object.used_embeddings())
+            ):
+                pending_object.num_used = pending_object.num_queued
+                self._views_used.observe(pending_object.num_used)
+                self._views_skipped.inc(num_views - pending_object.num_used)
+                return
+
+            # Without early stopping every view is queued at once, otherwise one at a time
+            # (after the first `min_views`), with cached views consumed straight away
+            num_to_queue: int = (
+                num_views
+                if self.early_stopping is None
+                else max(self.early_stopping.min_views - pending_object.num_queued, 1)
+            )
+            for view_idx in pending_object.order[
+                pending_object.num_queued : pending_object.num_queued + num_to_queue
+            ]:
+                if pending_object.embeddings[view_idx] is None:
+                    self.pending_views.append((pending_object, view_idx))
+                    pending_object.remaining += 1
+                else:
+                    # The view's image is not needed
+                    pending_object.object_views.images[view_idx] = None
+            pending_object.num_queued = min(
+                pending_object.num_queued + num_to_queue, num_views
+            )
+
+            if pending_object.remaining:
+                return
+
+    def _discard(self, batch: List[Tuple[_PendingObject, int]]) -> List[ObjectViews]:
+        # Drop every object with a view in a failed batch, so later objects are not blocked
+        failed_objects = {pending_object for pending_object, _ in batch}
+        failed_views: List[ObjectViews] = [
+            pending_object.object_views
+            for pending_object in self.pending_objects
+            if pending_object in failed_objects
+        ]
+
+        self.pending_objects = deque(
+            pending_object
+            for pending_object in self.pending_objects
+            if pending_object not in failed_objects
+        )
+        self.pending_views = [
+            (pending_object, view_idx)
+            for pending_object, view_idx in self.pending_views
+            if pending_object not in failed_objects
+        ]
+
+        return failed_views
+
+    def _completed_objects(self) -> Iterable[EmbeddedObject]:
+        # Objects are emitted in the order they arrived, even if later objects finish first
+        while self.pending_objects and self.pending_objects[0].num_used is not None:
+            pending_object: _PendingObject = self.pending_objects.popleft()
+            object_views: ObjectViews = pending_object.object_views
+
+            # Average and normalise the embeddings from each angle before inserting
+            with self._operation_seconds.time(operation="mean_pool"):
+                vector: List[float] = pool_embeddings(pending_object.used_embeddings())
+
+            yield EmbeddedObject(
+                object_idx=object_views.object_idx,
+                name=object_views.name,
+                uuid=generate_uuid5(object_views.name),
+                vector=vector,
+                num_views=pending_object.num_used,
+                fingerprint=object_views.fingerprint,
+            )
+
+    def process(self, item: ObjectViews) -> Iterable[EmbeddedObject]:
+        pending_object = _PendingObject(item, adaptive=self.early_stopping is not None)
+        self.pending_objects.append(pending_object)
+        self._queue_views(pending_object)
+
+        while len(self.pending_views) >= self.batch_size:
+            batch: List[Tuple[_PendingObject, int]] = self.pending_views[
+                : self.batch_size
+            ]
+            self.pending_views = self.pending_views[self.batch_size :]
+
+            try:
+                self._encode_batch(batch)
+            except Exception as e:
+                # Every discarded object is a failure, not only the one being processed
+                raise BatchFailure(self._discard(batch), e) from e
+
+        # Also emits objects whose views were all cached, without encoding anything
+        yield from self._completed_objects()
+
+    def flush(self) -> Iterable[EmbeddedObject]:
+        # With early stopping, encoding a batch may queue further views of its objects
+        while self.pending_views:
+            batch: List[Tuple[_PendingObject, int]] = self.pending_views[
+                : self.batch_size
+            ]
+            self.pending_views = self.pending_views[self.batch_size :]
+
+            try:
+                self._encode_batch(batch)
+            except Exception as e:
+                # Every discarded object is a failure, not only the one being processed
+                raise BatchFailure(self._discard(batch), e) from e
+
+            yield from self._completed_objects()
+
+        yield from self._completed_objects()
+
+    def close(self) -> Iterable[ObjectViews]:
+        # Objects are only left pending if the pipeline stopped before `flush`
+        unfinished: List[ObjectViews] = [
+            pending_object.object_views for pending_object in self.pending_objects
+        ]
+        self.pending_objects.clear()
+        self.pending_views = []
+
+        return unfinished
+
+
+class UploadHandler(StageHandler):
+    """
+    Upload stage: buffer embedded objects and insert them into a collection in batches, with
+    several `insert_many` requests in flight at once.
+
+    Requests run on a small thread pool. Once `max_in_flight` requests are outstanding,
+    `process` blocks until one completes, which stops the stage from draining its input queue
+    and so applies backpressure to the stages upstream.
+
+    Objects that fail are retried on their own, rather than with the whole buffer, with
+    exponential backoff and jitter, for as long as `retry_policy` and `retry_budget` allow.
+
+    With `tenant_of`, the collection is multi-tenant: objects are buffered per tenant, and each
+    buffer is inserted into its own tenant, so requests to different tenants (different
+    shards) are in flight together.
+
+    Parameters
+    ----------
+    collection : Collection
+        The collection to insert objects into.
+    descriptions : Dict[str, str]
+        Mapping of Cap3D dataset UIDs to their descriptions.
+    buffer_size : int
+        Number of objects sent per `insert_many` request.
+    max_in_flight : int, default UPLOAD_CONCURRENCY
+        Maximum number of concurrent `insert_many` requests.
+    retry_policy : Optional[RetryPolicy]
+        How failed objects are retried. Defaults to `RetryPolicy()`.
+    retry_budget : Optional[RetryBudget]
+        Retries shared across every request. If `None`, retries are limited by `retry_policy`
+        alone.
+    logger : Optional[logging.Logger]
+        Logger for upload errors.
+    metrics : Optional[MetricsRegistry]
+        Registry to record request durations, retries, and the objects, views and bytes
+        uploaded on.
+    tenant_of : Optional[Callable[[str], str]]
+        Maps an object's name to the tenant it is inserted into, for multi-tenant collections.
+    """
+
+    def __init__(
+        self,
+        collection: Collection,
+        descriptions: Dict[str, str],
+        buffer_size: int,
+        max_in_flight: int = UPLOAD_CONCURRENCY,
+        retry_policy: Optional[RetryPolicy] = None,
+        retry_budget: Optional[RetryBudget] = None,
+        logger: Optional[logging.Logger] = None,
+        metrics: Optional[MetricsRegistry] = None,
+        tenant_of: Optional[Callable[[str], str]] = None,
+    ):
+        self.collection = collection
+        self.descriptions = descriptions
+        self.buffer_size = buffer_size
+        self.max_in_flight = max_in_flight
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.retry_budget = retry_budget
+        self.logger = logger or logging.getLogger(__name__)
+        self.tenant_of = tenant_of
+
+        metrics = metrics or MetricsRegistry()
+        self._operation_seconds: Histogram = operation_seconds(metrics)
+        self._retries = metrics.counter(
+            "ingest_upload_retries", "Objects resent after a failed insert"
+        )
+        self._objects = metrics.counter(
+            "ingest_objects", "Objects uploaded or given up on", ["outcome"]
+        )
+        self._views_uploaded = metrics.counter(
+            "ingest_views_uploaded", "Views of the objects uploaded"
+        )
+        self._bytes_uploaded = metrics.counter(
+            "ingest_bytes_uploaded",
+            "Approximate payload of the objects uploaded (vectors and properties)",
+        )
+
+        # Keyed by tenant, or by `None` for a single-tenant collection
+        self.buffers: Dict[Optional[str], List[EmbeddedObject]] = {}
+        self.in_flight: Set[Future] = set()
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_in_flight, thread_name_prefix="upload"
+        )
+
+    def _to_data_object(self, embedded_object: EmbeddedObject) -> DataObject:
+        return DataObject(
+            properties=object_properties(embedded_object, self.descriptions),
+            vector=embedded_object.vector,
+            uuid=embedded_object.uuid,
+        )
+
+    def _insert_once(
+        self, embedded_objects: List[EmbeddedObject], tenant: Optional[str] = None
+    ) -> Dict[int, str]:
+        collection: Collection = (
+            self.collection if tenant is None else self.collection.with_tenant(tenant)
+        )
+
+        try:
+            batch_objects_return: BatchObjectReturn = collection.data.insert_many(
+                [
+                    self._to_data_object(embedded_object)
+                    for embedded_object in embedded_objects
+                ]
+            )
+        except Exception as e:
+            # The whole request failed, so every object in it is considered failed
+            self.logger.error("Insert many objects exception: %s", e)
+
+            return {object_idx: str(e) for object_idx in range(len(embedded_objects))}
+
+        errors: Dict[int, ErrorObject] = batch_objects_return.errors
+        if errors:
+            self.logger.error("Failed to upload %d objects", len(errors))
+
+            for error_object in errors.values():
+                self.logger.error(
+                    "Failed to upload object with error: %s", error_object.message
+                )
+
+        return {
+            error_idx: error_object.message
+            for error_idx, error_object in errors.items()
+        }
+
+    def _payload_size(self, embedded_object: EmbeddedObject) -> int:
+        properties: Dict[str, str] = object_properties(
+            embedded_object, self.descriptions
+        )
+
+        return 4 * len(embedded_object.vector) + len(
+            json.dumps(properties).encode("utf-8")
+        )
+
+    def _record(self, upload_result: UploadResult) -> None:
+        succeeded_objects: List[EmbeddedObject] = upload_result.succeeded_objects
+
+        self._objects.inc(len(succeeded_objects), outcome="uploaded")
+        self._objects.inc(len(upload_result.errors), outcome="failed")
+        self._views_uploaded.inc(
+            sum(embedded_object.num_views for embedded_object in succeeded_objects)
+        )
+        self._bytes_uploaded.inc(sum(map(self._payload_size, succeeded_objects)))
+
+    def _insert(
+        self, embedded_objects: List[EmbeddedObject], tenant: Optional[str] = None
+    ) -> UploadResult:
+        start_time: float = time.perf_counter()
+        errors: Dict[int, str] = self._insert_once(embedded_objects, tenant)
+        latency_s: float = time.perf_counter() - start_time
+        self._operation_seconds.observe(latency_s, operation="insert")
+
+        attempts: int = 1
+        while (
+            errors
+            and attempts < self.retry_policy.max_attempts
+            and (self.retry_budget is None or self.retry_budget.try_acquire())
+        ):
+            time.sleep(self.retry_policy.delay_s(attempts))
+            attempts += 1
+
+            # Only resend the failed objects, keeping track of their indices in the buffer
+            failed_idxs: List[int] = sorted(errors)
+            self.logger.warning(
+                "Retrying %d failed objects (attempt %d of %d)",
+                len(failed_idxs),
+                attempts,
+                self.retry_policy.max_attempts,
+            )
+            self._retries.inc(len(failed_idxs))
+            with self._operation_seconds.time(operation="retry"):
+                retry_errors: Dict[int, str] = self._insert_once(
+                    [embedded_objects[failed_idx] for failed_idx in failed_idxs],
+                    tenant,
+                )
+            errors = {
+                failed_idxs[retry_idx]: error_message
+                for retry_idx, error_message in retry_errors.items()
+            }
+
+        upload_result = UploadResult(
+            objects=embedded_objects,
+            errors=errors,
+            attempts=attempts,
+            latency_s=latency_s,
+        )
+        self._record(upload_result)
+
+        return upload_result
+
+    def _collect(self, return_when: str) -> Iterable[UploadResult]:
+        done, self.in_flight = wait(self.in_flight, return_when=return_when)
+
+        for future in done:
+            yield future.result()
+
+    def _submit_buffer(self, tenant: Optional[str] = None) -> Iterable[UploadResult]:
+        # Wait for a free slot, so at most `max_in_flight` requests are outstanding
+        if len(self.in_flight) >= self.max_in_flight:
+            yield from self._collect(return_when=FIRST_COMPLETED)
+
+        self.in_flight.add(
+            self.executor.submit(self._insert, self.buffers.pop(tenant), tenant)
+        )
+
+    def process(self, item: EmbeddedObject) -> Iterable[UploadResult]:
+        tenant: Optional[str] = (
+            self.tenant_of(item.name) if self.tenant_of is not None else None
+        )
+        buffer: List[EmbeddedObject] = self.buffers.setdefault(tenant, [])
+        buffer.append(item)
+
+        if len(buffer) >= self.buffer_size:
+            yield from self._submit_buffer(tenant)
+
+        # Pass on any requests that have completed in the meantime, without waiting
+        completed: Set[Future] = {future for future in self.in_flight if future.done()}
+        self.in_flight -= completed
+        for future in completed:
+            yield future.result()
+
+    def flush(self) -> Iterable[UploadResult]:
+        for tenant in list(self.buffers):
+            yield from self._submit_buffer(tenant)
+
+        if self.in_flight:
+            yield from self._collect(return_when=ALL_COMPLETED)
+
+    def close(self) -> Iterable[EmbeddedObject]:
+        # Requests still in flight are waited for, but their results are never passed on (so
+        # the ledger does not record them), so their objects are reported with the unsent ones
+        self.executor.shutdown(wait=True)
+
+        unfinished: List[EmbeddedObject] = [
+            embedded_object
+            for buffer in self.buffers.values()
+            for embedded_object in buffer
+        ]
+        for future in self.in_flight:
+            if future.exception() is None:
+                unfinished.extend(future.result().objects)
+        self.buffers.clear()
+        self.in_flight.clear()
+
+        return unfinished
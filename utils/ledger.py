@@ -0,0 +1,232 @@
+"""
+A persistent, SQLite-backed checkpoint ledger for resumable ingests.
+
+The ledger records the outcome of every object upload (its `generate_uuid5` id, status, a
+hash of the uploaded vector, a fingerprint of its view files and the number of views averaged
+into its vector), so an interrupted ingest can be resumed by skipping every object that
+Weaviate has already confirmed as uploaded, and a delta ingest can skip every object whose view
+files have not changed since it was uploaded.
+
+Example:
+    ```python
+    with IngestLedger("ingest_ledger.sqlite") as ledger:
+        already_uploaded = ledger.uploaded_names()
+        ...
+        ledger.record_uploaded(upload_result.succeeded_objects)
+    ```
+"""
+
+import os
+import sqlite3
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple, Union
+
+import numpy as np
+
+from utils.checksum import sha256_hash
+from utils.ingest import EmbeddedObject
+
+STATUS_UPLOADED = "uploaded"
+STATUS_FAILED = "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS objects (
+    name TEXT PRIMARY KEY,
+    uuid TEXT NOT NULL,
+    status TEXT NOT NULL,
+    vector_hash TEXT,
+    error TEXT,
+    updated_at REAL NOT NULL,
+    fingerprint TEXT,
+    num_views INTEGER
+)
+"""
+_COLUMNS = "name, uuid, status, vector_hash, error, updated_at, fingerprint, num_views"
+
+
+def hash_vector(vector: List[float]) -> str:
+    """
+    Compute a stable SHA-256 hash of a vector's float32 representation.
+
+    Parameters
+    ----------
+    vector : List[float]
+        The vector to hash.
+
+    Returns
+    -------
+    str
+        The hexadecimal representation of the SHA-256 hash.
+    """
+    return sha256_hash(np.asarray(vector, dtype=np.float32).tobytes())
+
+
+class IngestLedger:
+    """
+    Records the upload status of every ingested object in a local SQLite database.
+
+    Writes are committed per call, so the ledger is consistent up to the last completed
+    upload request even if the ingest process is killed.
+
+    Parameters
+    ----------
+    path : Union[str, os.PathLike]
+        Path to the SQLite database file. Created if it does not exist.
+    """
+
+    def __init__(self, path: Union[str, os.PathLike]):
+        self.path = path
+        self.connection: sqlite3.Connection = sqlite3.connect(path)
+        # WAL keeps ledger writes cheap and durable while the ingest is running
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(_SCHEMA)
+        self._migrate()
+        self.connection.commit()
+
+    def _migrate(self) -> None:
+        # Ledgers created before delta ingests were supported have no fingerprint column
+        columns: Set[str] = {
+            column[1]
+            for column in self.connection.execute("PRAGMA table_info(objects)")
+        }
+        if "fingerprint" not in columns:
+            self.connection.execute("ALTER TABLE objects ADD COLUMN fingerprint TEXT")
+        # ... and ledgers created before early stopping have no num_views column
+        if "num_views" not in columns:
+            self.connection.execute("ALTER TABLE objects ADD COLUMN num_views INTEGER")
+
+    def __enter__(self) -> "IngestLedger":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Close the underlying database connection."""
+        self.connection.close()
+
+    def reset(self) -> None:
+        """Forget every recorded object, e.g. before a full rebuild of the collection."""
+        with self.connection:
+            self.connection.execute("DELETE FROM objects")
+
+    def replace_with(self, path: Union[str, os.PathLike]) -> None:
+        """
+        Replace every recorded object with those of another ledger, e.g. once a collection
+        rebuilt alongside the current one (see `utils.reindex`) replaces it.
+        """
+        self.connection.execute("ATTACH DATABASE ? AS other", (str(path),))
+        try:
+            with self.connection:
+                self.connection.execute("DELETE FROM objects")
+                self.connection.execute(
+                    f"INSERT INTO objects ({_COLUMNS}) SELECT {_COLUMNS} FROM other.objects"
+                )
+        finally:
+            self.connection.execute("DETACH DATABASE other")
+
+    def uploaded_names(self) -> Set[str]:
+        """The names of every object confirmed as uploaded."""
+        return {
+            name
+            for (name,) in self.connection.execute(
+                "SELECT name FROM objects WHERE status = ?", (STATUS_UPLOADED,)
+            )
+        }
+
+    def uploaded_fingerprints(self) -> Dict[str, Optional[str]]:
+        """The view file fingerprints of every object confirmed as uploaded, keyed by name."""
+        return dict(
+            self.connection.execute(
+                "SELECT name, fingerprint FROM objects WHERE status = ?",
+                (STATUS_UPLOADED,),
+            ).fetchall()
+        )
+
+    def remove(self, names: Iterable[str]) -> None:
+        """Forget the given objects, e.g. once they have been deleted from the collection."""
+        with self.connection:
+            self.connection.executemany(
+                "DELETE FROM objects WHERE name = ?", ((name,) for name in names)
+            )
+
+    def status(self, name: str) -> Optional[str]:
+        """The recorded status of an object, or `None` if it has never been recorded."""
+        row: Optional[Tuple[str]] = self.connection.execute(
+            "SELECT status FROM objects WHERE name = ?", (name,)
+        ).fetchone()
+
+        return row[0] if row else None
+
+    def _upsert(
+        self,
+        rows: Iterable[
+            Tuple[
+                str,
+                str,
+                str,
+                Optional[str],
+                Optional[str],
+                float,
+                Optional[str],
+                Optional[int],
+            ]
+        ],
+    ) -> None:
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO objects "
+                "(name, uuid, status, vector_hash, error, updated_at, fingerprint, "
+                "num_views) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+
+    def record_uploaded(self, embedded_objects: Iterable[EmbeddedObject]) -> None:
+        """
+        Mark objects as confirmed uploaded.
+
+        Parameters
+        ----------
+        embedded_objects : Iterable[EmbeddedObject]
+            The objects Weaviate reported as successfully inserted.
+        """
+        updated_at: float = time.time()
+
+        self._upsert(
+            (
+                embedded_object.name,
+                embedded_object.uuid,
+                STATUS_UPLOADED,
+                hash_vector(embedded_object.vector),
+                None,
+                updated_at,
+                embedded_object.fingerprint,
+                embedded_object.num_views,
+            )
+            for embedded_object in embedded_objects
+        )
+
+    def record_failed(self, failures: Iterable[Tuple[EmbeddedObject, str]]) -> None:
+        """
+        Mark objects as failed, so they are retried by the next resumed ingest.
+
+        Parameters
+        ----------
+        failures : Iterable[Tuple[EmbeddedObject, str]]
+            The objects that failed to upload, paired with their error messages.
+        """
+        updated_at: float = time.time()
+
+        self._upsert(
+            (
+                embedded_object.name,
+                embedded_object.uuid,
+                STATUS_FAILED,
+                hash_vector(embedded_object.vector),
+                error,
+                updated_at,
+                embedded_object.fingerprint,
+                embedded_object.num_views,
+            )
+            for embedded_object, error in failures
+        )
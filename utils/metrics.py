@@ -0,0 +1,560 @@
+"""
+Lightweight, thread-safe ingest metrics with a Prometheus-style exporter.
+
+Counters, gauges and latency histograms are kept in a `MetricsRegistry`, which can render them
+in the Prometheus text exposition format. `MetricsServer` serves them on a local HTTP endpoint
+(e.g. `http://127.0.0.1:9464/metrics`) for Prometheus to scrape, and `JsonlMetricsWriter`
+periodically appends snapshots to a JSONL file, for runs without a Prometheus server.
+
+Example:
+    ```python
+    metrics = MetricsRegistry()
+    insert_seconds = metrics.histogram(
+        "ingest_operation_seconds", "Duration of ingest operations", ["operation"]
+    )
+
+    with insert_seconds.time(operation="insert"):
+        collection.data.insert_many(data_objects)
+
+    with MetricsServer(metrics, port=9464):
+        ...
+    ```
+"""
+
+import bisect
+import json
+import logging
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import (
+    Callable,
+    Deque,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9464
+METRICS_PATH = "/metrics"
+SNAPSHOT_INTERVAL_S = 10.0
+THROUGHPUT_WINDOW_S = 30.0
+
+# Latency buckets in seconds, from single PNG decodes up to slow insert_many requests
+DEFAULT_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(label_names: Sequence[str], label_values: LabelValues) -> str:
+    if not label_names:
+        return ""
+
+    escaped_values = (
+        value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        for value in label_values
+    )
+    return (
+        "{"
+        + ",".join(
+            f'{name}="{value}"' for name, value in zip(label_names, escaped_values)
+        )
+        + "}"
+    )
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+
+    return repr(float(value))
+
+
+class _Metric:
+    """A named family of metrics, one per combination of label values."""
+
+    type_name: str
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names: Tuple[str, ...] = tuple(label_names)
+        self._lock = threading.Lock()
+
+    def _label_values(self, labels: Dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.label_names):
+            raise ValueError(
+                f"Metric '{self.name}' expects labels {list(self.label_names)}, "
+                f"got {sorted(labels)}"
+            )
+
+        return tuple(str(labels[label_name]) for label_name in self.label_names)
+
+    def samples(self) -> List[Tuple[str, LabelValues, Tuple[str, ...], float]]:
+        """The metric's samples as `(suffix, label values, extra label names, value)`."""
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        """The metric in the Prometheus text exposition format, one line per entry."""
+        lines: List[str] = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type_name}",
+        ]
+
+        for suffix, label_values, extra_label_names, value in self.samples():
+            labels: str = _format_labels(
+                self.label_names + extra_label_names, label_values
+            )
+            lines.append(f"{self.name}{suffix}{labels} {_format_value(value)}")
+
+        return lines
+
+
+class Counter(_Metric):
+    """A monotonically increasing count, e.g. of objects uploaded."""
+
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        super().__init__(name, documentation, label_names)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        """Increase the count by `amount`."""
+        if amount < 0:
+            raise ValueError("Counters can only be increased")
+
+        label_values: LabelValues = self._label_values(labels)
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        """The current count."""
+        with self._lock:
+            return self._values.get(self._label_values(labels), 0)
+
+    def total(self) -> float:
+        """The current count, summed over every combination of labels."""
+        with self._lock:
+            return sum(self._values.values())
+
+    def samples(self) -> List[Tuple[str, LabelValues, Tuple[str, ...], float]]:
+        with self._lock:
+            return [
+                ("_total", label_values, (), value)
+                for label_values, value in sorted(self._values.items())
+            ]
+
+
+class Gauge(_Metric):
+    """
+    A value that can go up and down, e.g. a queue depth.
+
+    Values are either set directly, or read on demand from a callback registered with
+    `set_function`.
+    """
+
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        super().__init__(name, documentation, label_names)
+        self._values: Dict[LabelValues, float] = {}
+        self._functions: Dict[LabelValues, Callable[[], float]] = {}
+
+    def set(self, value: float, **labels: str) -> None:
+        """Set the gauge to `value`."""
+        label_values: LabelValues = self._label_values(labels)
+        with self._lock:
+            self._values[label_values] = value
+
+    def set_function(self, function: Callable[[], float], **labels: str) -> None:
+        """Read the gauge's value from `function` whenever it is collected."""
+        label_values: LabelValues = self._label_values(labels)
+        with self._lock:
+            self._functions[label_values] = function
+
+    def samples(self) -> List[Tuple[str, LabelValues, Tuple[str, ...], float]]:
+        with self._lock:
+            values: Dict[LabelValues, float] = dict(self._values)
+            functions = dict(self._functions)
+
+        for label_values, function in functions.items():
+            values[label_values] = function()
+
+        return [
+            ("", label_values, (), value)
+            for label_values, value in sorted(values.items())
+        ]
+
+
+class Histogram(_Metric):
+    """
+    A distribution of observed values, e.g. request latencies, counted in cumulative buckets.
+
+    Parameters
+    ----------
+    buckets : Sequence[float], default DEFAULT_BUCKETS
+        Upper bounds of the buckets, in increasing order. A `+Inf` bucket is always added.
+    """
+
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        label_names: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, label_names)
+        self.buckets: Tuple[float, ...] = tuple(sorted(buckets)) + (math.inf,)
+        self._counts: Dict[LabelValues, List[int]] = {}
+        self._sums: Dict[LabelValues, float] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        """Record an observation."""
+        label_values: LabelValues = self._label_values(labels)
+        bucket_idx: int = bisect.bisect_left(self.buckets, value)
+
+        with self._lock:
+            counts: List[int] = self._counts.setdefault(
+                label_values, [0] * len(self.buckets)
+            )
+            counts[bucket_idx] += 1
+            self._sums[label_values] = self._sums.get(label_values, 0.0) + value
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """Observe the wall-clock duration of the `with` block, in seconds."""
+        start_time: float = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start_time, **labels)
+
+    def count(self, **labels: str) -> int:
+        """The number of observations."""
+        with self._lock:
+            return sum(self._counts.get(self._label_values(labels), ()))
+
+    def sum(self, **labels: str) -> float:
+        """The sum of all observations."""
+        with self._lock:
+            return self._sums.get(self._label_values(labels), 0.0)
+
+    def samples(self) -> List[Tuple[str, LabelValues, Tuple[str, ...], float]]:
+        samples: List[Tuple[str, LabelValues, Tuple[str, ...], float]] = []
+
+        with self._lock:
+            for label_values, counts in sorted(self._counts.items()):
+                cumulative_count: int = 0
+                for upper_bound, bucket_count in zip(self.buckets, counts):
+                    cumulative_count += bucket_count
+                    samples.append(
+                        (
+                            "_bucket",
+                            label_values + (_format_value(upper_bound),),
+                            ("le",),
+                            cumulative_count,
+                        )
+                    )
+
+                samples.append(("_sum", label_values, (), self._sums[label_values]))
+                samples.append(("_count", label_values, (), cumulative_count))
+
+        return samples
+
+
+class Throughput:
+    """
+    The rate of change of a count over a sliding window, e.g. objects per second.
+
+    Used as a gauge callback: every call records a sample of `read_count` and returns its rate
+    over the samples from the last `window_s` seconds.
+
+    Parameters
+    ----------
+    read_count : Callable[[], float]
+        Reads the current count, e.g. `counter.total` or `lambda: counter.value(...)`.
+    window_s : float, default THROUGHPUT_WINDOW_S
+        Length of the sliding window, in seconds.
+    """
+
+    def __init__(
+        self, read_count: Callable[[], float], window_s: float = THROUGHPUT_WINDOW_S
+    ):
+        self.read_count = read_count
+        self.window_s = window_s
+
+        self._samples: Deque[Tuple[float, float]] = deque()
+        self._lock = threading.Lock()
+
+    def __call__(self) -> float:
+        now: float = time.monotonic()
+
+        with self._lock:
+            self._samples.append((now, self.read_count()))
+
+            # Keep one sample older than the window, so the rate spans the whole window
+            while len(self._samples) > 2 and self._samples[1][0] <= now - self.window_s:
+                self._samples.popleft()
+
+            (start_time, start_count), (end_time, end_count) = (
+                self._samples[0],
+                self._samples[-1],
+            )
+
+        if end_time <= start_time:
+            return 0.0
+
+        return (end_count - start_count) / (end_time - start_time)
+
+
+class MetricsRegistry:
+    """
+    A collection of metrics, looked up (or created on first use) by name.
+
+    Every component of the ingest registers its metrics on the same registry, so requesting a
+    metric that already exists returns it rather than creating a duplicate.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(
+        self, metric_type: type, name: str, documentation: str, **kwargs
+    ) -> _Metric:
+        with self._lock:
+            metric: Optional[_Metric] = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = metric_type(
+                    name, documentation, **kwargs
+                )
+            elif not isinstance(metric, metric_type):
+                raise ValueError(
+                    f"Metric '{name}' is already registered as a {metric.type_name}"
+                )
+
+            return metric
+
+    def counter(
+        self, name: str, documentation: str, label_names: Sequence[str] = ()
+    ) -> Counter:
+        """Get or create a counter."""
+        return self._get_or_create(
+            Counter, name, documentation, label_names=label_names
+        )
+
+    def gauge(
+        self, name: str, documentation: str, label_names: Sequence[str] = ()
+    ) -> Gauge:
+        """Get or create a gauge."""
+        return self._get_or_create(Gauge, name, documentation, label_names=label_names)
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        label_names: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        """Get or create a histogram."""
+        return self._get_or_create(
+            Histogram, name, documentation, label_names=label_names, buckets=buckets
+        )
+
+    def render(self) -> str:
+        """Every metric in the Prometheus text exposition format."""
+        with self._lock:
+            metrics: List[_Metric] = list(self._metrics.values())
+
+        return "".join(f"{line}\n" for metric in metrics for line in metric.render())
+
+    def snapshot(self) -> Dict[str, float]:
+        """
+        The current value of every sample, keyed by its Prometheus name and labels, e.g.
+        `ingest_objects_total{outcome="uploaded"}`. Histogram buckets are left out.
+        """
+        with self._lock:
+            metrics: List[_Metric] = list(self._metrics.values())
+
+        snapshot: Dict[str, float] = {}
+        for metric in metrics:
+            for suffix, label_values, extra_label_names, value in metric.samples():
+                if suffix == "_bucket":
+                    continue
+
+                labels: str = _format_labels(
+                    metric.label_names + extra_label_names, label_values
+                )
+                snapshot[f"{metric.name}{suffix}{labels}"] = value
+
+        return snapshot
+
+
+class MetricsServer:
+    """
+    Serves a registry's metrics over HTTP on a background thread, for Prometheus to scrape.
+
+    Parameters
+    ----------
+    registry : MetricsRegistry
+        The metrics to serve.
+    host : str, default METRICS_HOST
+        Interface to listen on. Defaults to localhost only.
+    port : int, default METRICS_PORT
+        Port to listen on. `0` picks a free port, available as `port` once started.
+    logger : Optional[logging.Logger]
+        Logger for the server's start-up message.
+    """
+
+    def __init__(
+        self,
+        registry: MetricsRegistry,
+        host: str = METRICS_HOST,
+        port: int = METRICS_PORT,
+        logger: Optional[logging.Logger] = None,
+    ):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self.logger = logger or logging.getLogger(__name__)
+
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def __enter__(self) -> "MetricsServer":
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def start(self) -> None:
+        """Start serving metrics."""
+        registry: MetricsRegistry = self.registry
+
+        class _Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?", 1)[0] != METRICS_PATH:
+                    self.send_error(404)
+                    return
+
+                body: bytes = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                # Scrapes every few seconds would otherwise flood stderr
+                pass
+
+        self._server = ThreadingHTTPServer((self.host, self.port), _Handler)
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="metrics-server", daemon=True
+        )
+        self._thread.start()
+
+        self.logger.info(
+            "Serving metrics on http://%s:%d%s", self.host, self.port, METRICS_PATH
+        )
+
+    def close(self) -> None:
+        """Stop serving metrics."""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            self._server = None
+
+
+class JsonlMetricsWriter:
+    """
+    Periodically appends snapshots of a registry's metrics to a JSONL file.
+
+    Each line is `{"timestamp": <unix time>, "metrics": <MetricsRegistry.snapshot()>}`. A final
+    snapshot is written on `close`, so the file always ends with the totals for the run.
+
+    Parameters
+    ----------
+    registry : MetricsRegistry
+        The metrics to write.
+    path : Union[str, os.PathLike]
+        Path to the JSONL file, appended to if it exists.
+    interval_s : float, default SNAPSHOT_INTERVAL_S
+        Seconds between snapshots.
+    """
+
+    def __init__(
+        self,
+        registry: MetricsRegistry,
+        path: Union[str, os.PathLike],
+        interval_s: float = SNAPSHOT_INTERVAL_S,
+    ):
+        self.registry = registry
+        self.path = path
+        self.interval_s = interval_s
+
+        self._file = open(path, "a", encoding="utf-8")
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="metrics-writer", daemon=True
+        )
+        self._thread.start()
+
+    def __enter__(self) -> "JsonlMetricsWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def write_snapshot(self) -> None:
+        """Append a snapshot of the metrics to the file."""
+        line: str = json.dumps(
+            {"timestamp": time.time(), "metrics": self.registry.snapshot()}
+        )
+        self._file.write(line + "\n")
+        self._file.flush()
+
+    def _run(self) -> None:
+        while not self._stop_event.wait(self.interval_s):
+            self.write_snapshot()
+
+    def close(self) -> None:
+        """Write a final snapshot and close the file."""
+        if self._file.closed:
+            return
+
+        self._stop_event.set()
+        self._thread.join()
+        self.write_snapshot()
+        self._file.close()
@@ -0,0 +1,75 @@
+"""
+Multi-view mosaics: an alternative object-embedding recipe costing one CLIP pass per object.
+
+Instead of embedding every view and averaging the embeddings, a subset of `grid_size ** 2`
+views (spread around the object, see `utils.early_stopping.diverse_view_order`) is downscaled
+and tiled into a single grid image of the CLIP input size, which is embedded once. Unused
+tiles, and the margin left when the input size is not a multiple of `grid_size`, are
+transparent, so they are composited onto the background colour like the rest of each view.
+
+The embeddings differ from the per-view mean (the model sees each view at a lower resolution,
+and in context of the others), so the two recipes should not be mixed within a collection;
+`evaluate_retrieval.py` compares their text-to-object retrieval quality.
+"""
+
+from typing import List, Sequence
+
+import numpy as np
+from PIL import Image
+
+from utils.early_stopping import diverse_view_order
+from utils.preprocessing import CLIP_IMAGE_SIZE
+
+MOSAIC_GRID_SIZE = 2
+
+
+def mosaic_view_idxs(num_views: int, grid_size: int = MOSAIC_GRID_SIZE) -> List[int]:
+    """The indices of the views tiled into an object's mosaic, in tile order."""
+    return sorted(diverse_view_order(num_views)[: grid_size**2])
+
+
+def tile_views(
+    images: Sequence[np.ndarray],
+    grid_size: int = MOSAIC_GRID_SIZE,
+    image_size: int = CLIP_IMAGE_SIZE,
+) -> np.ndarray:
+    """
+    Tile up to `grid_size ** 2` uint8 RGBA views, row by row, into one mosaic.
+
+    Parameters
+    ----------
+    images : Sequence[np.ndarray]
+        The views to tile, each of shape `(height, width, 4)`.
+    grid_size : int, default MOSAIC_GRID_SIZE
+        Number of tiles along each side of the mosaic.
+    image_size : int, default CLIP_IMAGE_SIZE
+        Side length of the mosaic.
+
+    Returns
+    -------
+    np.ndarray
+        The mosaic, as a uint8 RGBA array of shape `(image_size, image_size, 4)`.
+    """
+    if len(images) > grid_size**2:
+        raise ValueError(
+            f"Cannot tile {len(images)} views into a {grid_size}x{grid_size} mosaic"
+        )
+
+    tile_size: int = image_size // grid_size
+    mosaic: np.ndarray = np.zeros((image_size, image_size, 4), dtype=np.uint8)
+
+    for tile_idx, image in enumerate(images):
+        row, column = divmod(tile_idx, grid_size)
+
+        # Box resampling averages every source pixel, like a CLIP-resolution thumbnail
+        tile: np.ndarray = np.asarray(
+            Image.fromarray(image).resize(
+                (tile_size, tile_size), resample=Image.Resampling.BOX
+            )
+        )
+        mosaic[
+            row * tile_size : (row + 1) * tile_size,
+            column * tile_size : (column + 1) * tile_size,
+        ] = tile
+
+    return mosaic
@@ -0,0 +1,310 @@
+"""
+ONNX Runtime inference backend for the CLIP vision and text towers.
+
+`export_onnx` exports both towers of a SentenceTransformer CLIP model to ONNX graphs once, and
+caches them on disk (together with the tokenizer) under `onnx_dir`; later runs only load the
+graphs, without loading the PyTorch model at all. With `quantize`, the exported graphs are
+also dynamically quantized to int8 with ONNX Runtime's quantizer, and cached alongside.
+
+`OnnxClipEncoder` runs the graphs through ONNX Runtime behind the same `encode_views` and
+`encode_texts` interface as `utils.encoders.ClipImageEncoder`, with configurable intra-op and
+inter-op thread pools. `check_encoder_parity.py` compares its embeddings and throughput with
+the PyTorch model.
+
+Example:
+    ```python
+    encoder = OnnxClipEncoder.from_pretrained("clip-ViT-B-32", intra_op_threads=4)
+    embeddings = encoder.encode_views(views)
+    ```
+"""
+
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+import onnxruntime
+
+from utils.encoders import ViewEncoder
+from utils.preprocessing import BACKGROUND_COLOUR, CLIP_IMAGE_SIZE, to_pixel_values
+
+ONNX_DIR = Path("models") / "onnx"
+ONNX_OPSET = 17
+
+# Bump whenever the exported graphs change, to invalidate cached exports
+EXPORT_VERSION = 1
+
+VISION_GRAPH = "vision.onnx"
+TEXT_GRAPH = "text.onnx"
+METADATA_FILE = "export.json"
+
+
+def _graph_path(export_dir: Path, graph_name: str, quantize: bool) -> Path:
+    return export_dir / (
+        graph_name.replace(".onnx", ".int8.onnx") if quantize else graph_name
+    )
+
+
+def _export_metadata(model_name: str) -> Dict[str, Union[str, int]]:
+    return {
+        "model_name": model_name,
+        "export_version": EXPORT_VERSION,
+        "opset": ONNX_OPSET,
+    }
+
+
+def export_onnx(
+    model_name: str,
+    onnx_dir: Union[str, os.PathLike] = ONNX_DIR,
+    quantize: bool = False,
+    logger: Optional[logging.Logger] = None,
+) -> Path:
+    """
+    Export the vision and text towers of a SentenceTransformer CLIP model to ONNX, unless
+    they have already been exported.
+
+    Parameters
+    ----------
+    model_name : str
+        Name of the SentenceTransformer CLIP model, e.g. `clip-ViT-B-32`.
+    onnx_dir : Union[str, os.PathLike], default ONNX_DIR
+        Directory holding the exports, one subdirectory per model.
+    quantize : bool, default False
+        Whether to also export dynamically int8-quantized graphs.
+    logger : Optional[logging.Logger]
+        Logger for export progress.
+
+    Returns
+    -------
+    Path
+        The model's export directory.
+    """
+    logger = logger or logging.getLogger(__name__)
+
+    export_dir: Path = Path(onnx_dir) / model_name
+    metadata_path: Path = export_dir / METADATA_FILE
+
+    exported: bool = (
+        metadata_path.exists()
+        and json.loads(metadata_path.read_text()) == _export_metadata(model_name)
+        and (export_dir / VISION_GRAPH).exists()
+        and (export_dir / TEXT_GRAPH).exists()
+    )
+    if not exported:
+        _export_towers(model_name, export_dir, logger)
+        metadata_path.write_text(json.dumps(_export_metadata(model_name), indent=2))
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        for graph_name in (VISION_GRAPH, TEXT_GRAPH):
+            quantized_path: Path = _graph_path(export_dir, graph_name, quantize=True)
+            if not exported or not quantized_path.exists():
+                logger.info("Quantizing %s to int8", graph_name)
+                quantize_dynamic(
+                    export_dir / graph_name,
+                    quantized_path,
+                    weight_type=QuantType.QInt8,
+                )
+
+    return export_dir
+
+
+def _export_towers(model_name: str, export_dir: Path, logger: logging.Logger) -> None:
+    # PyTorch is only needed for the export
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    class VisionTower(torch.nn.Module):
+        def __init__(self, clip_model: torch.nn.Module):
+            super().__init__()
+            self.clip_model = clip_model
+
+        def forward(self, pixel_values: torch.Tensor) -> torch.Tensor:
+            return self.clip_model.get_image_features(pixel_values=pixel_values)
+
+    class TextTower(torch.nn.Module):
+        def __init__(self, clip_model: torch.nn.Module):
+            super().__init__()
+            self.clip_model = clip_model
+
+        def forward(
+            self, input_ids: torch.Tensor, attention_mask: torch.Tensor
+        ) -> torch.Tensor:
+            return self.clip_model.get_text_features(
+                input_ids=input_ids, attention_mask=attention_mask
+            )
+
+    logger.info("Exporting %s to ONNX in %s", model_name, export_dir)
+    export_dir.mkdir(parents=True, exist_ok=True)
+
+    model = SentenceTransformer(model_name, device="cpu")
+    clip_model: torch.nn.Module = model[0].model.eval()
+    tokenizer = model[0].processor.tokenizer
+    tokenizer.save_pretrained(export_dir)
+
+    sample_tokens = tokenizer(["a 3D model"], return_tensors="pt")
+
+    # Export to temporary files first, so an interrupted export is never mistaken for a
+    # complete one
+    with torch.inference_mode():
+        torch.onnx.export(
+            VisionTower(clip_model),
+            (torch.zeros(1, 3, CLIP_IMAGE_SIZE, CLIP_IMAGE_SIZE),),
+            export_dir / f"{VISION_GRAPH}.tmp",
+            input_names=["pixel_values"],
+            output_names=["embeddings"],
+            dynamic_axes={"pixel_values": {0: "batch"}, "embeddings": {0: "batch"}},
+            opset_version=ONNX_OPSET,
+        )
+        torch.onnx.export(
+            TextTower(clip_model),
+            (sample_tokens["input_ids"], sample_tokens["attention_mask"]),
+            export_dir / f"{TEXT_GRAPH}.tmp",
+            input_names=["input_ids", "attention_mask"],
+            output_names=["embeddings"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+                "embeddings": {0: "batch"},
+            },
+            opset_version=ONNX_OPSET,
+        )
+
+    for graph_name in (VISION_GRAPH, TEXT_GRAPH):
+        os.replace(export_dir / f"{graph_name}.tmp", export_dir / graph_name)
+
+
+def new_session_options(
+    intra_op_threads: Optional[int] = None, inter_op_threads: int = 1
+) -> onnxruntime.SessionOptions:
+    """
+    ONNX Runtime session options with all graph optimisations enabled.
+
+    Parameters
+    ----------
+    intra_op_threads : Optional[int]
+        Threads used within an operator. Defaults to ONNX Runtime's choice (every core).
+    inter_op_threads : int, default 1
+        Threads used to run independent operators in parallel; more than one enables
+        parallel execution of the graph.
+    """
+    session_options = onnxruntime.SessionOptions()
+    session_options.graph_optimization_level = (
+        onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+    )
+
+    if intra_op_threads is not None:
+        session_options.intra_op_num_threads = intra_op_threads
+    session_options.inter_op_num_threads = inter_op_threads
+    session_options.execution_mode = (
+        onnxruntime.ExecutionMode.ORT_PARALLEL
+        if inter_op_threads > 1
+        else onnxruntime.ExecutionMode.ORT_SEQUENTIAL
+    )
+
+    return session_options
+
+
+class OnnxClipEncoder(ViewEncoder):
+    """
+    Encodes views and captions with CLIP towers exported to ONNX, using ONNX Runtime.
+
+    Sessions are created lazily, so an encoder used only for views never loads the text graph.
+    `encode_views` and `encode_texts` are thread-safe.
+
+    Parameters
+    ----------
+    export_dir : Union[str, os.PathLike]
+        A model's export directory, as returned by `export_onnx`.
+    quantize : bool, default False
+        Whether to run the int8-quantized graphs.
+    intra_op_threads : Optional[int]
+        Threads used within an operator. Defaults to ONNX Runtime's choice (every core).
+    inter_op_threads : int, default 1
+        Threads used to run independent operators in parallel.
+    background_colour : Tuple[int, int, int], default BACKGROUND_COLOUR
+        RGB colour composited behind transparent pixels of the views.
+    """
+
+    def __init__(
+        self,
+        export_dir: Union[str, os.PathLike],
+        quantize: bool = False,
+        intra_op_threads: Optional[int] = None,
+        inter_op_threads: int = 1,
+        background_colour: Tuple[int, int, int] = BACKGROUND_COLOUR,
+    ):
+        self.export_dir = Path(export_dir)
+        self.quantize = quantize
+        self.background_colour = background_colour
+        self.session_options: onnxruntime.SessionOptions = new_session_options(
+            intra_op_threads, inter_op_threads
+        )
+
+        self.vision_session: onnxruntime.InferenceSession = self._new_session(
+            VISION_GRAPH
+        )
+        self._text_session: Optional[onnxruntime.InferenceSession] = None
+        self._tokenizer = None
+        self._text_lock = threading.Lock()
+
+    @classmethod
+    def from_pretrained(
+        cls,
+        model_name: str,
+        onnx_dir: Union[str, os.PathLike] = ONNX_DIR,
+        quantize: bool = False,
+        **kwargs,
+    ) -> "OnnxClipEncoder":
+        """Export the CLIP model `model_name` to ONNX if needed, and load its graphs."""
+        return cls(
+            export_onnx(model_name, onnx_dir=onnx_dir, quantize=quantize),
+            quantize=quantize,
+            **kwargs,
+        )
+
+    def graph_paths(self) -> List[Path]:
+        """The vision and text graphs this encoder runs."""
+        return [
+            _graph_path(self.export_dir, graph_name, self.quantize)
+            for graph_name in (VISION_GRAPH, TEXT_GRAPH)
+        ]
+
+    def _new_session(self, graph_name: str) -> onnxruntime.InferenceSession:
+        return onnxruntime.InferenceSession(
+            str(_graph_path(self.export_dir, graph_name, self.quantize)),
+            sess_options=self.session_options,
+            providers=["CPUExecutionProvider"],
+        )
+
+    def encode_views(self, views: np.ndarray) -> np.ndarray:
+        pixel_values: np.ndarray = to_pixel_values(
+            views, background_colour=self.background_colour
+        )
+
+        return self.vision_session.run(None, {"pixel_values": pixel_values})[0]
+
+    def encode_texts(self, texts: List[str]) -> np.ndarray:
+        """Embed captions with the text tower, e.g. as retrieval queries."""
+        with self._text_lock:
+            if self._text_session is None:
+                from transformers import AutoTokenizer
+
+                self._tokenizer = AutoTokenizer.from_pretrained(self.export_dir)
+                self._text_session = self._new_session(TEXT_GRAPH)
+
+        tokens = self._tokenizer(
+            texts, padding=True, truncation=True, return_tensors="np"
+        )
+
+        return self._text_session.run(
+            None,
+            {
+                "input_ids": tokens["input_ids"].astype(np.int64),
+                "attention_mask": tokens["attention_mask"].astype(np.int64),
+            },
+        )[0]
@@ -0,0 +1,454 @@
+"""
+A small threaded, multi-stage pipeline joined by bounded queues.
+
+Each stage runs its own pool of worker threads, reading items from the queue fed by the
+previous stage and writing zero or more results to the queue consumed by the next stage.
+Bounded queues apply backpressure, so a slow stage throttles the stages upstream of it and the
+pipeline as a whole runs at the speed of its slowest stage rather than the sum of all stages.
+
+Example:
+    ```python
+    pipeline = Pipeline(
+        stages=[
+            Stage.from_function("scan", scan_object, workers=2),
+            Stage.from_function("decode", decode_object, workers=8),
+        ]
+    )
+
+    for decoded_object in pipeline.run(object_folders):
+        ...
+    ```
+"""
+
+import logging
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Iterable, Iterator, List, Optional
+
+from utils.metrics import MetricsRegistry
+
+QUEUE_SIZE = 64
+QUEUE_POLL_INTERVAL_S = 0.1
+
+
+class _EndOfStream:
+    """Sentinel marking the end of a stage's input stream."""
+
+
+END_OF_STREAM = _EndOfStream()
+
+
+class StageHandler:
+    """
+    Per-worker processing logic for a pipeline stage.
+
+    A new handler is created for every worker thread, so handlers may keep per-worker state
+    (e.g. a model reference or a buffer of pending items) without locking.
+    """
+
+    def process(self, item: Any) -> Iterable[Any]:
+        """
+        Process a single item, returning zero or more items for the next stage.
+
+        Parameters
+        ----------
+        item : Any
+            The item produced by the previous stage (or the pipeline source).
+
+        Returns
+        -------
+        Iterable[Any]
+            The items to pass downstream.
+        """
+        raise NotImplementedError
+
+    def flush(self) -> Iterable[Any]:
+        """
+        Emit any buffered items once the worker's input stream is exhausted.
+
+        Returns
+        -------
+        Iterable[Any]
+            The remaining items to pass downstream.
+        """
+        return ()
+
+    def close(self) -> Iterable[Any]:
+        """
+        Release the handler's resources once its worker finishes, whether the stream was
+        flushed or the pipeline was stopped.
+
+        Returns
+        -------
+        Iterable[Any]
+            The items still held by the handler, which will never be emitted (only non-empty if
+            the pipeline was stopped before `flush`). They are recorded as failures.
+        """
+        return ()
+
+
+class _FunctionHandler(StageHandler):
+    def __init__(self, function: Callable[[Any], Any]):
+        self.function = function
+
+    def process(self, item: Any) -> Iterable[Any]:
+        result = self.function(item)
+
+        return () if result is None else (result,)
+
+
+@dataclass
+class Stage:
+    """
+    Configuration for a single pipeline stage.
+
+    Parameters
+    ----------
+    name : str
+        Name of the stage, used in logs and failure records.
+    handler_factory : Callable[[], StageHandler]
+        Factory called once per worker thread to create that worker's handler.
+    workers : int, default 1
+        Number of worker threads running the stage.
+    queue_size : int, default QUEUE_SIZE
+        Capacity of the bounded queue feeding the stage.
+    """
+
+    name: str
+    handler_factory: Callable[[], StageHandler]
+    workers: int = 1
+    queue_size: int = QUEUE_SIZE
+
+    @classmethod
+    def from_function(
+        cls,
+        name: str,
+        function: Callable[[Any], Any],
+        workers: int = 1,
+        queue_size: int = QUEUE_SIZE,
+    ) -> "Stage":
+        """
+        Create a stateless stage from a function mapping one item to one result.
+
+        Returning `None` from `function` drops the item.
+        """
+        return cls(
+            name=name,
+            handler_factory=lambda: _FunctionHandler(function),
+            workers=workers,
+            queue_size=queue_size,
+        )
+
+
+class PipelineStopped(Exception):
+    """Recorded as the error of items a handler still held when the pipeline was stopped."""
+
+
+class BatchFailure(Exception):
+    """
+    Raised by a handler when a failure affects several items at once, e.g. every item with
+    data in a failed batch. Each of `items` is recorded as a failure of the stage.
+    """
+
+    def __init__(self, items: List[Any], error: BaseException):
+        super().__init__(str(error))
+        self.items = items
+        self.error = error
+
+
+@dataclass
+class StageFailure:
+    """
+    An item that raised while being processed by a stage, identified by its name (`None` if
+    the failure was not caused by a single named item).
+    """
+
+    stage: str
+    name: Optional[str]
+    error: BaseException
+
+
+def item_name(item: Any) -> Optional[str]:
+    """
+    The name of a pipeline item: its `name` attribute, the item itself if it is a string, or
+    the string in an `(index, name)`-like tuple.
+
+    Failures record only this, so they do not keep an item's (possibly large) data alive.
+    """
+    name = getattr(item, "name", None)
+    if isinstance(name, str):
+        return name
+    if isinstance(item, str):
+        return item
+    if isinstance(item, tuple):
+        return next((field for field in item if isinstance(field, str)), None)
+
+    return None
+
+
+class Pipeline:
+    """
+    Runs items through a sequence of stages, each backed by its own worker threads.
+
+    Per-item exceptions are logged and recorded in `failures` without stopping the pipeline. A
+    handler raising `BatchFailure` has each of its items recorded instead. Items a handler still
+    holds when the pipeline is stopped, or that it emitted but could not pass on, are recorded
+    with a `PipelineStopped` error.
+
+    If a metrics registry is given, the time each stage spends processing items, the number of
+    items each stage processes, fails and emits, and the depth of each stage's input queue are
+    recorded on it.
+    """
+
+    def __init__(
+        self,
+        stages: List[Stage],
+        logger: Optional[logging.Logger] = None,
+        metrics: Optional[MetricsRegistry] = None,
+    ):
+        if not stages:
+            raise ValueError("A pipeline requires at least one stage")
+
+        self.stages: List[Stage] = stages
+        self.logger: logging.Logger = logger or logging.getLogger(__name__)
+        self.failures: List[StageFailure] = []
+
+        self.metrics: MetricsRegistry = metrics or MetricsRegistry()
+        self._stage_seconds = self.metrics.histogram(
+            "pipeline_stage_seconds",
+            "Time spent processing a single item, per stage",
+            ["stage"],
+        )
+        self._stage_items = self.metrics.counter(
+            "pipeline_stage_items",
+            "Items processed, failed and emitted, per stage",
+            ["stage", "outcome"],
+        )
+        self._queue_depth = self.metrics.gauge(
+            "pipeline_queue_depth",
+            "Items waiting in the queue in front of each stage",
+            ["stage"],
+        )
+
+        self._queues: List[queue.Queue] = []
+        self._stop_event = threading.Event()
+        self._failures_lock = threading.Lock()
+
+    def queue_depths(self) -> List[int]:
+        """Approximate number of items waiting in front of each stage."""
+        return [stage_queue.qsize() for stage_queue in self._queues]
+
+    def stop(self) -> None:
+        """Ask all workers to stop as soon as possible, discarding in-flight items."""
+        self._stop_event.set()
+
+    def _put(self, target_queue: queue.Queue, item: Any) -> bool:
+        while not self._stop_event.is_set():
+            try:
+                target_queue.put(item, timeout=QUEUE_POLL_INTERVAL_S)
+                return True
+            except queue.Full:
+                continue
+
+        return False
+
+    def _get(self, source_queue: queue.Queue) -> Any:
+        while not self._stop_event.is_set():
+            try:
+                return source_queue.get(timeout=QUEUE_POLL_INTERVAL_S)
+            except queue.Empty:
+                continue
+
+        return END_OF_STREAM
+
+    def _record_failure(self, stage: Stage, item: Any, error: BaseException) -> None:
+        name: Optional[str] = item_name(item)
+        self.logger.error(
+            "Stage '%s' failed to process item %s: %s", stage.name, name, error
+        )
+
+        with self._failures_lock:
+            self.failures.append(StageFailure(stage=stage.name, name=name, error=error))
+
+        self._stage_items.inc(stage=stage.name, outcome="failed")
+
+    def _handle(self, stage: Stage, handle: Callable[[], Iterable[Any]]) -> List[Any]:
+        # Results are gathered before being passed on, so time spent blocked on a full
+        # downstream queue is not counted as processing time
+        start_time: float = time.perf_counter()
+        results: List[Any] = list(handle())
+        self._stage_seconds.observe(time.perf_counter() - start_time, stage=stage.name)
+
+        if results:
+            self._stage_items.inc(len(results), stage=stage.name, outcome="emitted")
+
+        return results
+
+    def _emit(
+        self, stage: Stage, output_queue: queue.Queue, results: List[Any]
+    ) -> None:
+        for result in results:
+            if not self._put(output_queue, result):
+                self._record_failure(
+                    stage,
+                    result,
+                    PipelineStopped(
+                        "The pipeline stopped before the item was passed on"
+                    ),
+                )
+
+    def _close(self, stage: Stage, handler: StageHandler) -> None:
+        try:
+            for unfinished_item in handler.close():
+                self._record_failure(
+                    stage,
+                    unfinished_item,
+                    PipelineStopped(
+                        "The pipeline stopped before the item was processed"
+                    ),
+                )
+        except Exception as e:
+            self._record_failure(stage, None, e)
+
+    def _feed(self, source: Iterable[Any]) -> None:
+        try:
+            for item in source:
+                if not self._put(self._queues[0], item):
+                    break
+        except Exception as e:
+            self._record_failure(self.stages[0], None, e)
+        finally:
+            for _ in range(self.stages[0].workers):
+                self._put(self._queues[0], END_OF_STREAM)
+
+    def _work(
+        self,
+        stage: Stage,
+        input_queue: queue.Queue,
+        output_queue: queue.Queue,
+        downstream_workers: int,
+        finished_workers: List[int],
+        finished_lock: threading.Lock,
+    ) -> None:
+        handler: Optional[StageHandler] = None
+        try:
+            try:
+                handler = stage.handler_factory()
+            except Exception as e:
+                # A stage without a handler would stall every upstream stage, so give up
+                self._record_failure(stage, None, e)
+                self.stop()
+                return
+
+            while True:
+                item = self._get(input_queue)
+                if item is END_OF_STREAM:
+                    break
+
+                try:
+                    self._emit(
+                        stage,
+                        output_queue,
+                        self._handle(stage, lambda: handler.process(item)),
+                    )
+                    self._stage_items.inc(stage=stage.name, outcome="processed")
+                except BatchFailure as e:
+                    for failed_item in e.items:
+                        self._record_failure(stage, failed_item, e.error)
+                except Exception as e:
+                    self._record_failure(stage, item, e)
+
+            if not self._stop_event.is_set():
+                try:
+                    self._emit(stage, output_queue, self._handle(stage, handler.flush))
+                except BatchFailure as e:
+                    for failed_item in e.items:
+                        self._record_failure(stage, failed_item, e.error)
+                except Exception as e:
+                    self._record_failure(stage, None, e)
+        finally:
+            if handler is not None:
+                self._close(stage, handler)
+
+            with finished_lock:
+                finished_workers[0] += 1
+                last_worker: bool = finished_workers[0] == stage.workers
+
+            # The last worker of a stage to finish signals the end of the stream downstream
+            if last_worker:
+                for _ in range(downstream_workers):
+                    self._put(output_queue, END_OF_STREAM)
+
+    def run(self, source: Iterable[Any]) -> Iterator[Any]:
+        """
+        Run every item from `source` through the pipeline.
+
+        Parameters
+        ----------
+        source : Iterable[Any]
+            The items fed to the first stage. Consumed lazily on a dedicated thread.
+
+        Yields
+        ------
+        Any
+            The items emitted by the final stage, in completion order.
+        """
+        self._stop_event.clear()
+        self._queues = [queue.Queue(maxsize=stage.queue_size) for stage in self.stages]
+        results_queue: queue.Queue = queue.Queue(maxsize=self.stages[-1].queue_size)
+
+        for stage, stage_queue in zip(self.stages, self._queues):
+            self._queue_depth.set_function(stage_queue.qsize, stage=stage.name)
+
+        threads: List[threading.Thread] = [
+            threading.Thread(
+                target=self._feed, args=(source,), name="pipeline-feed", daemon=True
+            )
+        ]
+
+        for stage_idx, stage in enumerate(self.stages):
+            is_last_stage: bool = stage_idx == len(self.stages) - 1
+            output_queue: queue.Queue = (
+                results_queue if is_last_stage else self._queues[stage_idx + 1]
+            )
+            downstream_workers: int = (
+                1 if is_last_stage else self.stages[stage_idx + 1].workers
+            )
+            finished_workers: List[int] = [0]
+            finished_lock = threading.Lock()
+
+            for worker_idx in range(stage.workers):
+                threads.append(
+                    threading.Thread(
+                        target=self._work,
+                        args=(
+                            stage,
+                            self._queues[stage_idx],
+                            output_queue,
+                            downstream_workers,
+                            finished_workers,
+                            finished_lock,
+                        ),
+                        name=f"pipeline-{stage.name}-{worker_idx}",
+                        daemon=True,
+                    )
+                )
+
+        for thread in threads:
+            thread.start()
+
+        try:
+            while True:
+                result = self._get(results_queue)
+                if result is END_OF_STREAM:
+                    break
+
+                yield result
+        finally:
+            # Reached on normal completion as well as when the consumer stops iterating early
+            self.stop()
+
+            for thread in threads:
+                thread.join()
@@ -0,0 +1,288 @@
+"""
+Blue/green reindexing: building a new version of a collection while the current one serves.
+
+Each reindex builds into a versioned collection (e.g. `Cap3DMM_v3` for the stable name
+`Cap3DMM`). Once it passes verification, the stable name is repointed at it in one step:
+
+- with a Weaviate alias, where the server (1.32+) and client (4.16+) support them: queries by
+  the stable name are routed to the new version atomically;
+- otherwise, with a pointer in a YAML state file (`ACTIVE_COLLECTIONS_PATH`), which the query
+  side resolves with `resolve_collection_name`.
+
+The state file also records when each previous version was retired, so `garbage_collect` can
+delete it once a grace period has passed (leaving time to roll back by repointing).
+
+Example:
+    ```python
+    collection_name = resolve_collection_name("Cap3DMM")
+    response = client.collections.get(collection_name).query.near_vector(query_vector)
+    ```
+"""
+
+import itertools
+import logging
+import os
+import re
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+
+from weaviate import WeaviateClient
+from weaviate.collections import Collection
+
+from utils.config import load_config, save_config
+
+ACTIVE_COLLECTIONS_PATH = Path("configs") / "active_collections.yml"
+VERSION_SEPARATOR = "_v"
+
+POINTER_ALIAS = "alias"
+POINTER_CONFIG = "config"
+
+GRACE_PERIOD_S = 48 * 3600.0
+
+# Objects whose own vector must retrieve them, to spot-check a new version's index
+SPOT_CHECK_OBJECTS = 100
+SPOT_CHECK_LIMIT = 10
+
+
+def versioned_name(base_name: str, version: int) -> str:
+    """The name of version `version` of a collection, e.g. `Cap3DMM_v3`."""
+    return f"{base_name}{VERSION_SEPARATOR}{version}"
+
+
+def collection_versions(client: WeaviateClient, base_name: str) -> Dict[int, str]:
+    """The existing versions of a collection, keyed by version number."""
+    pattern = re.compile(rf"{re.escape(base_name)}{VERSION_SEPARATOR}(\d+)")
+
+    versions: Dict[int, str] = {}
+    for name in client.collections.list_all(simple=True):
+        match = pattern.fullmatch(name)
+        if match:
+            versions[int(match.group(1))] = name
+
+    return versions
+
+
+def _load_state(base_name: str, state_path: Union[str, os.PathLike]) -> Dict[str, Any]:
+    return dict(load_config(state_path).get(base_name) or {})
+
+
+def _save_state(
+    base_name: str, state: Dict[str, Any], state_path: Union[str, os.PathLike]
+) -> None:
+    states: Dict[str, Any] = load_config(state_path)
+    states[base_name] = state
+    save_config(
+        state_path,
+        states,
+        header=(
+            "Active version of each collection, written by `python data_loading.py "
+            "reindex`.\nResolve it with utils.reindex.resolve_collection_name."
+        ),
+    )
+
+
+def resolve_collection_name(
+    base_name: str,
+    state_path: Union[str, os.PathLike] = ACTIVE_COLLECTIONS_PATH,
+) -> str:
+    """
+    The name of the collection currently serving as `base_name`: its active version after a
+    reindex, or `base_name` itself if it has never been reindexed.
+    """
+    return _load_state(base_name, state_path).get("active", base_name)
+
+
+def _supports_aliases(client: WeaviateClient) -> bool:
+    return hasattr(client, "alias")
+
+
+def promote(
+    client: WeaviateClient,
+    base_name: str,
+    collection_name: str,
+    state_path: Union[str, os.PathLike] = ACTIVE_COLLECTIONS_PATH,
+    use_alias: bool = True,
+    logger: Optional[logging.Logger] = None,
+) -> str:
+    """
+    Repoint `base_name` at `collection_name`, retiring the collection it pointed at.
+
+    A plain (never reindexed) collection named `base_name` keeps its name, and keeps serving
+    clients that do not resolve the pointer, until it is garbage-collected with the other
+    retired versions: while it exists the name cannot be aliased, so the state file's pointer
+    is used instead. Once it is gone, promotions alias the name and swap the alias atomically.
+
+    Parameters
+    ----------
+    client : WeaviateClient
+        The Weaviate client.
+    base_name : str
+        The stable collection name queries use, e.g. `Cap3DMM`.
+    collection_name : str
+        The verified collection to serve as `base_name`.
+    state_path : Union[str, os.PathLike], default ACTIVE_COLLECTIONS_PATH
+        YAML file recording the active and retired versions of each collection.
+    use_alias : bool, default True
+        Whether to repoint a Weaviate alias, if the client supports them; otherwise only the
+        state file's pointer is updated.
+    logger : Optional[logging.Logger]
+        Logger for the cut-over.
+
+    Returns
+    -------
+    str
+        How `base_name` now points at `collection_name`: `POINTER_ALIAS` or `POINTER_CONFIG`.
+    """
+    logger = logger or logging.getLogger(__name__)
+
+    state: Dict[str, Any] = _load_state(base_name, state_path)
+    previous_name: Optional[str] = state.get("active")
+
+    pointer: str = POINTER_CONFIG
+    if use_alias and _supports_aliases(client):
+        try:
+            if client.alias.get(alias_name=base_name) is not None:
+                client.alias.update(
+                    alias_name=base_name, new_target_collection=collection_name
+                )
+                pointer = POINTER_ALIAS
+            elif not client.collections.exists(base_name):
+                client.alias.create(
+                    alias_name=base_name, target_collection=collection_name
+                )
+                pointer = POINTER_ALIAS
+            else:
+                logger.info(
+                    "Not aliasing %s until the plain collection of that name is "
+                    "garbage-collected, using the config pointer",
+                    base_name,
+                )
+        except Exception as error:
+            # Servers before 1.32 have no alias endpoints
+            logger.warning(
+                "Could not alias %s, falling back to the config pointer: %s",
+                base_name,
+                error,
+            )
+
+    if previous_name is None and pointer == POINTER_CONFIG:
+        # The plain collection keeps serving clients that do not resolve the pointer until
+        # it is garbage-collected
+        if client.collections.exists(base_name):
+            previous_name = base_name
+
+    retired: Dict[str, float] = dict(state.get("retired") or {})
+    if previous_name is not None and previous_name != collection_name:
+        retired[previous_name] = time.time()
+    retired.pop(collection_name, None)
+
+    _save_state(
+        base_name,
+        {"active": collection_name, "pointer": pointer, "retired": retired},
+        state_path,
+    )
+    logger.info("%s now points at %s (%s)", base_name, collection_name, pointer)
+
+    return pointer
+
+
+def retire(
+    base_name: str,
+    collection_names: List[str],
+    state_path: Union[str, os.PathLike] = ACTIVE_COLLECTIONS_PATH,
+) -> List[str]:
+    """
+    Record versions of a collection that were never promoted (e.g. from failed or unverified
+    reindex runs) as retired, so `garbage_collect` deletes them after the grace period.
+
+    Versions already retired keep their retirement time, and the active version is never
+    retired.
+
+    Returns
+    -------
+    List[str]
+        The names newly retired.
+    """
+    state: Dict[str, Any] = _load_state(base_name, state_path)
+    retired: Dict[str, float] = dict(state.get("retired") or {})
+
+    retired_names: List[str] = [
+        name
+        for name in collection_names
+        if name != state.get("active") and name not in retired
+    ]
+    if retired_names:
+        retired.update((name, time.time()) for name in retired_names)
+        _save_state(base_name, {**state, "retired": retired}, state_path)
+
+    return retired_names
+
+
+def garbage_collect(
+    client: WeaviateClient,
+    base_name: str,
+    grace_period_s: float = GRACE_PERIOD_S,
+    state_path: Union[str, os.PathLike] = ACTIVE_COLLECTIONS_PATH,
+    logger: Optional[logging.Logger] = None,
+) -> List[str]:
+    """
+    Delete the retired versions of a collection whose grace period has passed.
+
+    Returns
+    -------
+    List[str]
+        The names of the collections deleted.
+    """
+    logger = logger or logging.getLogger(__name__)
+
+    state: Dict[str, Any] = _load_state(base_name, state_path)
+    retired: Dict[str, float] = dict(state.get("retired") or {})
+
+    deleted_names: List[str] = []
+    for name, retired_at in sorted(retired.items()):
+        if name == state.get("active") or time.time() - retired_at < grace_period_s:
+            continue
+
+        logger.info(
+            "Deleting %s, retired %.1f hours ago",
+            name,
+            (time.time() - retired_at) / 3600,
+        )
+        client.collections.delete(name)
+        del retired[name]
+        deleted_names.append(name)
+
+    if deleted_names:
+        _save_state(base_name, {**state, "retired": retired}, state_path)
+
+    return deleted_names
+
+
+def spot_check_recall(
+    collection: Collection,
+    num_objects: int = SPOT_CHECK_OBJECTS,
+    limit: int = SPOT_CHECK_LIMIT,
+) -> float:
+    """
+    The fraction of a sample of objects that their own vector retrieves in the top `limit`
+    results, to catch a broken or still-indexing index before cutting over to it.
+
+    Objects are sampled in UUID order, which is random with respect to the objects because
+    UUIDs are hashes of their names.
+    """
+    num_checked: int = 0
+    num_found: int = 0
+
+    for data_object in itertools.islice(
+        collection.iterator(include_vector=True), num_objects
+    ):
+        vector: Optional[List[float]] = data_object.vector.get("default")
+        if not vector:
+            continue
+
+        response = collection.query.near_vector(vector, limit=limit)
+        num_checked += 1
+        num_found += any(result.uuid == data_object.uuid for result in response.objects)
+
+    return num_found / num_checked if num_checked else 0.0
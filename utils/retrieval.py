@@ -0,0 +1,71 @@
+"""
+Text-to-object retrieval metrics, for comparing object-embedding recipes and encoders.
+
+Each query (e.g. an object's caption) has exactly one relevant object, at the same index in
+the object embeddings. Objects are ranked by cosine similarity to the query.
+
+`cosine_agreement` compares the embeddings of two encoders (e.g. fp32 and int8) of the same
+inputs.
+"""
+
+from typing import Dict, Sequence
+
+import numpy as np
+
+RECALL_KS = (1, 5, 10)
+
+
+def _normalise(embeddings: np.ndarray) -> np.ndarray:
+    return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+
+def relevant_ranks(
+    query_embeddings: np.ndarray, object_embeddings: np.ndarray
+) -> np.ndarray:
+    """
+    The 1-based rank of each query's relevant object among all objects.
+
+    Parameters
+    ----------
+    query_embeddings : np.ndarray
+        Query embeddings, of shape `(num_queries, dimension)`.
+    object_embeddings : np.ndarray
+        Object embeddings, of shape `(num_queries, dimension)`; object `i` is relevant to
+        query `i`.
+    """
+    similarities: np.ndarray = (
+        _normalise(query_embeddings) @ _normalise(object_embeddings).T
+    )
+    relevant_similarities: np.ndarray = np.diag(similarities)
+
+    # Ties are broken against the relevant object
+    return (similarities >= relevant_similarities[:, None]).sum(axis=1)
+
+
+def retrieval_metrics(
+    query_embeddings: np.ndarray,
+    object_embeddings: np.ndarray,
+    ks: Sequence[int] = RECALL_KS,
+) -> Dict[str, float]:
+    """
+    Recall@k, mean reciprocal rank and median rank of each query's relevant object.
+
+    Returns
+    -------
+    Dict[str, float]
+        The metrics, keyed `recall@<k>`, `mrr` and `median_rank`.
+    """
+    ranks: np.ndarray = relevant_ranks(query_embeddings, object_embeddings)
+
+    metrics: Dict[str, float] = {f"recall@{k}": float(np.mean(ranks <= k)) for k in ks}
+    metrics["mrr"] = float(np.mean(1 / ranks))
+    metrics["median_rank"] = float(np.median(ranks))
+
+    return metrics
+
+
+def cosine_agreement(
+    embeddings: np.ndarray, reference_embeddings: np.ndarray
+) -> np.ndarray:
+    """The cosine similarity of each embedding to the reference embedding at the same index."""
+    return np.sum(_normalise(embeddings) * _normalise(reference_embeddings), axis=1)
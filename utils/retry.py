@@ -0,0 +1,71 @@
+"""
+Retry policy for Weaviate requests: exponential backoff with jitter, under a shared budget.
+
+The budget caps the total number of retries across a whole run, so a flaky node costs a few
+retries while a dead one fails fast instead of multiplying the load on it.
+"""
+
+import random
+import threading
+from dataclasses import dataclass
+
+MAX_ATTEMPTS = 5
+BASE_DELAY_S = 0.5
+MAX_DELAY_S = 30.0
+RETRY_BUDGET = 1000
+
+
+@dataclass
+class RetryPolicy:
+    """
+    How often and how quickly failed requests are retried.
+
+    Parameters
+    ----------
+    max_attempts : int, default MAX_ATTEMPTS
+        Maximum number of attempts per request, including the first.
+    base_delay_s : float, default BASE_DELAY_S
+        Delay before the first retry, doubled for every subsequent retry.
+    max_delay_s : float, default MAX_DELAY_S
+        Upper bound on the delay before any retry.
+    """
+
+    max_attempts: int = MAX_ATTEMPTS
+    base_delay_s: float = BASE_DELAY_S
+    max_delay_s: float = MAX_DELAY_S
+
+    def delay_s(self, attempt: int) -> float:
+        """
+        The delay before retrying after the `attempt`-th failed attempt (counting from 1).
+
+        Uses "full jitter": a uniformly random delay up to the exponential backoff, so clients
+        retrying at the same time spread out rather than hammering the server in lockstep.
+        """
+        backoff_s: float = min(self.max_delay_s, self.base_delay_s * 2 ** (attempt - 1))
+
+        return random.uniform(0, backoff_s)
+
+
+class RetryBudget:
+    """
+    A thread-safe allowance of retries shared by every request in a run.
+
+    Parameters
+    ----------
+    max_retries : int, default RETRY_BUDGET
+        Total number of retries allowed.
+    """
+
+    def __init__(self, max_retries: int = RETRY_BUDGET):
+        self.max_retries = max_retries
+        self.used: int = 0
+        self._lock = threading.Lock()
+
+    def try_acquire(self) -> bool:
+        """Use up one retry, returning `False` if the budget is exhausted."""
+        with self._lock:
+            if self.used >= self.max_retries:
+                return False
+
+            self.used += 1
+            return True
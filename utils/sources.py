@@ -0,0 +1,320 @@
+"""
+Sources of Cap3D objects and their rendered views for the ingest pipeline.
+
+Two layouts are supported:
+
+- `DirectorySource`: an extracted split, with one folder of view images per object.
+- `ZipSource`: one or more original `compressed_imgs_perobj_XX.zip` downloads, read in place.
+  Objects are discovered from each archive's central directory, and view images are read
+  straight from their members with positional reads (`os.pread`), so many workers can read
+  the same archive in parallel without extracting it first.
+
+Both expose object names (the Cap3D dataset UIDs) and, per object, a list of `ViewFile`s that
+can be fingerprinted and read, and the split it belongs to: the archive's file stem (e.g.
+`compressed_imgs_perobj_00`), or for a folder, the name of the split it was extracted from.
+"""
+
+import os
+import re
+import struct
+import threading
+import zipfile
+import zlib
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Iterator, List, Sequence, Union
+
+IMAGE_FILE_EXTENSION = ".png"
+IMAGE_FILE_DELIMETER = "_"
+
+# Cap3D split archives, e.g. `compressed_imgs_perobj_00.zip`
+SPLIT_PATTERN = re.compile(r"compressed_imgs_perobj_(\d+)")
+
+_LOCAL_FILE_HEADER = struct.Struct("<4s2B4HL2L2H")
+_LOCAL_FILE_HEADER_SIGNATURE = b"PK\x03\x04"
+
+
+def is_view_file_name(
+    file_name: str,
+    image_file_extension: str = IMAGE_FILE_EXTENSION,
+    image_file_delimeter: str = IMAGE_FILE_DELIMETER,
+) -> bool:
+    """
+    Whether a file is a rendered view image, rather than an auxiliary render (e.g. a depth or
+    normal map) whose file name contains `image_file_delimeter`.
+    """
+    return (
+        file_name.endswith(image_file_extension)
+        and image_file_delimeter not in file_name
+    )
+
+
+class ViewFile:
+    """A rendered view image of an object, wherever it is stored."""
+
+    name: str
+
+    def read_bytes(self) -> bytes:
+        """Read the contents of the view file."""
+        raise NotImplementedError
+
+    def signature(self) -> str:
+        """A cheap signature of the view file that changes whenever its contents change."""
+        raise NotImplementedError
+
+
+class LocalViewFile(ViewFile):
+    """A view image stored as a file on disk."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.name = path.name
+
+    def __repr__(self) -> str:
+        return f"LocalViewFile({str(self.path)!r})"
+
+    def read_bytes(self) -> bytes:
+        return self.path.read_bytes()
+
+    def signature(self) -> str:
+        view_stat: os.stat_result = self.path.stat()
+
+        return f"{self.name}:{view_stat.st_size}:{view_stat.st_mtime_ns}"
+
+
+class ZipViewFile(ViewFile):
+    """A view image stored as a member of a zip archive."""
+
+    def __init__(self, archive: "ZipArchive", info: zipfile.ZipInfo):
+        self.archive = archive
+        self.info = info
+        self.name = info.filename.rsplit("/", 1)[-1]
+
+    def __repr__(self) -> str:
+        return f"ZipViewFile({str(self.archive.path)!r}, {self.info.filename!r})"
+
+    def read_bytes(self) -> bytes:
+        return self.archive.read_member(self.info)
+
+    def signature(self) -> str:
+        return f"{self.name}:{self.info.file_size}:{self.info.CRC:08x}"
+
+
+class ObjectSource:
+    """A collection of Cap3D objects, each with a list of rendered views."""
+
+    def object_names(self) -> Iterator[str]:
+        """Yield the name of every object in the source."""
+        raise NotImplementedError
+
+    def list_views(self, name: str) -> List[ViewFile]:
+        """List the rendered views of an object, sorted by file name."""
+        raise NotImplementedError
+
+    def splits(self) -> List[str]:
+        """The names of the Cap3D splits in the source."""
+        raise NotImplementedError
+
+    def split(self, name: str) -> str:
+        """
+        The name of the split an object belongs to.
+
+        Raises
+        ------
+        KeyError
+            If the object is not in the source (only checked by sources that index their
+            objects, like `ZipSource`).
+        """
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """Release any files held open by the source."""
+
+    def __enter__(self) -> "ObjectSource":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+class DirectorySource(ObjectSource):
+    """
+    Objects stored as one folder of view images each, under a common root folder.
+
+    Parameters
+    ----------
+    root : Union[str, os.PathLike]
+        The folder containing the object folders.
+    """
+
+    def __init__(self, root: Union[str, os.PathLike]):
+        self.root = Path(root)
+
+        # Extracted splits keep their archive's name somewhere above the object folders, e.g.
+        # `compressed_imgs_perobj_00.zip/Cap3D_Objaverse_renderimgs`
+        self._split: str = next(
+            (
+                folder.name.removesuffix(".zip")
+                for folder in [self.root.resolve(), *self.root.resolve().parents]
+                if SPLIT_PATTERN.fullmatch(folder.name.removesuffix(".zip"))
+            ),
+            self.root.name,
+        )
+
+    def object_names(self) -> Iterator[str]:
+        for object_folder in self.root.iterdir():
+            if object_folder.is_dir():
+                yield object_folder.name
+
+    def list_views(self, name: str) -> List[ViewFile]:
+        return [
+            LocalViewFile(file)
+            for file in sorted((self.root / name).iterdir(), key=lambda file: file.name)
+            if is_view_file_name(file.name)
+        ]
+
+    def splits(self) -> List[str]:
+        return [self._split]
+
+    def split(self, name: str) -> str:
+        return self._split
+
+
+class ZipArchive:
+    """
+    A zip archive whose members can be read concurrently from many threads.
+
+    Rather than going through `zipfile.ZipFile`, which serialises reads on a shared file
+    object, members are read with `os.pread` at the offsets recorded in the central directory.
+    """
+
+    def __init__(self, path: Union[str, os.PathLike]):
+        self.path = Path(path)
+
+        self._zip_file: zipfile.ZipFile = zipfile.ZipFile(self.path)
+        self._zip_file_lock = threading.Lock()
+        self.infos: List[zipfile.ZipInfo] = self._zip_file.infolist()
+
+        self._fd: int = os.open(self.path, os.O_RDONLY)
+
+    def read_member(self, info: zipfile.ZipInfo) -> bytes:
+        """
+        Read and decompress a member of the archive.
+
+        Raises
+        ------
+        zipfile.BadZipFile
+            If the member's local header is corrupt or its CRC does not match.
+        """
+        if info.compress_type not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+            # Other compression methods are rare, so fall back to the serialised reader
+            with self._zip_file_lock:
+                return self._zip_file.read(info)
+
+        local_header: bytes = os.pread(
+            self._fd, _LOCAL_FILE_HEADER.size, info.header_offset
+        )
+        header_fields = _LOCAL_FILE_HEADER.unpack(local_header)
+        if header_fields[0] != _LOCAL_FILE_HEADER_SIGNATURE:
+            raise zipfile.BadZipFile(f"Bad local file header for '{info.filename}'")
+
+        file_name_length, extra_field_length = header_fields[-2:]
+        data_offset: int = (
+            info.header_offset
+            + _LOCAL_FILE_HEADER.size
+            + file_name_length
+            + extra_field_length
+        )
+        data: bytes = os.pread(self._fd, info.compress_size, data_offset)
+
+        if info.compress_type == zipfile.ZIP_DEFLATED:
+            data = zlib.decompress(data, -zlib.MAX_WBITS)
+
+        if zlib.crc32(data) != info.CRC:
+            raise zipfile.BadZipFile(f"Bad CRC-32 for '{info.filename}'")
+
+        return data
+
+    def close(self) -> None:
+        """Close the archive's file handles."""
+        os.close(self._fd)
+        self._zip_file.close()
+
+
+class ZipSource(ObjectSource):
+    """
+    Objects stored in one or more zip archives, as `<...>/<object name>/<view file>` members.
+
+    Parameters
+    ----------
+    archive_paths : Sequence[Union[str, os.PathLike]]
+        Paths to the zip archives, e.g. the `compressed_imgs_perobj_XX.zip` downloads.
+    """
+
+    def __init__(self, archive_paths: Sequence[Union[str, os.PathLike]]):
+        self.archives: List[ZipArchive] = [
+            ZipArchive(archive_path) for archive_path in archive_paths
+        ]
+
+        # Objects in central directory order, which is the order members are laid out on disk
+        self._views: Dict[str, List[ViewFile]] = OrderedDict()
+        self._splits: Dict[str, str] = {}
+        for archive in self.archives:
+            for info in archive.infos:
+                path_parts: List[str] = info.filename.rstrip("/").split("/")
+                if info.is_dir() or len(path_parts) < 2:
+                    continue
+
+                if is_view_file_name(path_parts[-1]):
+                    self._views.setdefault(path_parts[-2], []).append(
+                        ZipViewFile(archive, info)
+                    )
+                    self._splits.setdefault(path_parts[-2], archive.path.stem)
+
+        for views in self._views.values():
+            views.sort(key=lambda view: view.name)
+
+    def object_names(self) -> Iterator[str]:
+        yield from self._views
+
+    def list_views(self, name: str) -> List[ViewFile]:
+        return list(self._views.get(name, []))
+
+    def splits(self) -> List[str]:
+        return [archive.path.stem for archive in self.archives]
+
+    def split(self, name: str) -> str:
+        try:
+            return self._splits[name]
+        except KeyError:
+            raise KeyError(
+                f"Object {name!r} is not in any of the archives "
+                f"{', '.join(str(archive.path) for archive in self.archives)}"
+            ) from None
+
+    def close(self) -> None:
+        for archive in self.archives:
+            archive.close()
+
+
+def open_source(paths: Sequence[Union[str, os.PathLike]]) -> ObjectSource:
+    """
+    Open the object source at `paths`: either a single folder of object folders, or one or
+    more zip archives.
+
+    Raises
+    ------
+    ValueError
+        If `paths` is neither a single folder nor a list of zip archives.
+    """
+    paths = [Path(path) for path in paths]
+
+    if len(paths) == 1 and paths[0].is_dir():
+        return DirectorySource(paths[0])
+
+    if paths and all(path.is_file() and zipfile.is_zipfile(path) for path in paths):
+        return ZipSource(paths)
+
+    raise ValueError(
+        f"Expected a single folder or one or more zip archives, got: {list(map(str, paths))}"
+    )
@@ -0,0 +1,216 @@
+"""
+Multi-tenant Cap3D collections, with one tenant per Cap3D split.
+
+Each split (`compressed_imgs_perobj_00.zip`, `_01`, ...) is ingested into its own tenant of
+the collection (see `create_collection(multi_tenancy=True)`). A tenant is its own shard, with
+its own vector index, so:
+
+- splits are written in parallel, without contending for a single HNSW graph;
+- a rarely queried split can be deactivated (unloaded from memory, kept on disk) or offloaded
+  (moved to cloud storage by the server's `offload-s3` module), and reactivated on demand, so
+  the memory in use grows with the splits kept active rather than with the whole corpus.
+
+Queries name a tenant, so searching the corpus means fanning a query out over the active
+tenants and merging their results by distance, which `near_vector_over_tenants` does.
+
+Example:
+    ```python
+    collection = client.collections.get("Cap3DMM")
+    set_tenant_activity(collection, ["split_07"], "inactive")
+    results = near_vector_over_tenants(collection, query_vector, limit=10)
+    ```
+"""
+
+import heapq
+import logging
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from weaviate.classes.query import MetadataQuery
+from weaviate.classes.tenants import Tenant, TenantActivityStatus
+from weaviate.collections import Collection
+
+from utils.sources import SPLIT_PATTERN, ObjectSource
+
+# Activity statuses a tenant can be set to: "active" tenants are loaded and queryable,
+# "inactive" ones are unloaded but kept on local disk, and "offloaded" ones are moved to cloud
+# storage
+TENANT_ACTIVITIES = {
+    "active": TenantActivityStatus.ACTIVE,
+    "inactive": TenantActivityStatus.INACTIVE,
+    "offloaded": TenantActivityStatus.OFFLOADED,
+}
+
+# Concurrent per-tenant queries of a fanned-out query
+QUERY_WORKERS = 8
+
+
+def split_tenant_name(split: str) -> str:
+    """
+    The tenant of a split: `split_00` for `compressed_imgs_perobj_00`, or the split's name with
+    any characters tenant names do not allow replaced, for other archives and folders.
+    """
+    match = SPLIT_PATTERN.fullmatch(split)
+    if match:
+        return f"split_{match.group(1)}"
+
+    return re.sub(r"[^A-Za-z0-9_-]", "_", split)
+
+
+def object_tenant_name(source: ObjectSource, name: str) -> str:
+    """The tenant of an object: the tenant of its split in `source`."""
+    return split_tenant_name(source.split(name))
+
+
+def tenant_activities(collection: Collection) -> Dict[str, str]:
+    """
+    The activity status of every tenant of a collection, keyed by tenant name, e.g. "active",
+    "inactive", "offloaded" (or "onloading" and "offloading" while they change).
+    """
+    return {
+        name: tenant.activity_status.value.lower()
+        for name, tenant in collection.tenants.get().items()
+    }
+
+
+def active_tenants(collection: Collection) -> List[str]:
+    """The names of the tenants of a collection that can be queried."""
+    return sorted(
+        name
+        for name, activity in tenant_activities(collection).items()
+        if activity == "active"
+    )
+
+
+def ensure_tenants(
+    collection: Collection,
+    tenant_names: Iterable[str],
+    logger: Optional[logging.Logger] = None,
+) -> None:
+    """
+    Create the tenants of a collection that do not exist yet, and reactivate any that were
+    deactivated or offloaded, so that objects can be inserted into all of them.
+    """
+    logger = logger or logging.getLogger(__name__)
+
+    activities: Dict[str, str] = tenant_activities(collection)
+    tenant_names = sorted(set(tenant_names))
+
+    new_names: List[str] = [name for name in tenant_names if name not in activities]
+    if new_names:
+        logger.info("Creating tenants %s", ", ".join(new_names))
+        collection.tenants.create(
+            [
+                Tenant(name=name, activity_status=TenantActivityStatus.ACTIVE)
+                for name in new_names
+            ]
+        )
+
+    inactive_names: List[str] = [
+        name
+        for name in tenant_names
+        if name in activities and activities[name] != "active"
+    ]
+    if inactive_names:
+        logger.info("Reactivating tenants %s", ", ".join(inactive_names))
+        set_tenant_activity(collection, inactive_names, "active")
+
+
+def set_tenant_activity(
+    collection: Collection, tenant_names: Sequence[str], activity: str
+) -> None:
+    """
+    Set the activity status of tenants of a collection: "active", "inactive" or "offloaded".
+
+    Offloading needs the server's `offload-s3` module; reactivating an offloaded tenant loads it
+    back from cloud storage, which completes in the background (its status is "onloading"
+    until then).
+
+    Raises
+    ------
+    ValueError
+        If `activity` is unknown, or a tenant does not exist.
+    """
+    if activity not in TENANT_ACTIVITIES:
+        raise ValueError(
+            f"Unknown tenant activity {activity!r}, "
+            f"expected one of {sorted(TENANT_ACTIVITIES)}"
+        )
+
+    unknown_names: List[str] = sorted(
+        set(tenant_names) - set(tenant_activities(collection))
+    )
+    if unknown_names:
+        raise ValueError(
+            f"No tenants {', '.join(unknown_names)} in collection {collection.name}"
+        )
+
+    collection.tenants.update(
+        [
+            Tenant(name=name, activity_status=TENANT_ACTIVITIES[activity])
+            for name in tenant_names
+        ]
+    )
+
+
+def near_vector_over_tenants(
+    collection: Collection,
+    query_vector: Sequence[float],
+    limit: int,
+    tenant_names: Optional[Sequence[str]] = None,
+    max_workers: int = QUERY_WORKERS,
+    **query_kwargs: Any,
+) -> List[Any]:
+    """
+    Query tenants of a multi-tenant collection concurrently and merge their results.
+
+    Each tenant returns its own `limit` nearest objects, so the `limit` nearest of all of them
+    are the `limit` nearest in the union of the tenants.
+
+    Parameters
+    ----------
+    collection : Collection
+        The multi-tenant collection.
+    query_vector : Sequence[float]
+        The query vector.
+    limit : int
+        Number of objects to return.
+    tenant_names : Optional[Sequence[str]]
+        Tenants to query. By default, every active tenant.
+    max_workers : int, default QUERY_WORKERS
+        Maximum number of tenants queried at once.
+    **query_kwargs
+        Passed on to every tenant's `query.near_vector`, e.g. `filters`.
+
+    Returns
+    -------
+    List[Any]
+        The result objects, nearest first, with their `metadata.distance`.
+    """
+    if tenant_names is None:
+        tenant_names = active_tenants(collection)
+    if not tenant_names:
+        return []
+
+    def query_tenant(tenant_name: str) -> List[Any]:
+        return (
+            collection.with_tenant(tenant_name)
+            .query.near_vector(
+                query_vector,
+                limit=limit,
+                return_metadata=MetadataQuery(distance=True),
+                **query_kwargs,
+            )
+            .objects
+        )
+
+    with ThreadPoolExecutor(
+        max_workers=min(max_workers, len(tenant_names)), thread_name_prefix="tenant"
+    ) as executor:
+        tenant_results: List[List[Any]] = list(executor.map(query_tenant, tenant_names))
+
+    # Each tenant's results are already sorted by distance
+    return list(
+        heapq.merge(*tenant_results, key=lambda result: result.metadata.distance)
+    )[:limit]
@@ -0,0 +1,198 @@
+"""
+Cheap pre-encode filtering of an object's rendered views.
+
+Not every view is worth a CLIP forward pass: some renders are nearly empty (the object is tiny
+or out of frame), and views from symmetric angles often look almost the same. `ViewFilter`
+drops such views using features computed with NumPy on the decoded uint8 RGBA images:
+
+- foreground coverage: the fraction of pixels whose alpha exceeds `ALPHA_THRESHOLD`. Views
+  below `min_coverage` are blank.
+- difference hash: the view is composited onto the background colour, converted to luminance
+  and area-downscaled to `(hash_size, hash_size + 1)`; each bit records whether a pixel is
+  brighter than its right-hand neighbour. Views within `max_hash_distance` bits of an
+  already-kept view of the same object are near-duplicates.
+
+Dropping a view changes the object's mean-pooled embedding; `embedding_shift` measures by how
+much, given the embeddings of every view.
+"""
+
+from dataclasses import dataclass
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+from utils.metrics import MetricsRegistry
+from utils.preprocessing import BACKGROUND_COLOUR
+
+ALPHA_THRESHOLD = 8
+MIN_FOREGROUND_COVERAGE = 0.005
+HASH_SIZE = 8
+MAX_HASH_DISTANCE = 4
+
+# ITU-R BT.601 luma weights
+_LUMA_WEIGHTS = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+
+def foreground_coverage(
+    image: np.ndarray, alpha_threshold: int = ALPHA_THRESHOLD
+) -> float:
+    """The fraction of an RGBA image's pixels that belong to the rendered object."""
+    return float(np.count_nonzero(image[..., 3] > alpha_threshold)) / (
+        image.shape[0] * image.shape[1]
+    )
+
+
+def _area_downscale(image: np.ndarray, height: int, width: int) -> np.ndarray:
+    # Sum the pixels of each (roughly equal) block, then divide by the block areas
+    row_starts: np.ndarray = np.linspace(0, image.shape[0], height + 1).astype(int)[:-1]
+    column_starts: np.ndarray = np.linspace(0, image.shape[1], width + 1).astype(int)[
+        :-1
+    ]
+
+    block_sums: np.ndarray = np.add.reduceat(
+        np.add.reduceat(image, row_starts, axis=0), column_starts, axis=1
+    )
+    block_areas: np.ndarray = np.outer(
+        np.diff(np.append(row_starts, image.shape[0])),
+        np.diff(np.append(column_starts, image.shape[1])),
+    )
+
+    return block_sums / block_areas
+
+
+def difference_hash(image: np.ndarray, hash_size: int = HASH_SIZE) -> int:
+    """
+    The difference hash of an RGBA image, as a `hash_size ** 2`-bit integer.
+
+    The image is composited onto `BACKGROUND_COLOUR` first, as CLIP sees it.
+    """
+    alpha: np.ndarray = image[..., 3:].astype(np.float32) / 255
+    composited: np.ndarray = image[..., :3] * alpha + np.asarray(
+        BACKGROUND_COLOUR, dtype=np.float32
+    ) * (1 - alpha)
+    luminance: np.ndarray = composited @ _LUMA_WEIGHTS
+
+    thumbnail: np.ndarray = _area_downscale(luminance, hash_size, hash_size + 1)
+    bits: np.ndarray = (thumbnail[:, 1:] > thumbnail[:, :-1]).ravel()
+
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def hamming_distance(hash_a: int, hash_b: int) -> int:
+    """The number of bits that differ between two hashes."""
+    return bin(hash_a ^ hash_b).count("1")
+
+
+@dataclass
+class ViewSelection:
+    """
+    The views of an object kept by `ViewFilter.select`.
+
+    Parameters
+    ----------
+    kept_idxs : List[int]
+        Indices of the views to encode, in their original order.
+    num_blank : int
+        Number of views dropped for having too little foreground.
+    num_duplicate : int
+        Number of views dropped as near-duplicates of a kept view.
+    """
+
+    kept_idxs: List[int]
+    num_blank: int = 0
+    num_duplicate: int = 0
+
+    @property
+    def num_dropped(self) -> int:
+        return self.num_blank + self.num_duplicate
+
+
+class ViewFilter:
+    """
+    Selects the views of an object worth encoding, dropping blank views and collapsing
+    near-duplicates.
+
+    At least one view is always kept: if every view is blank, the one with the most foreground
+    is kept.
+
+    Parameters
+    ----------
+    min_coverage : float, default MIN_FOREGROUND_COVERAGE
+        Minimum fraction of foreground pixels for a view not to be blank.
+    max_hash_distance : int, default MAX_HASH_DISTANCE
+        Maximum Hamming distance between the difference hashes of near-duplicate views. A
+        negative value disables duplicate detection.
+    hash_size : int, default HASH_SIZE
+        Side length of the difference hash, which has `hash_size ** 2` bits.
+    metrics : Optional[MetricsRegistry]
+        Registry to count dropped views on.
+    """
+
+    def __init__(
+        self,
+        min_coverage: float = MIN_FOREGROUND_COVERAGE,
+        max_hash_distance: int = MAX_HASH_DISTANCE,
+        hash_size: int = HASH_SIZE,
+        metrics: Optional[MetricsRegistry] = None,
+    ):
+        self.min_coverage = min_coverage
+        self.max_hash_distance = max_hash_distance
+        self.hash_size = hash_size
+
+        metrics = metrics or MetricsRegistry()
+        self.views_filtered = metrics.counter(
+            "ingest_views_filtered",
+            "Views dropped before encoding, saving a CLIP inference each",
+            ["reason"],
+        )
+
+    def select(self, images: Sequence[np.ndarray]) -> ViewSelection:
+        """Choose which of an object's decoded RGBA views to encode."""
+        coverages: List[float] = [foreground_coverage(image) for image in images]
+        foreground_idxs: List[int] = [
+            view_idx
+            for view_idx, coverage in enumerate(coverages)
+            if coverage >= self.min_coverage
+        ]
+        if not foreground_idxs and images:
+            foreground_idxs = [int(np.argmax(coverages))]
+
+        kept_idxs: List[int] = []
+        kept_hashes: List[int] = []
+        for view_idx in foreground_idxs:
+            if self.max_hash_distance >= 0:
+                view_hash: int = difference_hash(images[view_idx], self.hash_size)
+                if any(
+                    hamming_distance(view_hash, kept_hash) <= self.max_hash_distance
+                    for kept_hash in kept_hashes
+                ):
+                    continue
+
+                kept_hashes.append(view_hash)
+
+            kept_idxs.append(view_idx)
+
+        selection = ViewSelection(
+            kept_idxs=kept_idxs,
+            num_blank=len(images) - len(foreground_idxs),
+            num_duplicate=len(foreground_idxs) - len(kept_idxs),
+        )
+        self.views_filtered.inc(selection.num_blank, reason="blank")
+        self.views_filtered.inc(selection.num_duplicate, reason="duplicate")
+
+        return selection
+
+
+def embedding_shift(embeddings: np.ndarray, kept_idxs: Sequence[int]) -> float:
+    """
+    Cosine distance between an object's mean-pooled embedding over every view and over the
+    kept views only.
+    """
+    pooled: np.ndarray = embeddings.mean(axis=0)
+    filtered_pooled: np.ndarray = embeddings[list(kept_idxs)].mean(axis=0)
+
+    return 1.0 - float(
+        pooled
+        @ filtered_pooled
+        / (np.linalg.norm(pooled) * np.linalg.norm(filtered_pooled))
+    )
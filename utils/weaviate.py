@@ -1,15 +1,304 @@
-from typing import List, Optional
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Union
 
 import weaviate
 import weaviate.classes as wvc
 import weaviate.classes.config as wc
 from weaviate import WeaviateClient
 
+from utils.config import load_config
+
+# Vector distances of the object vectors. "dot" is only equivalent to "cosine" for vectors
+# normalised to unit length, as `utils.ingest.pool_embeddings` produces; it skips normalising
+# both vectors at every distance computation.
+DISTANCE_METRICS = {
+    "cosine": wc.VectorDistances.COSINE,
+    "dot": wc.VectorDistances.DOT,
+}
+DISTANCE_METRIC = "cosine"
+
+# Compression profiles of the object vectors held in memory by the HNSW index ("none" keeps
+# float32 vectors, 2 KiB per 512-dimension vector)
+COMPRESSION_PROFILES = ["none", "pq", "bq"]
+COMPRESSION = "none"
+
+# Product quantization: each vector is split into `segments` sub-vectors, each stored as the
+# index of its nearest of `centroids` centroids (one byte for up to 256 centroids). The
+# centroids are trained once `training_limit` objects have been inserted; until then vectors
+# stay uncompressed.
+PQ_SEGMENTS = 128
+PQ_CENTROIDS = 256
+PQ_TRAINING_LIMIT = 100_000
+
+# Binary quantization: one bit per dimension. The `rescore_limit` nearest candidates by
+# compressed distance are re-ranked with the uncompressed vectors, kept on disk.
+BQ_RESCORE_LIMIT = 200
+
+# Named vector index profiles: the index type and its tuning options
+INDEX_PROFILES_PATH = Path("configs") / "index_profiles.yml"
+INDEX_PROFILE_OPTIONS = {
+    "hnsw": {
+        "cleanup_interval_seconds",
+        "dynamic_ef_factor",
+        "dynamic_ef_max",
+        "dynamic_ef_min",
+        "ef",
+        "ef_construction",
+        "flat_search_cutoff",
+        "max_connections",
+        "vector_cache_max_objects",
+    },
+    "flat": {"vector_cache_max_objects"},
+}
+
+# Weaviate's defaults of the index options, and which options can be changed once a collection
+# exists (the rest shape the HNSW graph as it is built)
+INDEX_DEFAULTS = {
+    "hnsw": {
+        "dynamic_ef_factor": 8,
+        "dynamic_ef_max": 500,
+        "dynamic_ef_min": 100,
+        "ef": -1,
+        "ef_construction": 128,
+        "flat_search_cutoff": 40000,
+        "max_connections": 32,
+        "vector_cache_max_objects": 1_000_000_000_000,
+    },
+    "flat": {"vector_cache_max_objects": 1_000_000_000_000},
+}
+MUTABLE_INDEX_OPTIONS = {
+    "hnsw": {
+        "dynamic_ef_factor",
+        "dynamic_ef_max",
+        "dynamic_ef_min",
+        "ef",
+        "flat_search_cutoff",
+        "vector_cache_max_objects",
+    },
+    "flat": {"vector_cache_max_objects"},
+}
+
+# Index profile a bulk load builds the collection with, before switching to production settings
+BULK_LOAD_PROFILE = "bulk-load"
+
+INDEXING_TIMEOUT_S = 3600.0
+INDEXING_POLL_INTERVAL_S = 1.0
+
+
+def new_quantizer(
+    compression: str = COMPRESSION,
+    pq_segments: int = PQ_SEGMENTS,
+    pq_centroids: int = PQ_CENTROIDS,
+    pq_training_limit: int = PQ_TRAINING_LIMIT,
+    bq_rescore_limit: int = BQ_RESCORE_LIMIT,
+) -> Optional[Any]:
+    """
+    The HNSW quantizer configuration of a compression profile.
+
+    Parameters
+    ----------
+    compression : str, default COMPRESSION
+        One of `COMPRESSION_PROFILES`: "none", "pq" (product quantization) or "bq" (binary
+        quantization).
+    pq_segments, pq_centroids, pq_training_limit : int
+        Segments per vector, centroids per segment and objects to train on, for "pq".
+    bq_rescore_limit : int, default BQ_RESCORE_LIMIT
+        Candidates re-ranked with uncompressed vectors, for "bq".
+
+    Returns
+    -------
+    Optional[Any]
+        A `Configure.VectorIndex.Quantizer` configuration, or `None` for "none".
+
+    Raises
+    ------
+    ValueError
+        If `compression` is unknown.
+    """
+    if compression == "none":
+        return None
+    if compression == "pq":
+        return wc.Configure.VectorIndex.Quantizer.pq(
+            segments=pq_segments,
+            centroids=pq_centroids,
+            training_limit=pq_training_limit,
+        )
+    if compression == "bq":
+        return wc.Configure.VectorIndex.Quantizer.bq(rescore_limit=bq_rescore_limit)
+
+    raise ValueError(
+        f"Unknown compression profile {compression!r}, "
+        f"expected one of {COMPRESSION_PROFILES}"
+    )
+
+
+def load_index_profile(
+    name: str, path: Union[str, os.PathLike] = INDEX_PROFILES_PATH
+) -> Dict[str, Any]:
+    """
+    Load a named vector index profile from a YAML file of profiles.
+
+    Returns
+    -------
+    Dict[str, Any]
+        The profile: its index `type` ("hnsw" or "flat"), and the keyword arguments of
+        `Configure.VectorIndex.hnsw` or `Configure.VectorIndex.flat`.
+
+    Raises
+    ------
+    ValueError
+        If the profile does not exist, or has an unknown type or options.
+    """
+    profiles: Dict[str, Any] = load_config(path)
+    if name not in profiles:
+        raise ValueError(
+            f"Unknown index profile {name!r}, expected one of {sorted(profiles)} (in {path})"
+        )
+
+    profile: Dict[str, Any] = dict(profiles[name] or {})
+    index_type: str = profile.setdefault("type", "hnsw")
+    if index_type not in INDEX_PROFILE_OPTIONS:
+        raise ValueError(
+            f"Unknown index type {index_type!r} of index profile {name!r}, "
+            f"expected one of {sorted(INDEX_PROFILE_OPTIONS)}"
+        )
+
+    unknown_options: Set[str] = (
+        set(profile) - {"type"} - INDEX_PROFILE_OPTIONS[index_type]
+    )
+    if unknown_options:
+        raise ValueError(
+            f"Unknown options of {index_type} index profile {name!r}: "
+            f"{sorted(unknown_options)}"
+        )
+
+    return profile
+
+
+def new_vector_index_config(
+    index_profile: Optional[Dict[str, Any]] = None,
+    distance_metric: str = DISTANCE_METRIC,
+    quantizer: Optional[Any] = None,
+) -> Any:
+    """
+    The vector index configuration of an index profile (see `load_index_profile`), with a
+    distance metric and compression. Without a profile, an HNSW index with Weaviate's
+    default settings.
+    """
+    options: Dict[str, Any] = dict(index_profile or {"type": "hnsw"})
+    index_type: str = options.pop("type")
+
+    configure = (
+        wc.Configure.VectorIndex.flat
+        if index_type == "flat"
+        else wc.Configure.VectorIndex.hnsw
+    )
+
+    return configure(
+        distance_metric=DISTANCE_METRICS[distance_metric],
+        quantizer=quantizer,
+        **options,
+    )
+
+
+def index_settings(index_profile: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Every setting of an index profile (see `load_index_profile`), including its type and the
+    Weaviate defaults of the options it leaves out.
+    """
+    index_type: str = (index_profile or {}).get("type", "hnsw")
+
+    return {"type": index_type, **INDEX_DEFAULTS[index_type], **(index_profile or {})}
+
+
+def update_mutable_index_settings(
+    collection: weaviate.collections.Collection,
+    index_profile: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """
+    Reconfigure the mutable index settings of an existing collection to those of an index
+    profile, or to Weaviate's defaults without one.
+
+    Returns
+    -------
+    Dict[str, Any]
+        The settings applied.
+    """
+    settings: Dict[str, Any] = index_settings(index_profile)
+    index_type: str = settings.pop("type")
+
+    mutable_settings: Dict[str, Any] = {
+        option: value
+        for option, value in settings.items()
+        if option in MUTABLE_INDEX_OPTIONS[index_type]
+    }
+    reconfigure = (
+        wc.Reconfigure.VectorIndex.flat
+        if index_type == "flat"
+        else wc.Reconfigure.VectorIndex.hnsw
+    )
+    collection.config.update(vector_index_config=reconfigure(**mutable_settings))
+
+    return mutable_settings
+
+
+def wait_for_indexing(
+    client: WeaviateClient,
+    collection_name: str,
+    compressed: bool = False,
+    timeout_s: float = INDEXING_TIMEOUT_S,
+    poll_interval_s: float = INDEXING_POLL_INTERVAL_S,
+) -> float:
+    """
+    Wait until every shard of a collection has indexed its queued vectors (with asynchronous
+    indexing, inserts return before their vectors are indexed) and, if `compressed`,
+    compressed them.
+
+    Returns
+    -------
+    float
+        The seconds waited.
+
+    Raises
+    ------
+    TimeoutError
+        If indexing does not finish within `timeout_s`.
+    """
+    start_time_s: float = time.perf_counter()
+
+    while time.perf_counter() - start_time_s < timeout_s:
+        shards: List[Any] = [
+            shard
+            for node in client.cluster.nodes(collection_name, output="verbose")
+            for shard in node.shards or []
+        ]
+        if shards and all(
+            shard.vector_indexing_status == "READY"
+            and shard.vector_queue_length == 0
+            and (shard.compressed or not compressed)
+            for shard in shards
+        ):
+            return time.perf_counter() - start_time_s
+
+        time.sleep(poll_interval_s)
+
+    raise TimeoutError(
+        f"{collection_name} was not indexed{' and compressed' if compressed else ''} "
+        f"within {timeout_s:.0f}s"
+    )
+
 
 def create_collection(
     client: WeaviateClient,
     collection_name: str,
     configure_upload_collection: Optional[bool] = False,
+    distance_metric: str = DISTANCE_METRIC,
+    quantizer: Optional[Any] = None,
+    index_profile: Optional[str] = None,
+    index_profiles_path: Union[str, os.PathLike] = INDEX_PROFILES_PATH,
+    multi_tenancy: bool = False,
 ) -> weaviate.collections.Collection:
     """
     Creates a collection in a Weaviate vector database with a given configuration.
@@ -29,6 +318,21 @@ def create_collection(
         If `True`, creates a collection for data upload with Multi2Vec-CLIP configurations.
         If `False`, creates a vector-only collection with HNSW (Hierarchical Navigable Small World)
         index configuration.
+    distance_metric : str, default DISTANCE_METRIC
+        Distance of the vector-only collection's HNSW index, a key of `DISTANCE_METRICS`:
+        "cosine", or "dot" for collections of unit-length vectors.
+    quantizer : Optional[Any]
+        Compression of the vector-only collection's vectors, as returned by `new_quantizer`.
+        Uncompressed by default. A flat index only supports binary quantization.
+    index_profile : Optional[str]
+        Name of the vector-only collection's index profile in `index_profiles_path`, e.g.
+        "low-latency" or "small-flat". By default, an HNSW index with Weaviate's defaults.
+    index_profiles_path : Union[str, os.PathLike], default INDEX_PROFILES_PATH
+        YAML file of named index profiles.
+    multi_tenancy : bool, default False
+        If `True`, the vector-only collection is multi-tenant, with one shard and vector index
+        per tenant (see `utils.tenants`). Tenants are created explicitly, and are only
+        reactivated explicitly once deactivated or offloaded.
 
     Returns
     -------
@@ -37,6 +341,8 @@ def create_collection(
 
     Raises
     ------
+    ValueError
+        If `distance_metric` or `index_profile` is unknown.
     weaviate.exceptions.WeaviateBaseError
         If there's an error during collection creation or configuration.
 
@@ -44,11 +350,18 @@ def create_collection(
     -----
     - The `collection_name` parameter specifies the name of the new Weaviate collection.
     - When `configure_upload_collection` is `False`, the collection includes text-based properties
-      like 'description' and 'datasetUID', with HNSW for vector indexing using COSINE distance metric.
+      like 'description' and 'datasetUID', with HNSW (or the `index_profile`'s index) for vector
+      indexing using the `distance_metric` (COSINE by default).
     - When `configure_upload_collection` is `True`, the collection is designed for Multi2Vec-CLIP,
       including image-based property 'image' and text-based properties, with specific vectorizer
       configurations for image and text.
     """
+    if distance_metric not in DISTANCE_METRICS:
+        raise ValueError(
+            f"Unknown distance metric {distance_metric!r}, "
+            f"expected one of {sorted(DISTANCE_METRICS)}"
+        )
+
     cap3d_properties: List[weaviate.classes.config.Property] = [
         wc.Property(
             name="description",
@@ -94,8 +407,14 @@ def create_collection(
     )
 
     vector_index_config: weaviate.classes.config.Configure.VectorIndex = (
-        wvc.config.Configure.VectorIndex.hnsw(
-            distance_metric=wvc.config.VectorDistances.COSINE  # select prefered distance metric
+        new_vector_index_config(
+            (
+                load_index_profile(index_profile, index_profiles_path)
+                if index_profile is not None
+                else None
+            ),
+            distance_metric=distance_metric,
+            quantizer=quantizer,
         )
     )
 
@@ -106,6 +425,15 @@ def create_collection(
             properties=cap3d_properties,
             vectorizer_config=cap3d_vectorizer_config,
             vector_index_config=vector_index_config,
+            multi_tenancy_config=(
+                wc.Configure.multi_tenancy(
+                    enabled=True,
+                    auto_tenant_creation=False,
+                    auto_tenant_activation=False,
+                )
+                if multi_tenancy
+                else None
+            ),
         )
         if not configure_upload_collection
         else client.collections.create(